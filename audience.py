@@ -0,0 +1,325 @@
+"""
+Sketch-based audience overlap between channels.
+
+Every VOD's chatters are summarised by two fixed-size sketches built from the chat store's
+interned usernames: a HyperLogLog (distinct chatter count) and a MinHash signature (Jaccard
+similarity). Sketches merge losslessly, by element-wise max and min respectively, so
+channel sketches are folded together from their VODs and updated incrementally as new VODs
+land: the index remembers which VODs it already contains. Banded LSH over the channel
+MinHash signatures finds the channels whose audience overlaps a given channel.
+
+Usage:
+    python audience.py update [--transcripts-folder PATH] [--workers N]
+    python audience.py query CHANNEL [--min-overlap 0.2]
+    python audience.py pairs [--min-overlap 0.2]
+"""
+import argparse
+import hashlib
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from chat_store import DEFAULT_TRANSCRIPTS_FOLDER, iter_vod_folders, open_vod_chat_store
+
+AUDIENCE_SUFFIX = "_audience.npz"
+AUDIENCE_INDEX_FILENAME = ".audience_index.npz"
+
+HLL_PRECISION = 14  # 2^14 one-byte registers per sketch, about 0.8% standard error
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 32  # 32 bands of 4 rows: channels above roughly 0.42 Jaccard share a bucket
+LSH_MIN_RECALL = 0.99  # Queries only trust the LSH candidates where they miss at most 1% of the matching channels
+MINHASH_CHUNK_SIZE = 8192  # Usernames hashed per chunk, bounding the (chunk x permutations) matrix
+
+# Fixed seeds so sketches built by different processes and runs are comparable
+_permutation_rng = np.random.default_rng(0x5EED)
+MINHASH_MULTIPLIERS = _permutation_rng.integers(1, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+MINHASH_OFFSETS = _permutation_rng.integers(0, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def hash_usernames(usernames):
+    """Hashes usernames (case-insensitively) to uniformly distributed 64-bit integers."""
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(name.lower().encode("utf-8"), digest_size=8).digest(), "little")
+         for name in usernames),
+        dtype=np.uint64, count=len(usernames)
+    )
+
+
+def empty_hll():
+    return np.zeros(2 ** HLL_PRECISION, dtype=np.uint8)
+
+
+def empty_minhash():
+    return np.full(MINHASH_PERMUTATIONS, np.iinfo(np.uint64).max, dtype=np.uint64)
+
+
+def build_hll(hashes):
+    """Builds HyperLogLog registers: the top bits pick a register, the rank of the rest is kept as a max."""
+    registers = empty_hll()
+    if len(hashes) == 0:
+        return registers
+    suffix_bits = 64 - HLL_PRECISION
+    buckets = (hashes >> np.uint64(suffix_bits)).astype(np.int64)
+    suffixes = hashes & np.uint64((1 << suffix_bits) - 1)
+    # Rank is the position of the highest set bit counted from the top of the suffix
+    bit_lengths = np.zeros(len(hashes), dtype=np.int64)
+    nonzero = suffixes > 0
+    bit_lengths[nonzero] = np.floor(np.log2(suffixes[nonzero].astype(np.float64))).astype(np.int64) + 1
+    ranks = (suffix_bits - np.minimum(bit_lengths, suffix_bits) + 1).astype(np.uint8)
+    np.maximum.at(registers, buckets, ranks)
+    return registers
+
+
+def build_minhash(hashes):
+    """Builds a MinHash signature: the minimum of each seeded multiply-add permutation of the hashes."""
+    signature = empty_minhash()
+    with np.errstate(over="ignore"):
+        for start in range(0, len(hashes), MINHASH_CHUNK_SIZE):
+            chunk = hashes[start:start + MINHASH_CHUNK_SIZE, None]
+            np.minimum(signature, (chunk * MINHASH_MULTIPLIERS + MINHASH_OFFSETS).min(axis=0), out=signature)
+    return signature
+
+
+def estimate_cardinality(registers):
+    """Estimates the distinct count of a HyperLogLog sketch, with linear counting for small sets."""
+    register_count = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / register_count)
+    estimate = alpha * register_count ** 2 / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    empty_registers = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * register_count and empty_registers:
+        return register_count * np.log(register_count / empty_registers)
+    return float(estimate)
+
+
+def estimate_jaccard(signature_a, signature_b):
+    """Estimates the Jaccard similarity of two MinHash signatures."""
+    return float(np.mean(signature_a == signature_b))
+
+
+def sketch_vod(vod_folder, vod_id, overwrite=False):
+    """
+    Writes <vod_id>_audience.npz with the HyperLogLog registers and MinHash signature of a
+    VOD's chatters.
+
+    Returns:
+        tuple: (vod_id, estimated chatter count), or (vod_id, None) if skipped.
+    """
+    sketch_path = os.path.join(vod_folder, f"{vod_id}{AUDIENCE_SUFFIX}")
+    if os.path.exists(sketch_path) and not overwrite:
+        return vod_id, None
+
+    store = open_vod_chat_store(vod_folder, vod_id)
+    if store is None:
+        return vod_id, None
+    with store:
+        hashes = hash_usernames(store.usernames())
+
+    registers = build_hll(hashes)
+    np.savez(sketch_path, hll=registers, minhash=build_minhash(hashes))
+    return vod_id, estimate_cardinality(registers)
+
+
+class AudienceIndex:
+    """
+    Channel-level sketches with an LSH index over their MinHash signatures.
+
+    `channels` maps a channel name to its row in `hll` and `minhash`; `vod_ids` holds every VOD
+    already merged, so re-running an update only folds in new VODs.
+    """
+
+    def __init__(self, bands=LSH_BANDS):
+        self.bands = bands
+        self.channels = {}
+        self.hll = np.zeros((0, 2 ** HLL_PRECISION), dtype=np.uint8)
+        self.minhash = np.zeros((0, MINHASH_PERMUTATIONS), dtype=np.uint64)
+        self.vod_ids = set()
+        self.buckets = None
+
+    @classmethod
+    def load(cls, path, bands=LSH_BANDS):
+        index = cls(bands)
+        if os.path.exists(path):
+            with np.load(path) as data:
+                index.channels = {str(name): row for row, name in enumerate(data["channels"])}
+                index.hll = data["hll"]
+                index.minhash = data["minhash"]
+                index.vod_ids = set(str(vod_id) for vod_id in data["vod_ids"])
+        return index
+
+    def save(self, path):
+        names = sorted(self.channels, key=self.channels.get)
+        temp_path = f"{path}.tmp.npz"
+        np.savez(temp_path, channels=np.array(names, dtype=str), hll=self.hll, minhash=self.minhash,
+                 vod_ids=np.array(sorted(self.vod_ids), dtype=str))
+        os.replace(temp_path, path)
+
+    def get_row(self, channel_name):
+        row = self.channels.get(channel_name)
+        if row is None:
+            row = self.channels[channel_name] = len(self.channels)
+            self.hll = np.vstack((self.hll, empty_hll()[None]))
+            self.minhash = np.vstack((self.minhash, empty_minhash()[None]))
+        return row
+
+    def add_vod(self, channel_name, vod_id, registers, signature):
+        """Merges a VOD's sketches into its channel. VODs already in the index are ignored."""
+        if vod_id in self.vod_ids:
+            return False
+        row = self.get_row(channel_name)
+        np.maximum(self.hll[row], registers, out=self.hll[row])
+        np.minimum(self.minhash[row], signature, out=self.minhash[row])
+        self.vod_ids.add(vod_id)
+        self.buckets = None
+        return True
+
+    @property
+    def rows_per_band(self):
+        return MINHASH_PERMUTATIONS // self.bands
+
+    @property
+    def lsh_threshold(self):
+        """Jaccard similarity at which two channels share a bucket with probability of about one half."""
+        return (1 / self.bands) ** (1 / self.rows_per_band)
+
+    def bucket_probability(self, similarity):
+        """Probability that two channels with this Jaccard similarity share at least one LSH bucket."""
+        return 1 - (1 - similarity ** self.rows_per_band) ** self.bands
+
+    def build_buckets(self):
+        self.buckets = defaultdict(set)
+        rows = self.rows_per_band
+        for name, row in self.channels.items():
+            for band in range(self.bands):
+                self.buckets[(band, self.minhash[row, band * rows:(band + 1) * rows].tobytes())].add(name)
+
+    def candidates(self, channel_name):
+        """Channels sharing at least one LSH bucket with `channel_name`."""
+        if self.buckets is None:
+            self.build_buckets()
+        rows = self.rows_per_band
+        signature = self.minhash[self.channels[channel_name]]
+        found = set()
+        for band in range(self.bands):
+            found |= self.buckets.get((band, signature[band * rows:(band + 1) * rows].tobytes()), set())
+        found.discard(channel_name)
+        return found
+
+    def overlap(self, channel_a, channel_b):
+        """
+        Estimates the audience overlap of two channels.
+
+        Returns:
+            dict: Jaccard similarity (MinHash) and the shared chatter count (HyperLogLog inclusion-exclusion).
+        """
+        row_a, row_b = self.channels[channel_a], self.channels[channel_b]
+        size_a = estimate_cardinality(self.hll[row_a])
+        size_b = estimate_cardinality(self.hll[row_b])
+        union = estimate_cardinality(np.maximum(self.hll[row_a], self.hll[row_b]))
+        return {
+            "jaccard": estimate_jaccard(self.minhash[row_a], self.minhash[row_b]),
+            "shared_chatters": max(size_a + size_b - union, 0.0),
+        }
+
+    def query(self, channel_name, min_overlap):
+        """
+        Finds the channels whose audience Jaccard similarity with `channel_name` is at least `min_overlap`.
+
+        Thresholds high enough that channels at the threshold share an LSH bucket with
+        probability LSH_MIN_RECALL (about 0.62 with the default bands) only check the LSH
+        candidates. Lower ones, including those just above the LSH threshold, where a channel
+        at the threshold is missed about a third of the time, compare the signature against every
+        channel at once.
+
+        Returns:
+            list: (channel name, Jaccard similarity) pairs, most similar first.
+        """
+        row = self.channels[channel_name]
+        if self.bucket_probability(min_overlap) >= LSH_MIN_RECALL:
+            names = sorted(self.candidates(channel_name))
+        else:
+            names = [name for name in self.channels if name != channel_name]
+        if not names:
+            return []
+        rows = np.array([self.channels[name] for name in names])
+        similarities = np.mean(self.minhash[rows] == self.minhash[row], axis=1)
+        results = [(name, float(similarity)) for name, similarity in zip(names, similarities) if similarity >= min_overlap]
+        return sorted(results, key=lambda result: result[1], reverse=True)
+
+    def pairs(self, min_overlap):
+        """Returns every (channel, channel, Jaccard) pair with overlap of at least `min_overlap`, most similar first."""
+        results = []
+        for name in self.channels:
+            results.extend((name, other, similarity) for other, similarity in self.query(name, min_overlap) if name < other)
+        return sorted(results, key=lambda result: result[2], reverse=True)
+
+
+def update_index(transcripts_folder, workers=None):
+    """
+    Sketches VODs that have no sketch yet and merges every VOD not yet in the index into its channel.
+
+    Returns:
+        tuple: (the updated index, number of VODs merged).
+    """
+    index_path = os.path.join(transcripts_folder, AUDIENCE_INDEX_FILENAME)
+    index = AudienceIndex.load(index_path)
+    new_vods = [(channel, vod_id, folder) for channel, vod_id, folder in iter_vod_folders(transcripts_folder)
+                if vod_id not in index.vod_ids]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(sketch_vod, folder, vod_id) for _, vod_id, folder in new_vods]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to sketch VOD chatters: {e}")
+
+    merged = 0
+    for channel_name, vod_id, vod_folder in new_vods:
+        sketch_path = os.path.join(vod_folder, f"{vod_id}{AUDIENCE_SUFFIX}")
+        if not os.path.exists(sketch_path):
+            continue
+        with np.load(sketch_path) as sketch:
+            merged += index.add_vod(channel_name, vod_id, sketch["hll"], sketch["minhash"])
+
+    index.save(index_path)
+    return index, merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate chat audience overlap between channels.")
+    parser.add_argument("--transcripts-folder", default=DEFAULT_TRANSCRIPTS_FOLDER)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    update_parser = commands.add_parser("update", help="Sketch new VODs and merge them into the channel index")
+    update_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+
+    query_parser = commands.add_parser("query", help="Channels whose audience overlaps a channel")
+    query_parser.add_argument("channel")
+    query_parser.add_argument("--min-overlap", type=float, default=0.2, help="Minimum Jaccard similarity")
+
+    pairs_parser = commands.add_parser("pairs", help="Every pair of channels with overlapping audiences")
+    pairs_parser.add_argument("--min-overlap", type=float, default=0.2, help="Minimum Jaccard similarity")
+    args = parser.parse_args()
+
+    if args.command == "update":
+        index, merged = update_index(args.transcripts_folder, args.workers)
+        print(f"Merged {merged} new VODs; the index covers {len(index.vod_ids)} VODs across {len(index.channels)} channels.")
+        return
+
+    index = AudienceIndex.load(os.path.join(args.transcripts_folder, AUDIENCE_INDEX_FILENAME))
+    if args.command == "query":
+        if args.channel not in index.channels:
+            print(f"Channel {args.channel} is not in the audience index; run the update command first.")
+            return
+        for other, similarity in index.query(args.channel, args.min_overlap):
+            shared = index.overlap(args.channel, other)["shared_chatters"]
+            print(f"{other}: Jaccard {similarity:.2f}, ~{shared:,.0f} shared chatters")
+    else:
+        for channel_a, channel_b, similarity in index.pairs(args.min_overlap):
+            print(f"{channel_a} <-> {channel_b}: Jaccard {similarity:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,549 @@
+"""
+Acoustic fingerprints for finding audio shared between VODs.
+
+Collabs are streamed on several channels at once and reruns re-upload old streams, so the same
+conversation often reaches the pipeline more than once. Every VOD's audio is summarised by
+landmark hashes: the strongest spectrogram peaks are paired with peaks shortly after them, and
+each pair's two frequencies and time difference are packed into a 24-bit hash stored with the
+time of its first peak. The hashes survive different mixes, volumes and encodings of the same
+audio, because only the positions of the peaks matter.
+
+All processed audio goes into one inverted index (hash -> VOD and time). A new VOD is matched by
+looking up its hashes: for a VOD it shares audio with, many matches agree on the same time
+offset between the two timelines, and the query times of those matches mark the overlapping
+spans. The audio of two VODs is rarely aligned to the same sample, and a shift of part of a
+frame can move a peak by a frame, so lookups accept a time difference one frame off. The spans
+are written to <id>_overlaps.json, and the pipeline reuses the transcript of the matched VOD
+for them instead of decoding them again.
+
+Everything is plain NumPy on the CPU. Audio is decoded by ffmpeg at 8 kHz and fingerprinted a
+block at a time, so a long VOD is never held in memory whole.
+
+The index is a folder of segments, each three sorted-by-hash arrays that are memory-mapped when
+queried. Adding VODs writes a new segment; once there are too many, the smallest are merged.
+
+Usage:
+    python audio_fingerprint.py index [--transcripts-folder PATH] [--workers N]
+    python audio_fingerprint.py match AUDIO_FILE [--transcripts-folder PATH]
+"""
+import argparse
+import heapq
+import json
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from chat_store import DEFAULT_TRANSCRIPTS_FOLDER, iter_vod_folders
+from segment_store import find_segments_source, iter_vod_segments, segment_from_dict, SEGMENT_STORE_SUFFIX, SEGMENTS_SUFFIX
+
+FINGERPRINT_INDEX_FOLDERNAME = ".fingerprint_index"
+OVERLAPS_SUFFIX = "_overlaps.json"
+
+FINGERPRINT_SAMPLING_RATE = 8000  # Speech and music peaks sit well below 4 kHz
+FFT_SIZE = 512
+HOP_SIZE = 256  # 32 ms frames
+FRAMES_PER_SECOND = FINGERPRINT_SAMPLING_RATE / HOP_SIZE
+BLOCK_SECONDS = 300  # Audio decoded and fingerprinted at a time
+
+PEAK_TIME_RADIUS = 10  # A peak is the maximum of its (2 * 10 + 1) frames x (2 * 10 + 1) bins neighbourhood
+PEAK_FREQUENCY_RADIUS = 10
+MIN_PEAK_DB = 10.0  # Peaks must stand this far above the block's median level
+PEAKS_PER_SECOND = 5  # Only the strongest peaks of every second are kept
+FAN_OUT = 3  # Pairs per anchor peak; 15 hashes per second, about 4 MB of index per 6-hour VOD
+TARGET_MAX_FRAMES = 63  # Paired peaks are at most 2 seconds apart (6 bits)
+TIME_DELTA_MASK = 0x3F
+TARGET_FREQUENCY_RADIUS = 64
+PAIR_LOOKAHEAD = 24  # Later peaks tried as pair targets for every anchor
+
+DELTA_TOLERANCE_FRAMES = 1  # Query hashes also match index hashes whose time difference is this close
+QUERY_CHUNK_SECONDS = 600  # Query hashes matched at a time, bounding the match arrays
+MAX_HASH_OCCURRENCES = 200  # Hashes this common in an index segment match everything and say nothing
+OFFSET_BIN_FRAMES = 4  # Offsets are first counted in bins of this many frames
+MIN_BIN_MATCHES = 5  # Matches a (VOD, offset bin) needs within a query chunk to be kept
+OFFSET_TOLERANCE_FRAMES = 2  # Matches whose offsets differ this little belong to the same alignment
+SPAN_GAP_SECONDS = 60.0  # A longer gap between matches ends an overlapping span
+MIN_SPAN_SECONDS = 30.0
+MIN_SPAN_MATCHES = 25
+# Share of the query's own hashes in a span that must match before its transcript is reused.
+# The same audio re-mixed under other sound keeps 0.55-0.65 at every sub-frame alignment (with
+# the time difference tolerance; 0.27 at a half-frame shift without it), while shared BGM or game
+# sound under different voices stays below 0.15
+MIN_SPAN_MATCH_DENSITY = 0.3
+
+MAX_INDEX_SEGMENTS = 16  # More index segments than this and the smaller half are merged
+
+WINDOW = np.hanning(FFT_SIZE).astype(np.float32)
+
+
+def iter_pcm_blocks(audio_file, block_seconds=BLOCK_SECONDS):
+    """Decodes an audio file to mono float32 samples at FINGERPRINT_SAMPLING_RATE with ffmpeg, a block at a time."""
+    process = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-v", "error", "-i", audio_file, "-f", "s16le", "-ac", "1",
+         "-ar", str(FINGERPRINT_SAMPLING_RATE), "-"],
+        stdout=subprocess.PIPE,
+    )
+    block_bytes = int(block_seconds * FINGERPRINT_SAMPLING_RATE) * 2
+    finished = False
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                finished = True
+                break
+            yield np.frombuffer(data[:len(data) // 2 * 2], dtype=np.int16).astype(np.float32) / 32768.0
+    finally:
+        process.stdout.close()
+        if not finished:
+            process.kill()
+        process.wait()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, process.args)
+
+
+def get_spectrogram(samples):
+    """Log-magnitude spectrogram in dB, one row per frame."""
+    frames = sliding_window_view(samples, FFT_SIZE)[::HOP_SIZE] * WINDOW
+    return (20 * np.log10(np.abs(np.fft.rfft(frames, axis=1)) + 1e-6)).astype(np.float32)
+
+
+def maximum_filter(spectrogram, time_radius=PEAK_TIME_RADIUS, frequency_radius=PEAK_FREQUENCY_RADIUS):
+    """Maximum over every cell's neighbourhood, one axis at a time."""
+    padded = np.pad(spectrogram, ((time_radius, time_radius), (0, 0)), constant_values=-np.inf)
+    maxima = sliding_window_view(padded, 2 * time_radius + 1, axis=0).max(axis=-1)
+    padded = np.pad(maxima, ((0, 0), (frequency_radius, frequency_radius)), constant_values=-np.inf)
+    return sliding_window_view(padded, 2 * frequency_radius + 1, axis=1).max(axis=-1)
+
+
+def find_peaks(spectrogram, first_frame, emit_from, emit_to):
+    """
+    Finds the local maxima of a spectrogram that stand above its median level.
+
+    Args:
+        spectrogram (np.ndarray): Frames x frequency bins, in dB.
+        first_frame (int): Frame number of the spectrogram's first row on the VOD's timeline.
+        emit_from (int): First frame peaks are returned for.
+        emit_to (int): Frame peaks are returned up to (exclusive); frames outside the range
+            only serve as context for their neighbours.
+
+    Returns:
+        tuple: (frames, frequency bins, levels) of the peaks.
+    """
+    peaks = (spectrogram == maximum_filter(spectrogram)) & (spectrogram > np.median(spectrogram) + MIN_PEAK_DB)
+    frames, bins = np.nonzero(peaks)
+    keep = (frames + first_frame >= emit_from) & (frames + first_frame < emit_to)
+    frames, bins = frames[keep], bins[keep]
+    return frames + first_frame, bins, spectrogram[frames, bins]
+
+
+def find_stream_peaks(blocks):
+    """
+    Finds the spectrogram peaks of audio that arrives in blocks.
+
+    Frames continue across blocks, and the last frames of every block's spectrogram are kept
+    as context for the next, so a peak near a block boundary is found exactly once.
+
+    Returns:
+        tuple: (frames, frequency bins, levels) of every peak.
+    """
+    pending = np.zeros(0, dtype=np.float32)  # Samples not framed yet
+    context = np.zeros((0, FFT_SIZE // 2 + 1), dtype=np.float32)
+    next_frame = emitted_to = 0
+    peaks = []
+    for samples in blocks:
+        pending = np.concatenate((pending, samples))
+        if len(pending) < FFT_SIZE:
+            continue
+        frame_count = (len(pending) - FFT_SIZE) // HOP_SIZE + 1
+        spectrogram = np.concatenate((context, get_spectrogram(pending[:(frame_count - 1) * HOP_SIZE + FFT_SIZE])))
+        pending = pending[frame_count * HOP_SIZE:]
+        first_frame = next_frame - len(context)
+        next_frame += frame_count
+        # Peaks in the last frames still need the next block's frames as neighbours
+        peaks.append(find_peaks(spectrogram, first_frame, emitted_to, next_frame - PEAK_TIME_RADIUS))
+        emitted_to = next_frame - PEAK_TIME_RADIUS
+        context = spectrogram[-2 * PEAK_TIME_RADIUS:]
+    if len(context):
+        peaks.append(find_peaks(context, next_frame - len(context), emitted_to, next_frame))
+    if not peaks:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    return tuple(np.concatenate(parts) for parts in zip(*peaks))
+
+
+def select_peaks(frames, bins, levels, peaks_per_second=PEAKS_PER_SECOND):
+    """Keeps the strongest peaks of every second, ordered by frame and frequency."""
+    seconds = frames * HOP_SIZE // FINGERPRINT_SAMPLING_RATE
+    order = np.lexsort((-levels, seconds))
+    sorted_seconds = seconds[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_seconds, sorted_seconds, "left")
+    kept = order[rank < peaks_per_second]
+    kept = kept[np.lexsort((bins[kept], frames[kept]))]
+    return frames[kept], bins[kept]
+
+
+def get_landmarks(frames, bins):
+    """
+    Pairs every peak with up to FAN_OUT of the peaks that follow it and hashes the pairs.
+
+    Returns:
+        tuple: (hashes, anchor frames) as uint32 arrays, sorted by hash.
+    """
+    frames = frames.astype(np.int64)
+    bins = bins.astype(np.int64)
+    pair_counts = np.zeros(len(frames), dtype=np.int64)
+    hashes, times = [], []
+    for step in range(1, min(PAIR_LOOKAHEAD, len(frames) - 1) + 1):
+        anchors = np.arange(len(frames) - step)
+        targets = anchors + step
+        time_deltas = frames[targets] - frames[anchors]
+        valid = ((time_deltas >= 1) & (time_deltas <= TARGET_MAX_FRAMES) & (pair_counts[anchors] < FAN_OUT)
+                 & (np.abs(bins[targets] - bins[anchors]) <= TARGET_FREQUENCY_RADIUS))
+        anchors, targets, time_deltas = anchors[valid], targets[valid], time_deltas[valid]
+        pair_counts[anchors] += 1
+        # 9 bits anchor frequency, 9 bits target frequency, 6 bits time difference
+        hashes.append((bins[anchors] << 15) | (bins[targets] << 6) | time_deltas)
+        times.append(frames[anchors])
+    if not hashes:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32)
+    hashes = np.concatenate(hashes).astype(np.uint32)
+    times = np.concatenate(times).astype(np.uint32)
+    order = np.argsort(hashes, kind="stable")
+    return hashes[order], times[order]
+
+
+def fingerprint_blocks(blocks):
+    """Fingerprints audio at FINGERPRINT_SAMPLING_RATE that arrives in blocks; returns (hashes, frames)."""
+    frames, bins, levels = find_stream_peaks(blocks)
+    return get_landmarks(*select_peaks(frames, bins, levels))
+
+
+def fingerprint_audio_file(audio_file):
+    """Fingerprints an audio file; returns (hashes, frames) sorted by hash."""
+    return fingerprint_blocks(iter_pcm_blocks(audio_file))
+
+
+def frames_to_seconds(frames):
+    return round(float(frames) / FRAMES_PER_SECOND, 2)
+
+
+def save_array(path, array):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        np.save(file, array)
+    os.replace(temp_path, path)
+
+
+class FingerprintIndex:
+    """
+    Inverted index from landmark hashes to (VOD number, frame).
+
+    `vods` lists (vod_id, channel_name) by VOD number. The entries are kept in segments, each
+    stored as <name>.hashes.npy, <name>.vods.npy and <name>.times.npy sorted by hash; the
+    manifest names the VODs and the segments, and is replaced last, so an interrupted write
+    leaves the previous index intact.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, "manifest.json")
+        self.vods = []
+        self.segments = []
+        self.next_segment = 0
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+            self.vods = [tuple(vod) for vod in manifest["vods"]]
+            self.segments = manifest["segments"]
+            self.next_segment = manifest["next_segment"]
+        self.vod_numbers = {vod_id: number for number, (vod_id, _) in enumerate(self.vods)}
+
+    def __contains__(self, vod_id):
+        return vod_id in self.vod_numbers
+
+    def save_manifest(self):
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"vods": self.vods, "segments": self.segments, "next_segment": self.next_segment}, file)
+        os.replace(temp_path, self.manifest_path)
+
+    def segment_path(self, name, column):
+        return os.path.join(self.folder, f"{name}.{column}.npy")
+
+    def load_segment(self, name):
+        """Memory-maps a segment; returns (hashes, VOD numbers, frames)."""
+        return tuple(np.load(self.segment_path(name, column), mmap_mode="r") for column in ("hashes", "vods", "times"))
+
+    def write_segment(self, hashes, vods, times):
+        """Sorts entries by hash and writes them as a new segment; returns its name."""
+        order = np.argsort(hashes, kind="stable")
+        name = f"segment-{self.next_segment:06d}"
+        self.next_segment += 1
+        os.makedirs(self.folder, exist_ok=True)
+        for column, values in (("hashes", hashes), ("vods", vods), ("times", times)):
+            save_array(self.segment_path(name, column), np.ascontiguousarray(values[order]))
+        return name
+
+    def add(self, fingerprints):
+        """
+        Adds VODs to the index as one new segment. VODs already in the index are ignored.
+
+        Args:
+            fingerprints (list): (vod_id, channel_name, hashes, frames) tuples.
+
+        Returns:
+            int: The number of VODs added.
+        """
+        parts = []
+        for vod_id, channel_name, hashes, times in fingerprints:
+            if vod_id in self.vod_numbers:
+                continue
+            number = self.vod_numbers[vod_id] = len(self.vods)
+            self.vods.append((vod_id, channel_name))
+            parts.append((hashes, np.full(len(hashes), number, dtype=np.uint32), times))
+        if not parts:
+            return 0
+        self.segments.append(self.write_segment(*(np.concatenate(column) for column in zip(*parts))))
+        self.compact()
+        self.save_manifest()
+        return len(parts)
+
+    def compact(self):
+        """Merges the smaller half of the segments into one once there are more than MAX_INDEX_SEGMENTS."""
+        if len(self.segments) <= MAX_INDEX_SEGMENTS:
+            return
+        sizes = {name: os.path.getsize(self.segment_path(name, "hashes")) for name in self.segments}
+        merged = sorted(self.segments, key=sizes.get)[:len(self.segments) // 2]
+        columns = zip(*(self.load_segment(name) for name in merged))
+        name = self.write_segment(*(np.concatenate(column) for column in columns))
+        self.segments = [segment for segment in self.segments if segment not in merged] + [name]
+        self.save_manifest()
+        for old_name in merged:
+            for column in ("hashes", "vods", "times"):
+                os.remove(self.segment_path(old_name, column))
+
+    def match_chunk(self, hashes, times, exclude_number):
+        """
+        Looks up a chunk of query hashes in every segment, allowing their time differences
+        DELTA_TOLERANCE_FRAMES of slack.
+
+        Returns:
+            tuple: (query frames, VOD numbers, offsets) of the matches whose (VOD, offset bin)
+            has at least MIN_BIN_MATCHES matches in the chunk.
+        """
+        # A sub-frame shift of the audio can move either peak of a pair by a frame, so every
+        # hash is also looked up with its time difference one frame shorter and longer
+        hashes = hashes.astype(np.int64)
+        deltas = hashes & TIME_DELTA_MASK
+        hash_variants, time_variants = [hashes], [times]
+        for change in range(1, DELTA_TOLERANCE_FRAMES + 1):
+            for changed, valid in ((hashes + change, deltas + change <= TARGET_MAX_FRAMES),
+                                   (hashes - change, deltas - change >= 1)):
+                hash_variants.append(changed[valid])
+                time_variants.append(times[valid])
+        hashes, times = np.concatenate(hash_variants).astype(np.uint32), np.concatenate(time_variants)
+
+        query_frames, vods, offsets = [], [], []
+        for name in self.segments:
+            segment_hashes, segment_vods, segment_times = self.load_segment(name)
+            low = np.searchsorted(segment_hashes, hashes, "left")
+            counts = np.searchsorted(segment_hashes, hashes, "right") - low
+            found = (counts > 0) & (counts <= MAX_HASH_OCCURRENCES)
+            low, counts, chunk_times = low[found], counts[found], times[found].astype(np.int64)
+            if not len(counts):
+                continue
+            # Positions of every match: low, low + 1, ... low + count - 1 for each query hash
+            positions = np.repeat(low - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            query_frames.append(np.repeat(chunk_times, counts))
+            vods.append(np.asarray(segment_vods[positions], dtype=np.int64))
+            offsets.append(np.asarray(segment_times[positions], dtype=np.int64) - query_frames[-1])
+        if not query_frames:
+            return None
+        query_frames, vods, offsets = np.concatenate(query_frames), np.concatenate(vods), np.concatenate(offsets)
+        keys = (vods << 32) + (offsets // OFFSET_BIN_FRAMES + (1 << 31))
+        _, inverse, key_counts = np.unique(keys, return_inverse=True, return_counts=True)
+        kept = (key_counts[inverse] >= MIN_BIN_MATCHES) & (vods != exclude_number)
+        return query_frames[kept], vods[kept], offsets[kept]
+
+    def query(self, hashes, times, exclude_vod_id=None):
+        """
+        Finds the spans of a fingerprinted VOD that other VODs in the index share.
+
+        Args:
+            hashes (np.ndarray): The VOD's hashes.
+            times (np.ndarray): Their frames.
+            exclude_vod_id (str): The VOD itself, if it is already in the index.
+
+        Returns:
+            list: Overlaps sorted by start, as dicts with vod_id and channel_name of the other
+            VOD, start and end on this VOD's timeline, reference_start and reference_end on the
+            other's, offset (reference time minus time here), matches and density (matches per
+            hash of this VOD within the span).
+        """
+        if not self.segments or not len(hashes):
+            return []
+        exclude_number = self.vod_numbers.get(exclude_vod_id, -1)
+        order = np.argsort(times, kind="stable")
+        hashes, times = hashes[order], times[order]
+        chunk_frames = int(QUERY_CHUNK_SECONDS * FRAMES_PER_SECOND)
+        boundaries = np.searchsorted(times, np.arange(0, int(times[-1]) + chunk_frames + 1, chunk_frames))
+        matches = [self.match_chunk(hashes[start:end], times[start:end], exclude_number)
+                   for start, end in zip(boundaries, boundaries[1:]) if end > start]
+        matches = [chunk for chunk in matches if chunk is not None and len(chunk[0])]
+        if not matches:
+            return []
+        query_frames, vods, offsets = (np.concatenate(column) for column in zip(*matches))
+
+        overlaps = []
+        for number in np.unique(vods):
+            selected = vods == number
+            overlaps.extend(self.find_spans(int(number), query_frames[selected], offsets[selected], times))
+        return sorted(overlaps, key=lambda overlap: (overlap["start"], -overlap["matches"]))
+
+    def find_spans(self, number, query_frames, offsets, times):
+        """
+        Groups one VOD's matches into alignments (consistent offsets) and those into spans.
+        `times` are the frames of all the query's hashes, sorted, which the density is measured against.
+        """
+        order = np.argsort(offsets, kind="stable")
+        query_frames, offsets = query_frames[order], offsets[order]
+        alignment_breaks = np.flatnonzero(np.diff(offsets) > OFFSET_TOLERANCE_FRAMES) + 1
+        vod_id, channel_name = self.vods[number]
+        spans = []
+        for alignment_frames, alignment_offsets in zip(np.split(query_frames, alignment_breaks), np.split(offsets, alignment_breaks)):
+            if len(alignment_frames) < MIN_SPAN_MATCHES:
+                continue
+            offset = int(np.median(alignment_offsets))
+            alignment_frames = np.sort(alignment_frames)
+            span_breaks = np.flatnonzero(np.diff(alignment_frames) > SPAN_GAP_SECONDS * FRAMES_PER_SECOND) + 1
+            for span_frames in np.split(alignment_frames, span_breaks):
+                start, end = int(span_frames[0]), int(span_frames[-1])
+                if len(span_frames) < MIN_SPAN_MATCHES or (end - start) / FRAMES_PER_SECOND < MIN_SPAN_SECONDS:
+                    continue
+                hash_count = int(np.searchsorted(times, end, "right") - np.searchsorted(times, start, "left"))
+                spans.append({
+                    "vod_id": vod_id,
+                    "channel_name": channel_name,
+                    "start": frames_to_seconds(start),
+                    "end": frames_to_seconds(end),
+                    "reference_start": frames_to_seconds(start + offset),
+                    "reference_end": frames_to_seconds(end + offset),
+                    "offset": frames_to_seconds(offset),
+                    "matches": len(span_frames),
+                    "density": round(len(span_frames) / hash_count, 3),
+                })
+        return spans
+
+
+def select_reusable_overlaps(overlaps, min_density=MIN_SPAN_MATCH_DENSITY):
+    """
+    Picks non-overlapping spans to reuse transcripts for, preferring the ones with the most matches.
+    Spans matching less than `min_density` of their hashes share background audio at most, not speech.
+    """
+    chosen = []
+    dense = [overlap for overlap in overlaps if overlap.get("density", 0.0) >= min_density]
+    for overlap in sorted(dense, key=lambda overlap: -overlap["matches"]):
+        if all(overlap["end"] <= other["start"] or overlap["start"] >= other["end"] for other in chosen):
+            chosen.append(overlap)
+    return sorted(chosen, key=lambda overlap: overlap["start"])
+
+
+def load_overlap_segments(overlap, transcripts_folder):
+    """
+    Reads the segments of the matched VOD's transcript that fall in an overlapping span, moved
+    to this VOD's timeline.
+
+    Returns:
+        list: StoredSegments, or None if the matched VOD has no finished segment store (yet).
+    """
+    vod_folder = os.path.join(transcripts_folder, overlap["channel_name"], overlap["vod_id"])
+    path = find_segments_source(vod_folder, overlap["vod_id"])
+    if path is None or not path.endswith((SEGMENT_STORE_SUFFIX, SEGMENTS_SUFFIX)):
+        return None
+    offset = overlap["offset"]
+    segments = []
+    for segment in iter_vod_segments(vod_folder, overlap["vod_id"]):
+        if overlap["reference_start"] <= (segment["start"] + segment["end"]) / 2 < overlap["reference_end"]:
+            segment = dict(segment, start=segment["start"] - offset, end=segment["end"] - offset)
+            if "words" in segment:
+                segment["words"] = [dict(word, start=word["start"] - offset, end=word["end"] - offset) for word in segment["words"]]
+            segments.append(segment_from_dict(segment))
+    return segments
+
+
+def merge_reused_segments(segments, reused_segments):
+    """Interleaves decoded segments with segments reused from other transcripts, in time order."""
+    return heapq.merge(segments, reused_segments, key=lambda segment: segment.start)
+
+
+def fingerprint_vod(vod_folder, vod_id):
+    """Fingerprints a VOD folder's MP3; returns (vod_id, hashes, frames), or (vod_id, None, None) without one."""
+    audio_path = os.path.join(vod_folder, f"{vod_id}.mp3")
+    if not os.path.exists(audio_path):
+        return vod_id, None, None
+    return (vod_id, *fingerprint_audio_file(audio_path))
+
+
+def update_index(transcripts_folder, workers=None, batch_size=64):
+    """
+    Fingerprints the VOD folders whose MP3 is not in the index yet and adds them, batch_size
+    VODs per index segment.
+
+    Returns:
+        tuple: (the updated index, number of VODs added).
+    """
+    index = FingerprintIndex(os.path.join(transcripts_folder, FINGERPRINT_INDEX_FOLDERNAME))
+    new_vods = [(channel_name, vod_id, vod_folder) for channel_name, vod_id, vod_folder in iter_vod_folders(transcripts_folder)
+                if vod_id not in index]
+    channels = {vod_id: channel_name for channel_name, vod_id, _ in new_vods}
+
+    added = 0
+    pending = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fingerprint_vod, folder, vod_id) for _, vod_id, folder in new_vods]
+        for future in as_completed(futures):
+            try:
+                vod_id, hashes, times = future.result()
+            except Exception as e:
+                print(f"Failed to fingerprint VOD audio: {e}")
+                continue
+            if hashes is None:
+                continue
+            pending.append((vod_id, channels[vod_id], hashes, times))
+            if len(pending) >= batch_size:
+                added += index.add(pending)
+                pending = []
+    added += index.add(pending)
+    return index, added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find audio shared between VODs with acoustic fingerprints.")
+    parser.add_argument("--transcripts-folder", default=DEFAULT_TRANSCRIPTS_FOLDER)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = commands.add_parser("index", help="Fingerprint VOD MP3s that are not in the index yet")
+    index_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+
+    match_parser = commands.add_parser("match", help="Spans of an audio file that VODs in the index share")
+    match_parser.add_argument("audio_file")
+    args = parser.parse_args()
+
+    if args.command == "index":
+        index, added = update_index(args.transcripts_folder, args.workers)
+        print(f"Added {added} VODs; the index covers {len(index.vods)} VODs in {len(index.segments)} segments.")
+        return
+
+    index = FingerprintIndex(os.path.join(args.transcripts_folder, FINGERPRINT_INDEX_FOLDERNAME))
+    vod_id = os.path.splitext(os.path.basename(args.audio_file))[0]
+    overlaps = index.query(*fingerprint_audio_file(args.audio_file), exclude_vod_id=vod_id)
+    for overlap in overlaps:
+        print(f"{overlap['start']:.0f}-{overlap['end']:.0f}s matches {overlap['channel_name']}/{overlap['vod_id']} "
+              f"at {overlap['reference_start']:.0f}-{overlap['reference_end']:.0f}s ({overlap['matches']} matches, density {overlap['density']:.0%})")
+    if not overlaps:
+        print("No overlapping audio found.")
+
+
+if __name__ == "__main__":
+    main()
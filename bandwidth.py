@@ -0,0 +1,272 @@
+import json
+import os
+import signal
+import threading
+from collections import deque
+from time import time, sleep
+
+# Relative share of the link each traffic class gets while several classes are downloading.
+# Classes that are idle give their share to the others.
+DEFAULT_CLASS_WEIGHTS = {"video": 6, "chat": 3, "api": 1}
+
+ACTIVE_CLASS_WINDOW_SECONDS = 2.0  # A class counts as active if it drew bandwidth this recently
+REPORT_WINDOW_SECONDS = 10.0  # Window used to compute the reported MB/s per class
+BURST_SECONDS = 1.0  # How much unused bandwidth a class may save up
+MONITOR_INTERVAL_SECONDS = 0.5  # How often download subprocesses are measured
+
+
+class BandwidthGovernor:
+    """
+    A process-wide token bucket that every download path draws from.
+
+    The total rate is split between the active traffic classes according to their weights, so a
+    running video download cannot starve chat downloads or Helix calls. Draws are post-paid:
+    a caller takes the bytes it just received and then sleeps until its class is out of debt.
+    A limit of 0 records throughput without throttling.
+    """
+
+    def __init__(self, limit_bytes_per_second=0, weights=None):
+        self.lock = threading.Lock()
+        self.limit_bytes_per_second = limit_bytes_per_second
+        self.weights = dict(weights or DEFAULT_CLASS_WEIGHTS)
+        self.tokens = {traffic_class: 0.0 for traffic_class in self.weights}
+        self.last_draw = {traffic_class: 0.0 for traffic_class in self.weights}
+        self.history = {traffic_class: deque() for traffic_class in self.weights}
+        self.last_refill = time()
+
+    def set_limit(self, limit_bytes_per_second):
+        """Changes the total bandwidth limit. Takes effect for the next draw."""
+        with self.lock:
+            self._refill()
+            self.limit_bytes_per_second = max(0, limit_bytes_per_second)
+        print(f"Bandwidth limit set to {format_rate(self.limit_bytes_per_second)}.")
+
+    def set_weights(self, weights):
+        """Changes the per-class weights. Unknown classes are added."""
+        with self.lock:
+            self._refill()
+            for traffic_class, weight in weights.items():
+                self.weights[traffic_class] = max(0.0, float(weight))
+                self._ensure_class(traffic_class)
+        print(f"Bandwidth weights set to {self.weights}.")
+
+    def get_class_rate(self, traffic_class):
+        """Returns the bytes per second currently granted to a class, or 0 if unlimited."""
+        with self.lock:
+            self._ensure_class(traffic_class)
+            return self._class_rate(traffic_class, time())
+
+    def charge(self, traffic_class, nbytes):
+        """
+        Charges `nbytes` to a traffic class without waiting.
+
+        Args:
+            traffic_class (str): "video", "chat", "api" or any class added with set_weights.
+            nbytes (int): Bytes that were just transferred.
+        """
+        with self.lock:
+            now = time()
+            self._ensure_class(traffic_class)
+            self._refill()
+            self.tokens[traffic_class] -= nbytes
+            self.last_draw[traffic_class] = now
+            self.history[traffic_class].append((now, nbytes))
+
+    def acquire(self, traffic_class, nbytes):
+        """Charges `nbytes` to a traffic class and blocks until the class is back within its share."""
+        self.charge(traffic_class, nbytes)
+
+        while True:
+            with self.lock:
+                self._refill()
+                deficit = -self.tokens[traffic_class]
+                rate = self._class_rate(traffic_class, time())
+            if deficit <= 0 or rate <= 0:
+                return
+            sleep(min(deficit / rate, 0.25))
+
+    def is_in_debt(self, traffic_class):
+        """Tells whether a class has used more than its share and should pause."""
+        with self.lock:
+            self._ensure_class(traffic_class)
+            self._refill()
+            return self.limit_bytes_per_second > 0 and self.tokens[traffic_class] < 0
+
+    def report(self):
+        """
+        Returns the measured throughput per traffic class.
+
+        Returns:
+            dict: MB/s per class over the last REPORT_WINDOW_SECONDS.
+        """
+        with self.lock:
+            now = time()
+            rates = {}
+            for traffic_class, history in self.history.items():
+                while history and history[0][0] < now - REPORT_WINDOW_SECONDS:
+                    history.popleft()
+                rates[traffic_class] = round(sum(n for _, n in history) / REPORT_WINDOW_SECONDS / 1024 ** 2, 2)
+            return rates
+
+    def _ensure_class(self, traffic_class):
+        if traffic_class not in self.tokens:
+            self.weights.setdefault(traffic_class, 1.0)
+            self.tokens[traffic_class] = 0.0
+            self.last_draw[traffic_class] = 0.0
+            self.history[traffic_class] = deque()
+
+    def _class_rate(self, traffic_class, now):
+        if self.limit_bytes_per_second <= 0:
+            return 0.0
+        active_weight = sum(
+            weight for name, weight in self.weights.items()
+            if name == traffic_class or now - self.last_draw[name] <= ACTIVE_CLASS_WINDOW_SECONDS
+        )
+        if active_weight <= 0:
+            return 0.0
+        return self.limit_bytes_per_second * self.weights[traffic_class] / active_weight
+
+    def _refill(self):
+        now = time()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        for traffic_class in self.tokens:
+            rate = self._class_rate(traffic_class, now)
+            if rate <= 0:
+                self.tokens[traffic_class] = 0.0
+                continue
+            self.tokens[traffic_class] = min(self.tokens[traffic_class] + elapsed * rate, rate * BURST_SECONDS)
+
+
+def format_rate(bytes_per_second):
+    """Formats a byte rate as MB/s, or 'unlimited' for 0."""
+    if not bytes_per_second:
+        return "unlimited"
+    return f"{bytes_per_second / 1024 ** 2:.2f} MB/s"
+
+
+# The governor shared by the whole process
+governor = BandwidthGovernor()
+
+
+def apply_control_file(control_file):
+    """
+    Applies the settings in a bandwidth control file to the shared governor.
+
+    The file is JSON such as {"limit_mb_per_s": 40, "weights": {"video": 6, "chat": 3, "api": 1}},
+    with the limit in megabytes (not megabits) per second.
+    """
+    with open(control_file, "r", encoding="utf-8") as file:
+        settings = json.load(file)
+
+    if "limit_mb_per_s" in settings:
+        governor.set_limit(int(float(settings["limit_mb_per_s"] or 0) * 1024 ** 2))
+    if "limit_mbps" in settings:
+        print(f"Ignoring limit_mbps in {control_file}: the limit is now limit_mb_per_s, in megabytes per second.")
+    if "weights" in settings:
+        governor.set_weights(settings["weights"])
+
+
+def watch_control_file(control_file, interval=5.0):
+    """
+    Starts a daemon thread that re-applies the control file whenever it changes, so the limit
+    and weights can be adjusted while downloads are running.
+    """
+    def watch():
+        last_mtime = None
+        while True:
+            try:
+                mtime = os.path.getmtime(control_file)
+                if mtime != last_mtime:
+                    last_mtime = mtime
+                    apply_control_file(control_file)
+            except FileNotFoundError:
+                last_mtime = None
+            except (OSError, ValueError) as e:
+                print(f"Could not apply bandwidth control file {control_file}: {e}")
+            sleep(interval)
+
+    thread = threading.Thread(target=watch, daemon=True)
+    thread.start()
+    return thread
+
+
+def get_downloaded_bytes(paths, high_water_marks):
+    """
+    Measures how many bytes a download subprocess has written so far.
+
+    Each file's largest observed size is remembered, so temporary parts that are deleted
+    after being joined still count as downloaded.
+
+    Args:
+        paths (list): Files or folders the subprocess downloads into.
+        high_water_marks (dict): Largest size seen per file, updated in place.
+
+    Returns:
+        int: Total bytes downloaded.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for filename in files:
+                    file_path = os.path.join(root, filename)
+                    try:
+                        size = os.path.getsize(file_path)
+                    except OSError:
+                        continue
+                    high_water_marks[file_path] = max(high_water_marks.get(file_path, 0), size)
+        elif os.path.exists(path):
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            high_water_marks[path] = max(high_water_marks.get(path, 0), size)
+    return sum(high_water_marks.values())
+
+
+def govern_process(process, paths, traffic_class, on_progress=None, should_pause=None):
+    """
+    Charges a download subprocess's progress to the governor until it exits.
+
+    The bytes written to `paths` are drawn from the subprocess's traffic class. On platforms with
+    SIGSTOP the subprocess is paused while its class is over its share, which enforces the limit
+    even after it has been changed at runtime, and while `should_pause` returns True.
+
+    Args:
+        process (subprocess.Popen): The running download.
+        paths (list): Files or folders the subprocess downloads into.
+        traffic_class (str): The traffic class to charge.
+        on_progress (callable): Called with the total bytes downloaded whenever it grows.
+        should_pause (callable): Checked every MONITOR_INTERVAL_SECONDS; the subprocess is paused
+            for as long as it returns True (e.g. while the disk is nearly full).
+
+    Returns:
+        int: Total bytes downloaded.
+    """
+    can_pause = hasattr(signal, "SIGSTOP")
+    high_water_marks = {}
+    charged_bytes = 0
+
+    while True:
+        exited = process.poll() is not None
+        downloaded_bytes = get_downloaded_bytes(paths, high_water_marks)
+        if downloaded_bytes > charged_bytes:
+            governor.charge(traffic_class, downloaded_bytes - charged_bytes)
+            charged_bytes = downloaded_bytes
+            if on_progress is not None:
+                on_progress(downloaded_bytes)
+
+        if exited:
+            return charged_bytes
+
+        must_pause = lambda: governor.is_in_debt(traffic_class) or (should_pause is not None and should_pause())
+        if can_pause and must_pause():
+            os.kill(process.pid, signal.SIGSTOP)
+            try:
+                while must_pause() and process.poll() is None:
+                    sleep(MONITOR_INTERVAL_SECONDS / 5)
+            finally:
+                if process.poll() is None:
+                    os.kill(process.pid, signal.SIGCONT)
+
+        sleep(MONITOR_INTERVAL_SECONDS)
@@ -0,0 +1,106 @@
+"""
+Benchmarks the streaming chat JSON to CSV conversion on a synthetic chat.
+
+A TwitchDownloaderCLI-style chat file with the requested number of messages (and a block of
+embedded emote data after the comments) is generated, then converted with the streaming
+parser. Peak Python memory is measured with tracemalloc in a second run. Pass
+--compare-json-load to also measure the old json.load approach.
+
+Usage:
+    python benchmarks/bench_chat_convert.py --messages 1000000 --gzip
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_convert import convert_chat_to_csv  # noqa: E402
+
+WORDS = ["lol", "KEKW", "pog", "hi chat", "no way", "she's so real", "LUL", "gg", "o7", "that's crazy", "W", "clip it"]
+
+
+def write_synthetic_chat(path, messages, use_gzip, duration_seconds=7 * 3600):
+    """Writes a chat file with `messages` comments spread over `duration_seconds`."""
+    opener = gzip.open if use_gzip else open
+    with opener(path, "wt", encoding="utf-8") as file:
+        file.write('{"FileInfo": {"Version": {"Major": 1}}, "streamer": {"name": "bench", "id": 1}, ')
+        file.write('"video": {"id": "1", "start": 0, "end": %d}, "comments": [' % duration_seconds)
+        for i in range(messages):
+            comment = {
+                "_id": f"comment-{i}",
+                "created_at": "2025-01-01T00:00:00Z",
+                "content_offset_seconds": round(i * duration_seconds / messages, 3),
+                "commenter": {"display_name": f"User{random.randrange(50000)}", "_id": str(i % 50000)},
+                "message": {
+                    "body": " ".join(random.choices(WORDS, k=random.randint(1, 6))),
+                    "fragments": [{"text": "x", "emoticon": None}],
+                    "user_badges": [{"_id": "subscriber", "version": "12"}],
+                },
+            }
+            if i:
+                file.write(",")
+            file.write(json.dumps(comment))
+        file.write('], "embeddedData": {"thirdParty": [')
+        file.write(",".join(json.dumps({"id": str(i), "data": "A" * 4096}) for i in range(2000)))
+        file.write("]}}")
+
+
+def convert_with_json_load(json_path, csv_path):
+    """The original conversion: load the whole file, then write the CSV."""
+    with open(json_path, "r", encoding="utf-8") as json_file:
+        chat_data = json.load(json_file)
+    with open(csv_path, "w", newline="", encoding="utf-8") as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(["Timestamp", "Username", "Message"])
+        for message in chat_data.get("comments", []):
+            csv_writer.writerow([
+                message.get("content_offset_seconds", "N/A"),
+                message.get("commenter", {}).get("display_name", "N/A"),
+                message.get("message", {}).get("body", "N/A"),
+            ])
+
+
+def measure(label, convert, json_path, csv_path):
+    """Times a conversion, then runs it again under tracemalloc to get its peak memory."""
+    start_time = time()
+    convert(json_path, csv_path)
+    elapsed = time() - start_time
+
+    tracemalloc.start()
+    convert(json_path, csv_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<16} {elapsed:>8.2f} s {peak / 1024 ** 2:>10.1f} MB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming chat JSON to CSV conversion.")
+    parser.add_argument("--messages", type=int, default=1_000_000, help="Number of synthetic chat messages")
+    parser.add_argument("--gzip", action="store_true", help="Write the synthetic chat gzip-compressed")
+    parser.add_argument("--compare-json-load", action="store_true", help="Also measure the json.load conversion")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        json_path = os.path.join(temp_dir, "chat.json.gz" if args.gzip else "chat.json")
+        csv_path = os.path.join(temp_dir, "chat.csv")
+
+        print(f"Generating a synthetic chat with {args.messages} messages...")
+        write_synthetic_chat(json_path, args.messages, args.gzip)
+        print(f"Chat file size: {os.path.getsize(json_path) / 1024 ** 2:.1f} MB\n")
+
+        measure("streaming", convert_chat_to_csv, json_path, csv_path)
+        if args.compare_json_load and not args.gzip:
+            measure("json.load", convert_with_json_load, json_path, csv_path)
+
+
+if __name__ == "__main__":
+    main()
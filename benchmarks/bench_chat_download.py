@@ -0,0 +1,108 @@
+"""
+Benchmarks the native chat downloader against a local stub of Twitch's comment endpoint.
+
+The stub serves a synthetic chat with a fixed per-request latency, so the numbers show how much
+the time-range fan-out hides round trips compared with paging through the chat sequentially.
+
+Usage:
+    python benchmarks/bench_chat_download.py --duration 25200 --rate 3 --ranges 1 4 8 16
+"""
+import argparse
+import base64
+import bisect
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import time, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_downloader import download_chat  # noqa: E402
+
+PAGE_SIZE = 100
+
+
+def build_comment_offsets(duration_seconds, messages_per_second):
+    """Spreads duration * rate comments evenly across the VOD timeline."""
+    total = int(duration_seconds * messages_per_second)
+    return [i * duration_seconds / total for i in range(total)]
+
+
+def make_stub_handler(offsets, latency_seconds):
+    """Builds a request handler that answers VideoCommentsByOffsetOrCursor queries from `offsets`."""
+
+    class StubCommentHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            variables = body[0]["variables"]
+
+            if "cursor" in variables:
+                start_index = int(base64.b64decode(variables["cursor"])) + 1
+            else:
+                start_index = bisect.bisect_left(offsets, variables.get("contentOffsetSeconds", 0))
+
+            page = range(start_index, min(start_index + PAGE_SIZE, len(offsets)))
+            edges = [{
+                "cursor": base64.b64encode(str(i).encode()).decode(),
+                "node": {
+                    "id": f"comment-{i}",
+                    "commenter": {"id": str(i % 5000), "login": f"user{i % 5000}", "displayName": f"User{i % 5000}"},
+                    "contentOffsetSeconds": int(offsets[i]),
+                    "createdAt": "2025-01-01T00:00:00Z",
+                    "message": {"fragments": [{"text": f"message number {i}", "emote": None}], "userBadges": [], "userColor": None},
+                },
+            } for i in page]
+            response = [{"data": {"video": {"id": variables["videoID"], "comments": {
+                "edges": edges,
+                "pageInfo": {"hasNextPage": page.stop < len(offsets)},
+            }}}}]
+
+            sleep(latency_seconds)
+            payload = json.dumps(response).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubCommentHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the native chat downloader against a local stub server.")
+    parser.add_argument("--duration", type=int, default=7 * 3600, help="VOD length in seconds")
+    parser.add_argument("--rate", type=float, default=2.0, help="Chat messages per second")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub latency per request in seconds")
+    parser.add_argument("--ranges", type=int, nargs="+", default=[1, 4, 8, 16], help="Range counts to compare")
+    args = parser.parse_args()
+
+    offsets = build_comment_offsets(args.duration, args.rate)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_stub_handler(offsets, args.latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    gql_url = f"http://127.0.0.1:{server.server_address[1]}/gql"
+    print(f"Stub comment server with {len(offsets)} comments listening on {gql_url}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for ranges in args.ranges:
+            output_path = os.path.join(temp_dir, f"chat_{ranges}.json")
+            start_time = time()
+            count = download_chat("1", args.duration, output_path, ranges=ranges, gql_url=gql_url)
+            results.append((ranges, count, time() - start_time))
+
+    server.shutdown()
+
+    print("\nRanges | Comments | Seconds | Speedup")
+    baseline = results[0][2]
+    for ranges, count, elapsed in results:
+        print(f"{ranges:>6} | {count:>8} | {elapsed:>7.2f} | {baseline / elapsed:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
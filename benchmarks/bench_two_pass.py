@@ -0,0 +1,102 @@
+"""
+Benchmarks confidence-driven two-pass decoding against beam search on every window.
+
+Every audio file is decoded once with beam search throughout (as the pipeline does by default)
+and once in two passes: greedily, then with beam search again only for the segments outside
+the bounds in two_pass_decode.py. Both decode the same VAD speech regions. Reported are the
+time of each, the end-to-end speedup, the fraction re-decoded, and how closely the two-pass
+words agree with the beam search words.
+
+Usage:
+    python benchmarks/bench_two_pass.py vod1.mp3 vod2.mp3 [--device cpu]
+"""
+import argparse
+import os
+import sys
+from difflib import SequenceMatcher
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faster_whisper import decode_audio  # noqa: E402
+
+from whisper_backend import get_whisper_model, get_model_profile, get_speech_regions, load_vad_settings, merge_speech_regions, transcribe_clips, SAMPLING_RATE  # noqa: E402
+from two_pass_decode import redecode_low_confidence, format_two_pass_stats, FIRST_PASS_OPTIONS  # noqa: E402
+
+BEAM_OPTIONS = {"beam_size": 5, "language": "en"}
+
+
+def report(label, audio_seconds, elapsed_seconds, segment_count):
+    print(f"{label:<20} {elapsed_seconds:8.1f} s   {audio_seconds / elapsed_seconds:6.1f}x realtime   "
+          f"{segment_count:6d} segments")
+
+
+def get_clip_timestamps(speech_regions, start=0.0, end=float("inf")):
+    clips = [(max(region_start, start), min(region_end, end)) for region_start, region_end in speech_regions
+             if region_end > start and region_start < end]
+    return [timestamp for clip in merge_speech_regions(clips) for timestamp in clip]
+
+
+def get_word_agreement(reference_texts, texts):
+    """Fraction of words the two transcripts have in common, in order."""
+    reference_words = " ".join(reference_texts).lower().split()
+    words = " ".join(texts).lower().split()
+    return SequenceMatcher(None, reference_words, words, autojunk=False).ratio() if reference_words or words else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark two-pass decoding against beam search on every window.")
+    parser.add_argument("audio_files", nargs="+", help="Audio files to transcribe")
+    parser.add_argument("--device", default=None, help="auto, cuda or cpu (default: WHISPER_DEVICE)")
+    args = parser.parse_args()
+
+    model = get_whisper_model(args.device)
+    profile = get_model_profile()
+    print(f"Model on {profile['device']} ({profile['compute_type']})\n")
+    vad_settings = load_vad_settings(None)
+
+    total_beam_seconds = total_two_pass_seconds = 0.0
+    total_stats = {}
+    for audio_file in args.audio_files:
+        audio = decode_audio(audio_file, sampling_rate=SAMPLING_RATE)
+        audio_seconds = len(audio) / SAMPLING_RATE
+        speech_regions = get_speech_regions(audio, vad_settings)
+        clip_timestamps = get_clip_timestamps(speech_regions)
+        if not clip_timestamps:
+            print(f"{audio_file}: no speech found, skipped\n")
+            continue
+        print(audio_file)
+
+        start = time()
+        segments, _ = model.transcribe(audio, clip_timestamps=clip_timestamps, **BEAM_OPTIONS)
+        beam_texts = [segment.text for segment in segments]
+        beam_seconds = time() - start
+        report("beam search", audio_seconds, beam_seconds, len(beam_texts))
+
+        def redecode(clip_start, clip_end, prompt):
+            clips = get_clip_timestamps(speech_regions, clip_start, clip_end)
+            return transcribe_clips(model, audio, clips, initial_prompt=prompt, **BEAM_OPTIONS)[0] if clips else []
+
+        stats = {}
+        start = time()
+        segments, _ = model.transcribe(audio, clip_timestamps=clip_timestamps, **{**BEAM_OPTIONS, **FIRST_PASS_OPTIONS})
+        two_pass_texts = [segment.text for segment in redecode_low_confidence(segments, redecode, stats)]
+        two_pass_seconds = time() - start
+        report("two-pass", audio_seconds, two_pass_seconds, len(two_pass_texts))
+
+        print(f"{'':<20} {format_two_pass_stats(stats)}")
+        print(f"{'':<20} speedup {beam_seconds / two_pass_seconds:.2f}x, "
+              f"word agreement with beam search {get_word_agreement(beam_texts, two_pass_texts):.1%}\n")
+        total_beam_seconds += beam_seconds
+        total_two_pass_seconds += two_pass_seconds
+        for key, value in stats.items():
+            total_stats[key] = total_stats.get(key, 0) + value
+
+    if total_stats:
+        print(f"All files: {format_two_pass_stats(total_stats)}")
+        print(f"All files: end-to-end speedup {total_beam_seconds / total_two_pass_seconds:.2f}x "
+              f"({total_beam_seconds:.0f} s with beam search, {total_two_pass_seconds:.0f} s in two passes)")
+
+
+if __name__ == "__main__":
+    main()
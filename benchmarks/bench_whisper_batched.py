@@ -0,0 +1,59 @@
+"""
+Benchmarks sequential against batched Whisper decoding on real audio.
+
+The audio files are transcribed once with the sequential decoder (one 30-second window at a
+time) and then with the batched pipeline at each requested batch size, all files in one
+batched call. Throughput is reported as audio-hours per machine-hour.
+
+Usage:
+    python benchmarks/bench_whisper_batched.py vod1.mp3 vod2.mp3 --batch-sizes 8 16 32 [--device cpu]
+"""
+import argparse
+import os
+import sys
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from whisper_backend import get_whisper_model, get_model_profile, transcribe_batched  # noqa: E402
+
+
+def report(label, audio_seconds, elapsed_seconds, segment_count):
+    print(f"{label:<20} {elapsed_seconds:8.1f} s   {audio_seconds / elapsed_seconds:6.1f}x realtime   "
+          f"{segment_count:6d} segments")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sequential against batched Whisper decoding.")
+    parser.add_argument("audio_files", nargs="+", help="Audio files to transcribe")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 16, 32], help="Batch sizes to measure")
+    parser.add_argument("--device", default=None, help="auto, cuda or cpu (default: WHISPER_DEVICE)")
+    parser.add_argument("--skip-sequential", action="store_true", help="Only measure the batched pipeline")
+    args = parser.parse_args()
+
+    model = get_whisper_model(args.device)
+    profile = get_model_profile()
+    print(f"Model on {profile['device']} ({profile['compute_type']})\n")
+
+    if not args.skip_sequential:
+        start = time()
+        segment_count = 0
+        audio_seconds = 0.0
+        for audio_file in args.audio_files:
+            segments, info = model.transcribe(audio_file, beam_size=5, language="en")
+            segment_count += sum(1 for _ in segments)
+            audio_seconds += info.duration
+        report("sequential", audio_seconds, time() - start, segment_count)
+
+    for batch_size in args.batch_sizes:
+        start = time()
+        results, _ = transcribe_batched(args.audio_files, batch_size=batch_size)
+        elapsed = time() - start
+        audio_seconds = sum(duration for _, duration, _ in results)
+        speech_seconds = sum(speech for _, _, speech in results)
+        report(f"batched (size {batch_size})", audio_seconds, elapsed, sum(len(segments) for segments, _, _ in results))
+        print(f"{'':<20} VAD decoded {speech_seconds:.0f} of {audio_seconds:.0f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Aligns transcript segments with the chat that reacted to them.
+
+For every segment of a VOD's transcript, the chat messages in a configurable window after it
+are found with a binary search over the sorted chat offsets (two searchsorted calls for all
+segments at once), and the pairs are written to <vod_id>_aligned.jsonl in the VOD folder.
+VODs are processed in parallel by a process pool.
+
+Usage:
+    python chat_align.py [transcripts_folder] [--window 10] [--delay 0] [--anchor end] [--workers N]
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from chat_store import DEFAULT_TRANSCRIPTS_FOLDER, iter_vod_folders, open_vod_chat_store
+from segment_store import find_segments_source, load_segment_arrays
+
+ALIGNED_SUFFIX = "_aligned.jsonl"
+
+
+def get_chat_windows(segment_starts, segment_ends, chat_offsets, window_seconds, delay_seconds=0.0, anchor="end"):
+    """
+    Finds the chat messages that fall in the window after each segment.
+
+    Args:
+        segment_starts (np.ndarray): Segment start times in seconds.
+        segment_ends (np.ndarray): Segment end times in seconds.
+        chat_offsets (np.ndarray): Sorted chat message offsets in seconds.
+        window_seconds (float): Length of the window.
+        delay_seconds (float): Gap between the anchor and the start of the window (stream delay).
+        anchor (str): "end" opens the window when the segment ends, "start" when it starts.
+
+    Returns:
+        tuple: (first, stop) arrays of chat message indices; segment i pairs with messages first[i]:stop[i].
+    """
+    window_starts = (segment_ends if anchor == "end" else segment_starts) + delay_seconds
+    first = np.searchsorted(chat_offsets, window_starts.astype(chat_offsets.dtype), side="left")
+    stop = np.searchsorted(chat_offsets, (window_starts + window_seconds).astype(chat_offsets.dtype), side="left")
+    return first, stop
+
+
+def align_vod(vod_folder, vod_id, window_seconds=10.0, delay_seconds=0.0, anchor="end", overwrite=False):
+    """
+    Writes the joined transcript/chat dataset of one VOD.
+
+    Each line of <vod_id>_aligned.jsonl holds one segment with its start, end, text and the chat
+    messages (offset, user, message) in its window.
+
+    Returns:
+        tuple: (vod_id, segment count, paired message count), or (vod_id, None, None) if skipped.
+    """
+    output_path = os.path.join(vod_folder, f"{vod_id}{ALIGNED_SUFFIX}")
+    if (os.path.exists(output_path) and not overwrite) or find_segments_source(vod_folder, vod_id) is None:
+        return vod_id, None, None
+
+    store = open_vod_chat_store(vod_folder, vod_id)
+    if store is None:
+        return vod_id, None, None
+
+    with store:
+        starts, ends, texts = load_segment_arrays(vod_folder, vod_id)
+        first, stop = get_chat_windows(starts, ends, store.offsets, window_seconds, delay_seconds, anchor)
+        usernames = store.usernames()
+
+        temp_path = f"{output_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            for i in range(len(texts)):
+                chat = [
+                    {"t": round(float(store.offsets[j]), 3), "user": usernames[store.user_ids[j]], "message": store.message(j)}
+                    for j in range(first[i], stop[i])
+                ]
+                file.write(json.dumps({
+                    "segment": i,
+                    "start": float(starts[i]),
+                    "end": float(ends[i]),
+                    "text": texts[i],
+                    "chat_count": len(chat),
+                    "chat": chat,
+                }, ensure_ascii=False) + "\n")
+        os.replace(temp_path, output_path)
+
+    return vod_id, len(texts), int((stop - first).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Join transcript segments with the chat messages that followed them.")
+    parser.add_argument("transcripts_folder", nargs="?", default=DEFAULT_TRANSCRIPTS_FOLDER)
+    parser.add_argument("--window", type=float, default=10.0, help="Window length in seconds")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds between the anchor and the window (stream delay)")
+    parser.add_argument("--anchor", choices=["end", "start"], default="end", help="Open the window at the segment's end or start")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--overwrite", action="store_true", help="Rebuild joined files that already exist")
+    args = parser.parse_args()
+
+    vod_folders = list(iter_vod_folders(args.transcripts_folder))
+    print(f"Aligning transcripts and chat for {len(vod_folders)} VOD folders with {args.workers} workers...")
+
+    aligned = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(align_vod, vod_folder, vod_id, args.window, args.delay, args.anchor, args.overwrite)
+            for _, vod_id, vod_folder in vod_folders
+        ]
+        for future in as_completed(futures):
+            try:
+                vod_id, segment_count, message_count = future.result()
+            except Exception as e:
+                print(f"Failed to align VOD: {e}")
+                failed += 1
+                continue
+            if segment_count is None:
+                skipped += 1
+            else:
+                aligned += 1
+                print(f"Aligned {segment_count} segments with {message_count} chat messages for VOD {vod_id}.")
+
+    print(f"Aligned {aligned} VODs, skipped {skipped}, failed {failed}.")
+
+
+if __name__ == "__main__":
+    main()
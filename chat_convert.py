@@ -0,0 +1,139 @@
+import csv
+import gzip
+import json
+import os
+import re
+
+CHUNK_SIZE = 1024 * 1024  # Characters read from the chat file at a time
+
+# Characters that change the structure of the document while scanning for the "comments" key
+STRUCTURAL_PATTERN = re.compile(r'["{}\[\],]')
+# The rest of a JSON string after its opening quote
+STRING_BODY_PATTERN = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+SEPARATOR_PATTERN = re.compile(r'[\s,]*')
+
+decoder = json.JSONDecoder()
+
+
+def open_chat_json(path):
+    """Opens a chat JSON file as text, transparently decompressing gzip files."""
+    with open(path, "rb") as file:
+        is_gzip = file.read(2) == b"\x1f\x8b"
+    if is_gzip:
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_chat_comments(path, chunk_size=CHUNK_SIZE):
+    """
+    Streams the entries of the top-level "comments" array of a chat JSON file.
+
+    Only the current chunk and one comment are held in memory, so memory use does not grow with
+    the size of the chat. Everything before the array is skipped without being parsed and
+    reading stops at the end of the array, so large embedded emote data is never loaded.
+
+    Args:
+        path (str): Path to the chat JSON, plain or gzip-compressed.
+        chunk_size (int): Characters read at a time.
+
+    Yields:
+        dict: One comment at a time, in file order.
+    """
+    with open_chat_json(path) as file:
+        buffer = file.read(chunk_size)
+        pos = 0
+
+        def read_more():
+            nonlocal buffer, pos
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        # Scan the top-level object for the "comments" key
+        depth = 0
+        expecting_key = False
+        last_key = None
+        while True:
+            match = STRUCTURAL_PATTERN.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                if not read_more():
+                    return  # No comments array in this file
+                continue
+
+            char = match.group()
+            if char == '"':
+                string_end = STRING_BODY_PATTERN.match(buffer, match.end())
+                if string_end is None:
+                    pos = match.start()  # The string continues in the next chunk
+                    if not read_more():
+                        raise ValueError(f"Unterminated string in chat file: {path}")
+                    continue
+                if depth == 1 and expecting_key:
+                    last_key = json.loads(buffer[match.start():string_end.end()])
+                    expecting_key = False
+                pos = string_end.end()
+            elif char in "{[":
+                depth += 1
+                pos = match.end()
+                if char == "[" and depth == 2 and last_key == "comments":
+                    break
+                expecting_key = char == "{" and depth == 1
+            elif char in "}]":
+                depth -= 1
+                pos = match.end()
+            else:
+                expecting_key = depth == 1
+                pos = match.end()
+
+        # Decode the array one comment at a time
+        while True:
+            pos = SEPARATOR_PATTERN.match(buffer, pos).end()
+            if pos >= len(buffer):
+                if not read_more():
+                    raise ValueError(f"Chat file ends inside the comments array: {path}")
+                continue
+            if buffer[pos] == "]":
+                return
+
+            try:
+                comment, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if not read_more():
+                    raise  # The file really is malformed
+                continue  # The comment continues in the next chunk
+
+            yield comment
+            pos = end
+            if pos > chunk_size:
+                buffer = buffer[pos:]
+                pos = 0
+
+
+def convert_chat_to_csv(json_path, csv_path):
+    """
+    Converts a chat JSON file to a Timestamp/Username/Message CSV in a single streaming pass.
+
+    Args:
+        json_path (str): The chat JSON, plain or gzip-compressed.
+        csv_path (str): Where to write the CSV. It is written to a temporary file first.
+
+    Returns:
+        int: Number of messages written.
+    """
+    temp_path = f"{csv_path}.tmp"
+    count = 0
+    with open(temp_path, "w", newline="", encoding="utf-8") as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(["Timestamp", "Username", "Message"])
+        for message in iter_chat_comments(json_path):
+            timestamp = message.get("content_offset_seconds", "N/A")
+            username = (message.get("commenter") or {}).get("display_name", "N/A")
+            chat_message = (message.get("message") or {}).get("body", "N/A")
+            csv_writer.writerow([timestamp, username, chat_message])
+            count += 1
+    os.replace(temp_path, csv_path)
+    return count
@@ -0,0 +1,284 @@
+import gzip
+import heapq
+import json
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from time import time, sleep
+
+import requests
+
+from bandwidth import governor
+from failures import VodFailure
+
+# Twitch's GraphQL endpoint serves VOD comments by offset or by cursor. Point TWITCH_GQL_URL
+# at a local stub server to benchmark the downloader offline.
+TWITCH_GQL_URL = os.getenv('TWITCH_GQL_URL', "https://gql.twitch.tv/gql")
+TWITCH_GQL_CLIENT_ID = "kimne78kx3ncx6brgo4mv6wki5h1ko"  # Public client ID used by the Twitch web player
+VIDEO_COMMENTS_QUERY_HASH = "b70a3591ff0f4e0313d126c6a1502d79a1c02baebb288227c582044aa76adf6a"
+
+DEFAULT_CHAT_RANGES = 8  # How many slices of the VOD timeline are paged through concurrently
+PAGE_RETRIES = 5  # Retries per page for connection errors and 5xx responses
+PAGE_TIMEOUT_SECONDS = 30
+
+# Each download thread keeps its own session so connections are reused
+thread_local = threading.local()
+
+
+def get_session():
+    """Returns this thread's requests session."""
+    if not hasattr(thread_local, "session"):
+        thread_local.session = requests.Session()
+        thread_local.session.headers.update({"Client-ID": TWITCH_GQL_CLIENT_ID})
+    return thread_local.session
+
+
+def fetch_comment_page(vod_id, gql_url, offset_seconds=None, cursor=None):
+    """
+    Fetches one page of VOD comments, either at a timeline offset or after a cursor.
+
+    Args:
+        vod_id (str): The VOD ID.
+        gql_url (str): The GraphQL endpoint.
+        offset_seconds (float): Start of the page on the VOD timeline (used when cursor is None).
+        cursor (str): Cursor of the last comment of the previous page.
+
+    Returns:
+        dict: The "comments" object with "edges" and "pageInfo", plus the size of the response
+        under "response_bytes".
+
+    Raises:
+        requests.exceptions.HTTPError: For responses that are not worth retrying, such as 404 or 429.
+        VodFailure: vod_missing, if the query finds no such VOD.
+    """
+    variables = {"videoID": vod_id}
+    if cursor:
+        variables["cursor"] = cursor
+    else:
+        variables["contentOffsetSeconds"] = int(offset_seconds or 0)
+
+    payload = [{
+        "operationName": "VideoCommentsByOffsetOrCursor",
+        "variables": variables,
+        "extensions": {"persistedQuery": {"version": 1, "sha256Hash": VIDEO_COMMENTS_QUERY_HASH}},
+    }]
+
+    for attempt in range(PAGE_RETRIES + 1):
+        try:
+            response = get_session().post(gql_url, json=payload, timeout=PAGE_TIMEOUT_SECONDS)
+            governor.acquire("chat", len(response.content))
+            if response.status_code >= 500:
+                response.raise_for_status()
+            break
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
+            if attempt == PAGE_RETRIES:
+                raise
+            delay = min(2 ** attempt, 30) * random.uniform(0.8, 1.2)
+            print(f"Chat page request for VOD {vod_id} failed: {e}. Retrying in {delay:.1f} seconds...")
+            sleep(delay)
+
+    response.raise_for_status()
+    data = response.json()
+    if isinstance(data, list):
+        data = data[0]
+    if data.get("errors"):
+        raise RuntimeError(f"Chat query for VOD {vod_id} failed: {data['errors']}")
+
+    video = (data.get("data") or {}).get("video")
+    if video is None:
+        # A deleted VOD comes back as a 200 with a null video; let the pipeline confirm it with Helix
+        raise VodFailure("vod_missing", f"VOD {vod_id} not found by the chat query", stage="chat")
+    comments = video.get("comments") or {"edges": [], "pageInfo": {"hasNextPage": False}}
+    comments["response_bytes"] = len(response.content)
+    return comments
+
+
+def convert_comment(node, vod_id):
+    """
+    Converts a GraphQL comment node to the comment layout written by TwitchDownloaderCLI,
+    so existing chat JSON consumers keep working.
+    """
+    commenter = node.get("commenter") or {}
+    message = node.get("message") or {}
+    fragments = message.get("fragments") or []
+
+    return {
+        "_id": node["id"],
+        "created_at": node.get("createdAt"),
+        "content_id": vod_id,
+        "content_type": "video",
+        "content_offset_seconds": node.get("contentOffsetSeconds", 0),
+        "commenter": {
+            "display_name": commenter.get("displayName", "N/A"),
+            "_id": commenter.get("id"),
+            "name": commenter.get("login"),
+        },
+        "message": {
+            "body": "".join(fragment.get("text", "") for fragment in fragments),
+            "fragments": fragments,
+            "user_badges": message.get("userBadges") or [],
+            "user_color": message.get("userColor"),
+        },
+    }
+
+
+def download_comment_range(vod_id, start_seconds, end_seconds, gql_url, output_file, progress=None):
+    """
+    Pages through the comments of one slice of the VOD timeline and writes them to a file.
+
+    Args:
+        vod_id (str): The VOD ID.
+        start_seconds (float): Start of the slice.
+        end_seconds (float): End of the slice, or None for the last slice.
+        gql_url (str): The GraphQL endpoint.
+        output_file (file): Text file the comments (TwitchDownloaderCLI layout) with
+            start_seconds <= offset < end_seconds are written to, one JSON object per line, in
+            timeline order.
+        progress (callable): Called with (bytes, seconds) of timeline covered by each page.
+
+    Returns:
+        int: Number of comments written.
+    """
+    comment_count = 0
+    cursor = None
+    pages = 0
+    covered_seconds = 0.0
+
+    while True:
+        page = fetch_comment_page(vod_id, gql_url, offset_seconds=start_seconds, cursor=cursor)
+        edges = page.get("edges") or []
+        pages += 1
+
+        if progress is not None:
+            last_offset = edges[-1]["node"].get("contentOffsetSeconds", 0) if edges else start_seconds
+            if end_seconds is not None:
+                last_offset = min(last_offset, end_seconds)
+            page_seconds = max(last_offset - start_seconds - covered_seconds, 0)
+            covered_seconds += page_seconds
+            progress(page.get("response_bytes", 0), page_seconds)
+
+        reached_end = False
+        for edge in edges:
+            node = edge["node"]
+            offset = node.get("contentOffsetSeconds", 0)
+            if end_seconds is not None and offset >= end_seconds:
+                reached_end = True
+                break
+            if offset >= start_seconds:
+                output_file.write(json.dumps(convert_comment(node, vod_id), ensure_ascii=False) + "\n")
+                comment_count += 1
+
+        if reached_end or not edges or not (page.get("pageInfo") or {}).get("hasNextPage"):
+            break
+        cursor = edges[-1].get("cursor")
+        if not cursor:
+            break
+
+    print(f"Chat range {start_seconds:.0f}s-{end_seconds if end_seconds is not None else 'end'} of VOD {vod_id}: "
+          f"{comment_count} comments in {pages} pages")
+    return comment_count
+
+
+def read_comment_range(path):
+    """Yields the comments of a range file written by download_comment_range."""
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            yield json.loads(line)
+
+
+def merge_comment_ranges(paths):
+    """
+    Merges range files into one stream ordered by (offset, comment ID), skipping duplicates.
+
+    Every range file is in timeline order, so a k-way merge by offset only holds one comment per
+    range. A comment can only repeat at the same offset, so just the comments sharing the current
+    offset are kept to sort them by ID and drop repeats.
+    """
+    merged = heapq.merge(*(read_comment_range(path) for path in paths),
+                         key=lambda comment: comment["content_offset_seconds"])
+    for _, group in groupby(merged, key=lambda comment: comment["content_offset_seconds"]):
+        unique_comments = {}
+        for comment in group:
+            unique_comments.setdefault(comment["_id"], comment)
+        for comment_id in sorted(unique_comments):
+            yield unique_comments[comment_id]
+
+
+def split_timeline(duration_seconds, ranges):
+    """Splits [0, duration_seconds) into `ranges` equal slices; the last slice is open-ended."""
+    ranges = max(1, min(ranges, int(duration_seconds) or 1))
+    step = duration_seconds / ranges
+    bounds = [round(i * step) for i in range(ranges)]
+    return [(bounds[i], bounds[i + 1] if i + 1 < ranges else None) for i in range(ranges)]
+
+
+def download_chat(vod_id, duration_seconds, output_path, ranges=DEFAULT_CHAT_RANGES, gql_url=None, vod_info=None,
+                  progress_callback=None):
+    """
+    Downloads a VOD's chat by paging through several timeline slices concurrently into one file
+    per slice, then streams a merge of the slices, without duplicate comment IDs, into a
+    TwitchDownloaderCLI-style JSON file.
+
+    Args:
+        vod_id (str): The VOD ID.
+        duration_seconds (int): Length of the VOD, used to split the timeline.
+        output_path (str): Where to write the chat JSON; a ".gz" path is written gzip-compressed.
+        ranges (int): Number of slices downloaded concurrently.
+        gql_url (str): GraphQL endpoint; defaults to TWITCH_GQL_URL.
+        vod_info (dict): Optional VOD entry whose title and channel are stored in the file.
+        progress_callback (callable): Called with (bytes_done, seconds_done) totals after every page.
+
+    Returns:
+        int: Number of comments written.
+    """
+    gql_url = gql_url or TWITCH_GQL_URL
+    slices = split_timeline(duration_seconds, ranges)
+    start_time = time()
+
+    totals = {"bytes": 0, "seconds": 0.0}
+    totals_lock = threading.Lock()
+    def progress(page_bytes, page_seconds):
+        with totals_lock:
+            totals["bytes"] += page_bytes
+            totals["seconds"] += page_seconds
+            if progress_callback is not None:
+                progress_callback(totals["bytes"], totals["seconds"])
+
+    # Every slice is written to its own file as it downloads, so the chat is never held in memory
+    range_paths = [f"{output_path}.range{number}.jsonl" for number in range(len(slices))]
+    def download_range(number):
+        with open(range_paths[number], "w", encoding="utf-8") as range_file:
+            return download_comment_range(vod_id, *slices[number], gql_url, range_file, progress)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(slices)) as executor:
+            downloaded = sum(executor.map(download_range, range(len(slices))))
+
+        vod_info = vod_info or {}
+        streamer = {"name": vod_info.get("channel_name"), "id": vod_info.get("broadcaster_id")}
+        video = {"id": vod_id, "title": vod_info.get("title"), "start": 0, "end": duration_seconds}
+
+        merged = 0
+        temp_path = f"{output_path}.tmp"
+        opener = gzip.open if output_path.endswith(".gz") else open
+        with opener(temp_path, "wt", encoding="utf-8") as file:
+            file.write(f'{{"streamer": {json.dumps(streamer, ensure_ascii=False)}, '
+                       f'"video": {json.dumps(video, ensure_ascii=False)}, "comments": [')
+            for comment in merge_comment_ranges(range_paths):
+                if merged:
+                    file.write(", ")
+                file.write(json.dumps(comment, ensure_ascii=False))
+                merged += 1
+            file.write("]}")
+        os.replace(temp_path, output_path)
+    finally:
+        for path in range_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    elapsed = time() - start_time
+    print(f"Downloaded {merged} chat comments for VOD {vod_id} in {elapsed:.2f} seconds "
+          f"using {len(slices)} range(s) ({downloaded - merged} duplicates removed).")
+    return merged
@@ -0,0 +1,200 @@
+"""
+Chat activity features and highlight detection per VOD.
+
+From a VOD's chat store this computes, per second of the VOD, the chat rate, the number of
+unique chatters and a burst score: the z-score of the short-term chat rate against a trailing
+baseline window. All of it is vectorized with NumPy, so a VOD takes milliseconds. The arrays
+are saved compactly to <vod_id>_chat_features.npz and the top-N highlight windows to
+<vod_id>_highlights.json, which can be used to decide which parts of a VOD deserve
+transcription compute first.
+
+Usage:
+    python chat_features.py [transcripts_folder] [--top 10] [--workers N]
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from chat_store import DEFAULT_TRANSCRIPTS_FOLDER, iter_vod_folders, open_vod_chat_store
+
+FEATURES_SUFFIX = "_chat_features.npz"
+HIGHLIGHTS_SUFFIX = "_highlights.json"
+
+SMOOTHING_SECONDS = 5  # Short-term chat rate is averaged over this many seconds
+BASELINE_SECONDS = 300  # The burst score compares against the chat rate over the preceding window
+HIGHLIGHT_LEAD_SECONDS = 30  # Highlights start this long before the peak of chat activity...
+HIGHLIGHT_TAIL_SECONDS = 15  # ...and end this long after it
+
+
+def moving_sum(values, window):
+    """Sum of each trailing window of `window` values (shorter at the start), via a cumulative sum."""
+    cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    upper = np.arange(1, len(values) + 1)
+    lower = np.maximum(upper - window, 0)
+    return cumulative[upper] - cumulative[lower], upper - lower
+
+
+def compute_chat_features(offsets, user_ids, duration_seconds=None):
+    """
+    Computes per-second chat activity features.
+
+    Args:
+        offsets (np.ndarray): Sorted message offsets in seconds.
+        user_ids (np.ndarray): Interned user ID of each message.
+        duration_seconds (int): Length of the VOD; defaults to the last message.
+
+    Returns:
+        dict: "rate" (messages per second), "unique_chatters" (distinct users per second) and
+        "burst_score" (z-score of the smoothed rate against the trailing baseline).
+    """
+    seconds = np.floor(offsets).astype(np.int64)
+    length = int(duration_seconds or (seconds[-1] + 1 if len(seconds) else 0))
+    seconds = np.clip(seconds, 0, max(length - 1, 0))
+
+    rate = np.bincount(seconds, minlength=length)[:length]
+
+    # One entry per distinct (second, user) pair
+    user_ids = user_ids.astype(np.int64)
+    user_span = int(user_ids.max(initial=0)) + 1
+    pairs = np.unique(seconds * user_span + user_ids)
+    unique_chatters = np.bincount(pairs // user_span, minlength=length)[:length]
+
+    smoothed_sum, smoothed_count = moving_sum(rate, SMOOTHING_SECONDS)
+    smoothed = smoothed_sum / smoothed_count
+
+    # Baseline over the window that ends where the smoothing window starts
+    baseline_sum, baseline_count = moving_sum(rate, BASELINE_SECONDS)
+    baseline_sq_sum, _ = moving_sum(rate.astype(np.float64) ** 2, BASELINE_SECONDS)
+    baseline_sum, baseline_sq_sum, baseline_count = (
+        np.concatenate((np.zeros(SMOOTHING_SECONDS), values))[:length]
+        for values in (baseline_sum, baseline_sq_sum, baseline_count)
+    )
+
+    counts = np.maximum(baseline_count, 1)
+    mean = baseline_sum / counts
+    std = np.sqrt(np.maximum(baseline_sq_sum / counts - mean ** 2, 0))
+    burst_score = np.where(baseline_count > 0, (smoothed - mean) / (std + 1.0), 0.0)
+
+    return {
+        "rate": rate,
+        "unique_chatters": unique_chatters,
+        "burst_score": burst_score,
+    }
+
+
+def find_highlights(burst_score, rate, top_n=10, lead_seconds=HIGHLIGHT_LEAD_SECONDS, tail_seconds=HIGHLIGHT_TAIL_SECONDS):
+    """
+    Picks the top-N non-overlapping highlight windows around the strongest chat bursts.
+
+    Returns:
+        list: Dictionaries with start, end, peak, score and messages, strongest first.
+    """
+    highlights = []
+    taken = np.zeros(len(burst_score), dtype=bool)
+    for peak in np.argsort(burst_score)[::-1]:
+        if len(highlights) >= top_n or burst_score[peak] <= 0:
+            break
+        start = max(int(peak) - lead_seconds, 0)
+        end = min(int(peak) + tail_seconds, len(burst_score))
+        if taken[start:end].any():
+            continue
+        taken[start:end] = True
+        highlights.append({
+            "start": start,
+            "end": end,
+            "peak": int(peak),
+            "score": round(float(burst_score[peak]), 2),
+            "messages": int(rate[start:end].sum()),
+        })
+    return highlights
+
+
+def save_chat_features(path, features):
+    """Saves the features as compact arrays (uint16 counts, float16 burst scores)."""
+    np.savez_compressed(
+        path,
+        rate=np.minimum(features["rate"], np.iinfo(np.uint16).max).astype(np.uint16),
+        unique_chatters=np.minimum(features["unique_chatters"], np.iinfo(np.uint16).max).astype(np.uint16),
+        burst_score=features["burst_score"].astype(np.float16),
+    )
+
+
+def write_chat_features(store, features_path, highlights_path, top_n=10):
+    """
+    Computes the features and highlights from an open chat store and writes both files.
+
+    Returns:
+        list: The highlight windows.
+    """
+    features = compute_chat_features(np.asarray(store.offsets), np.asarray(store.user_ids))
+    highlights = find_highlights(features["burst_score"], features["rate"], top_n=top_n)
+    save_chat_features(features_path, features)
+    with open(highlights_path, "w", encoding="utf-8") as file:
+        json.dump(highlights, file, indent=2)
+    return highlights
+
+
+def load_highlights(vod_folder, vod_id):
+    """Returns a VOD's saved highlight windows, strongest first, or an empty list."""
+    path = os.path.join(vod_folder, f"{vod_id}{HIGHLIGHTS_SUFFIX}")
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def process_vod(vod_folder, vod_id, top_n=10, overwrite=False):
+    """
+    Computes and saves the chat features and highlights of one VOD.
+
+    Returns:
+        tuple: (vod_id, number of highlights), or (vod_id, None) if skipped.
+    """
+    features_path = os.path.join(vod_folder, f"{vod_id}{FEATURES_SUFFIX}")
+    if os.path.exists(features_path) and not overwrite:
+        return vod_id, None
+
+    store = open_vod_chat_store(vod_folder, vod_id)
+    if store is None:
+        return vod_id, None
+
+    with store:
+        highlights = write_chat_features(store, features_path, os.path.join(vod_folder, f"{vod_id}{HIGHLIGHTS_SUFFIX}"), top_n)
+    return vod_id, len(highlights)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute chat activity features and highlights for every VOD.")
+    parser.add_argument("transcripts_folder", nargs="?", default=DEFAULT_TRANSCRIPTS_FOLDER)
+    parser.add_argument("--top", type=int, default=10, help="Number of highlight windows per VOD")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--overwrite", action="store_true", help="Recompute features that already exist")
+    args = parser.parse_args()
+
+    vod_folders = list(iter_vod_folders(args.transcripts_folder))
+    print(f"Computing chat features for {len(vod_folders)} VOD folders with {args.workers} workers...")
+
+    processed = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(process_vod, vod_folder, vod_id, args.top, args.overwrite)
+                   for _, vod_id, vod_folder in vod_folders]
+        for future in as_completed(futures):
+            try:
+                vod_id, highlight_count = future.result()
+            except Exception as e:
+                print(f"Failed to compute chat features: {e}")
+                failed += 1
+                continue
+            if highlight_count is None:
+                skipped += 1
+            else:
+                processed += 1
+
+    print(f"Computed chat features for {processed} VODs, skipped {skipped}, failed {failed}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+Compact, time-indexed chat store.
+
+Each VOD's chat is kept in one binary file (<vod_id>_chat_store.bin) with columns instead of
+rows: sorted float32 offsets, an interned user ID per message, and the message text in a
+UTF-8 heap addressed by an offset array. A per-second index narrows every time-range query
+to a few seconds' worth of messages, and the file is memory-mapped, so
+"messages between t0 and t1" never parses the whole chat.
+
+Usage (bulk-convert existing VOD folders):
+    python chat_store.py [transcripts_folder] [--workers N] [--overwrite]
+"""
+import argparse
+import csv
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from chat_convert import iter_chat_comments
+
+DEFAULT_TRANSCRIPTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts")
+CHAT_STORE_SUFFIX = "_chat_store.bin"
+
+MAGIC = b"VCHAT001"
+# Magic, then message count, user count, index length, user heap size and message heap size
+HEADER = struct.Struct("<8s5Q")
+
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+
+def align(offset):
+    """Rounds a file offset up to the next multiple of 8."""
+    return (offset + 7) & ~7
+
+
+def get_sections(message_count, user_count, index_length, user_heap_size, message_heap_size):
+    """
+    Lays out the sections of a chat store file.
+
+    Returns:
+        list: (name, dtype, count, byte_offset) for every section, in file order.
+    """
+    sections = [
+        ("offsets", np.float32, message_count),
+        ("user_ids", np.uint32, message_count),
+        ("message_offsets", np.uint64, message_count + 1),
+        ("second_index", np.uint32, index_length),
+        ("user_offsets", np.uint64, user_count + 1),
+        ("user_heap", np.uint8, user_heap_size),
+        ("message_heap", np.uint8, message_heap_size),
+    ]
+    layout = []
+    position = HEADER.size
+    for name, dtype, count in sections:
+        position = align(position)
+        layout.append((name, dtype, count, position))
+        position += np.dtype(dtype).itemsize * count
+    return layout
+
+
+def write_chat_store(path, timestamps, usernames, messages):
+    """
+    Writes a chat store file.
+
+    Args:
+        path (str): Where to write the store. It is written to a temporary file first.
+        timestamps (list): Offset of each message in seconds from the start of the VOD.
+        usernames (list): Display name of each message's author.
+        messages (list): Text of each message.
+
+    Returns:
+        int: Number of messages written.
+    """
+    offsets = np.asarray(timestamps, dtype=np.float32)
+    order = np.argsort(offsets, kind="stable")
+    offsets = offsets[order]
+
+    # Intern the usernames so each message stores a 4-byte user ID
+    user_lookup = {}
+    user_ids = np.empty(len(order), dtype=np.uint32)
+    for position, message_index in enumerate(order):
+        user_ids[position] = user_lookup.setdefault(usernames[message_index], len(user_lookup))
+
+    encoded_users = [name.encode("utf-8") for name in user_lookup]
+    user_offsets = np.zeros(len(encoded_users) + 1, dtype=np.uint64)
+    np.cumsum([len(name) for name in encoded_users], out=user_offsets[1:])
+    user_heap = b"".join(encoded_users)
+
+    encoded_messages = [messages[message_index].encode("utf-8") for message_index in order]
+    message_offsets = np.zeros(len(encoded_messages) + 1, dtype=np.uint64)
+    np.cumsum([len(message) for message in encoded_messages], out=message_offsets[1:])
+    message_heap = b"".join(encoded_messages)
+
+    # second_index[s] is the index of the first message at or after second s
+    last_second = int(np.floor(offsets[-1])) + 1 if len(offsets) else 0
+    second_index = np.searchsorted(offsets, np.arange(last_second + 1, dtype=np.float32), side="left").astype(np.uint32)
+
+    columns = {
+        "offsets": offsets,
+        "user_ids": user_ids,
+        "message_offsets": message_offsets,
+        "second_index": second_index,
+        "user_offsets": user_offsets,
+        "user_heap": np.frombuffer(user_heap, dtype=np.uint8),
+        "message_heap": np.frombuffer(message_heap, dtype=np.uint8),
+    }
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(offsets), len(encoded_users), len(second_index), len(user_heap), len(message_heap)))
+        for name, dtype, count, byte_offset in get_sections(len(offsets), len(encoded_users), len(second_index),
+                                                            len(user_heap), len(message_heap)):
+            file.write(b"\0" * (byte_offset - file.tell()))
+            file.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+    os.replace(temp_path, path)
+    return len(offsets)
+
+
+class ChatStore:
+    """
+    A memory-mapped, read-only view of a chat store file.
+
+    Columns are exposed as NumPy arrays that read straight from the mapping: `offsets` (sorted
+    float32 seconds), `user_ids` (uint32) and `second_index`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, *counts = HEADER.unpack_from(self.mapping, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a chat store file.")
+        for name, dtype, count, byte_offset in get_sections(*counts):
+            setattr(self, name, np.frombuffer(self.mapping, dtype=dtype, count=count, offset=byte_offset))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Releases the mapping. Arrays taken from the store must not be used afterwards."""
+        for name in ("offsets", "user_ids", "message_offsets", "second_index", "user_offsets", "user_heap", "message_heap"):
+            setattr(self, name, None)
+        self.mapping.close()
+        self.file.close()
+
+    @property
+    def user_count(self):
+        return len(self.user_offsets) - 1
+
+    def username(self, user_id):
+        """Returns the display name for a user ID."""
+        start, end = int(self.user_offsets[user_id]), int(self.user_offsets[user_id + 1])
+        return self.user_heap[start:end].tobytes().decode("utf-8")
+
+    def usernames(self):
+        """Returns every interned display name, indexed by user ID."""
+        return [self.username(user_id) for user_id in range(self.user_count)]
+
+    def message(self, index):
+        """Returns the text of the message at `index`."""
+        start, end = int(self.message_offsets[index]), int(self.message_offsets[index + 1])
+        return self.message_heap[start:end].tobytes().decode("utf-8")
+
+    def index_range(self, t0, t1):
+        """
+        Finds the messages with t0 <= offset < t1.
+
+        The per-second index narrows the search to whole seconds, then a binary search over that
+        slice finds the exact bounds.
+
+        Returns:
+            tuple: (start, stop) message indices.
+        """
+        last_second = len(self.second_index) - 1
+        if last_second < 0:
+            return 0, 0
+        s0 = min(max(int(np.floor(t0)), 0), last_second)
+        s1 = min(max(int(np.ceil(t1)), 0), last_second)
+        lower, upper = int(self.second_index[s0]), int(self.second_index[s1]) if t1 <= last_second else len(self)
+
+        window = self.offsets[lower:upper]
+        start = lower + int(np.searchsorted(window, np.float32(t0), side="left"))
+        stop = lower + int(np.searchsorted(window, np.float32(t1), side="left"))
+        return start, stop
+
+    def messages_between(self, t0, t1):
+        """
+        Returns the messages with t0 <= offset < t1.
+
+        Returns:
+            list: (offset, username, message) tuples in time order.
+        """
+        start, stop = self.index_range(t0, t1)
+        return [
+            (float(self.offsets[i]), self.username(int(self.user_ids[i])), self.message(i))
+            for i in range(start, stop)
+        ]
+
+
+def read_chat_rows(chat_path):
+    """
+    Reads (timestamp, username, message) rows from a chat CSV or chat JSON file.
+    Rows without a numeric timestamp are skipped.
+    """
+    timestamps, usernames, messages = [], [], []
+
+    if chat_path.endswith(".csv"):
+        with open(chat_path, "r", newline="", encoding="utf-8") as file:
+            reader = csv.reader(file)
+            next(reader, None)  # Skip header
+            rows = ((row[0], row[1], row[2]) for row in reader if len(row) >= 3)
+            for timestamp, username, message in rows:
+                try:
+                    timestamps.append(float(timestamp))
+                except ValueError:
+                    continue
+                usernames.append(username)
+                messages.append(message)
+    else:
+        for comment in iter_chat_comments(chat_path):
+            timestamp = comment.get("content_offset_seconds")
+            if not isinstance(timestamp, (int, float)):
+                continue
+            timestamps.append(float(timestamp))
+            usernames.append((comment.get("commenter") or {}).get("display_name", "N/A"))
+            messages.append((comment.get("message") or {}).get("body", "N/A"))
+
+    return timestamps, usernames, messages
+
+
+def build_chat_store(chat_path, store_path):
+    """
+    Builds a chat store from a chat CSV or chat JSON file.
+
+    Returns:
+        int: Number of messages stored.
+    """
+    return write_chat_store(store_path, *read_chat_rows(chat_path))
+
+
+def iter_vod_folders(transcripts_folder):
+    """
+    Yields (channel_name, vod_id, vod_folder) for every VOD folder under the transcripts folder.
+    The scratch folder of in-flight VODs is skipped.
+    """
+    for channel_name in sorted(os.listdir(transcripts_folder)):
+        channel_folder = os.path.join(transcripts_folder, channel_name)
+        if channel_name.startswith(".") or not os.path.isdir(channel_folder):
+            continue
+        for vod_id in sorted(os.listdir(channel_folder)):
+            vod_folder = os.path.join(channel_folder, vod_id)
+            if vod_id.isdigit() and os.path.isdir(vod_folder):
+                yield channel_name, vod_id, vod_folder
+
+
+def find_chat_source(vod_folder, vod_id):
+    """Returns the best chat file to build a store from: the CSV, else the raw JSON."""
+    for filename in (f"{vod_id}_chat.csv", f"{vod_id}_chat.json.gz", f"{vod_id}_chat.json"):
+        path = os.path.join(vod_folder, filename)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def open_vod_chat_store(vod_folder, vod_id):
+    """
+    Opens a VOD's chat store, building it from the chat CSV or JSON first if it is missing.
+
+    Returns:
+        ChatStore: The store, or None if the folder has no chat at all.
+    """
+    store_path = os.path.join(vod_folder, f"{vod_id}{CHAT_STORE_SUFFIX}")
+    if not os.path.exists(store_path):
+        chat_path = find_chat_source(vod_folder, vod_id)
+        if chat_path is None:
+            return None
+        build_chat_store(chat_path, store_path)
+    return ChatStore(store_path)
+
+
+def convert_vod_folder(vod_folder, vod_id, overwrite=False):
+    """
+    Builds the chat store of one VOD folder.
+
+    Returns:
+        tuple: (vod_id, message count, or None if skipped).
+    """
+    store_path = os.path.join(vod_folder, f"{vod_id}{CHAT_STORE_SUFFIX}")
+    chat_path = find_chat_source(vod_folder, vod_id)
+    if chat_path is None or (os.path.exists(store_path) and not overwrite):
+        return vod_id, None
+    return vod_id, build_chat_store(chat_path, store_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the chat of existing VOD folders to chat store files.")
+    parser.add_argument("transcripts_folder", nargs="?", default=DEFAULT_TRANSCRIPTS_FOLDER)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--overwrite", action="store_true", help="Rebuild stores that already exist")
+    args = parser.parse_args()
+
+    vod_folders = list(iter_vod_folders(args.transcripts_folder))
+    print(f"Converting chat for {len(vod_folders)} VOD folders with {args.workers} workers...")
+
+    converted = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(convert_vod_folder, vod_folder, vod_id, args.overwrite)
+                   for _, vod_id, vod_folder in vod_folders]
+        for future in as_completed(futures):
+            try:
+                vod_id, message_count = future.result()
+            except Exception as e:
+                print(f"Failed to convert chat: {e}")
+                failed += 1
+                continue
+            if message_count is None:
+                skipped += 1
+            else:
+                converted += 1
+                print(f"Stored {message_count} chat messages for VOD {vod_id}.")
+
+    print(f"Converted {converted} VODs, skipped {skipped}, failed {failed}.")
+
+
+if __name__ == "__main__":
+    main()
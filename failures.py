@@ -0,0 +1,16 @@
+"""
+The error type pipeline stages raise when they already know why a VOD failed.
+
+It lives in its own module so helper modules such as the chat downloader can raise it without
+importing the main script. The failure class is one of the keys of the main script's
+RETRY_POLICIES and decides how the failure is retried.
+"""
+
+
+class VodFailure(Exception):
+    """An error raised by a pipeline stage that already knows its failure class."""
+
+    def __init__(self, failure_class, message, stage=None):
+        super().__init__(message)
+        self.failure_class = failure_class
+        self.stage = stage
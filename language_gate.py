@@ -0,0 +1,149 @@
+"""
+Language gating before transcription.
+
+Some channels in the English category stream partly or wholly in other languages. Instead of
+decoding a whole VOD to find out, a few short windows spread across it are cut straight out of
+the audio file with ffmpeg and run through Whisper's language detection only. Windows that VAD
+finds (almost) no speech in are passed over for the next candidate, since detection on silence
+or music says nothing. The share of windows detected as English decides whether the VOD is
+worth transcribing.
+
+Detection runs with a model of its own, LANGUAGE_GATE_MODEL (default small). Distilled
+checkpoints such as distil-large-v3, the default transcription model, were trained to decode
+English only and lean towards English when asked for the language, so they cannot be trusted
+to tell English streams from others; neither can the English-only ".en" checkpoints.
+"""
+import os
+import subprocess
+import threading
+
+import numpy as np
+
+from whisper_backend import get_speech_regions, get_inference_profile, get_model_profile, get_model_name, \
+    get_whisper_model, load_whisper_model, SAMPLING_RATE
+
+LANGUAGE_SAMPLE_WINDOWS = 6
+LANGUAGE_WINDOW_SECONDS = 30
+MIN_WINDOW_SPEECH_SECONDS = 5.0  # Windows with less speech than this are not sampled
+CANDIDATE_WINDOWS_PER_SAMPLE = 3  # Candidates tried per wanted window, for VODs with long quiet stretches
+DEFAULT_LANGUAGE_GATE_MODEL = "small"
+
+_gate_model = None
+_gate_model_lock = threading.Lock()
+
+
+def get_language_gate_model(device=None):
+    """
+    Returns the multilingual model language detection runs with, loading it on first use.
+
+    It is loaded with the transcription model's profile if that is loaded already, so both
+    share a device. If LANGUAGE_GATE_MODEL names the transcription model, that model is reused.
+
+    Raises:
+        ValueError: If LANGUAGE_GATE_MODEL names a distilled or English-only checkpoint.
+    """
+    global _gate_model
+    model_name = os.getenv("LANGUAGE_GATE_MODEL", DEFAULT_LANGUAGE_GATE_MODEL)
+    checkpoint = os.path.basename(model_name.rstrip("/\\")).lower()
+    if "distil" in checkpoint or checkpoint.endswith(".en"):
+        raise ValueError(f"LANGUAGE_GATE_MODEL {model_name!r} is not multilingual; use a checkpoint such as small or large-v3.")
+    if model_name == get_model_name():
+        return get_whisper_model(device)
+    with _gate_model_lock:
+        if _gate_model is None:
+            _gate_model = load_whisper_model(get_model_profile() or get_inference_profile(device), model_name)
+    return _gate_model
+
+
+def get_audio_duration(audio_file):
+    """Duration of an audio file in seconds, from ffprobe."""
+    output = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", audio_file],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip())
+
+
+def load_audio_window(audio_file, start_seconds, duration_seconds):
+    """Decodes part of an audio file to 16 kHz mono float32 samples, seeking without decoding what comes before."""
+    output = subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-ss", f"{start_seconds:.3f}", "-t", f"{duration_seconds:.3f}",
+         "-i", audio_file, "-f", "s16le", "-ac", "1", "-ar", str(SAMPLING_RATE), "-"],
+        capture_output=True, check=True,
+    ).stdout
+    return np.frombuffer(output, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def get_candidate_starts(duration_seconds, windows, window_seconds=LANGUAGE_WINDOW_SECONDS,
+                         candidates_per_window=CANDIDATE_WINDOWS_PER_SAMPLE):
+    """
+    Start times of the candidate windows, spread evenly across the audio and ordered so the
+    first `windows` of them already cover the whole VOD; the rest fill the gaps in between.
+    """
+    if duration_seconds <= window_seconds:
+        return [0.0]
+    count = windows * candidates_per_window
+    span = duration_seconds - window_seconds
+    starts = [span * (index + 0.5) / count for index in range(count)]
+    return [starts[index] for offset in range(candidates_per_window) for index in range(offset, count, candidates_per_window)]
+
+
+def detect_window_language(model, window):
+    """
+    Runs language detection on one window.
+
+    WhisperModel.transcribe detects the language before it returns and decodes lazily, so
+    nothing is decoded as long as its segments are never read.
+
+    Returns:
+        tuple: (language, probability, probability of English)
+    """
+    segments, info = model.transcribe(window, language=None)
+    close = getattr(segments, "close", None)
+    if close is not None:
+        close()
+    all_probabilities = dict(getattr(info, "all_language_probs", None) or ())
+    english_probability = all_probabilities.get("en", info.language_probability if info.language == "en" else 0.0)
+    return info.language, info.language_probability, english_probability
+
+
+def sample_languages(model, audio_file, duration_seconds=None, vad_settings=None, windows=LANGUAGE_SAMPLE_WINDOWS,
+                     window_seconds=LANGUAGE_WINDOW_SECONDS):
+    """
+    Detects the language of a few speech windows spread across an audio file.
+
+    Args:
+        model (WhisperModel): The model to detect with (see get_language_gate_model).
+        audio_file (str): The audio file.
+        duration_seconds (float): Its duration; read with ffprobe if None.
+        vad_settings (dict): VAD settings used to pass over windows without speech.
+        windows (int): Number of speech windows to sample.
+        window_seconds (float): Length of each window.
+
+    Returns:
+        dict: english_ratio (share of sampled windows detected as English, None without any
+        speech), languages (window count per language) and the sampled windows.
+    """
+    if duration_seconds is None:
+        duration_seconds = get_audio_duration(audio_file)
+
+    sampled = []
+    for start in get_candidate_starts(duration_seconds, windows, window_seconds):
+        if len(sampled) >= windows:
+            break
+        window = load_audio_window(audio_file, start, window_seconds)
+        if sum(end - region_start for region_start, end in get_speech_regions(window, vad_settings)) < MIN_WINDOW_SPEECH_SECONDS:
+            continue
+        language, probability, english_probability = detect_window_language(model, window)
+        sampled.append({
+            "start": round(start, 1),
+            "language": language,
+            "probability": round(probability, 3),
+            "english_probability": round(english_probability, 3),
+        })
+
+    languages = {}
+    for window in sampled:
+        languages[window["language"]] = languages.get(window["language"], 0) + 1
+    english_ratio = languages.get("en", 0) / len(sampled) if sampled else None
+    return {"english_ratio": english_ratio, "languages": languages, "windows": sorted(sampled, key=lambda window: window["start"])}
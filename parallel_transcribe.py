@@ -0,0 +1,196 @@
+"""
+Chunk-parallel transcription across processes.
+
+A long VOD is cut into chunks of roughly CHUNK_TARGET_SECONDS at its quietest points, so
+cuts land in pauses instead of mid-word. Each chunk (with a little overlap on both sides) is
+transcribed by a pool of worker processes, each holding its own Whisper model. The chunk
+results are stitched back together: every segment is moved to the VOD's timeline and kept
+only by the chunk its midpoint falls in, and words repeated across a cut are removed.
+
+Enabled in the pipeline with WHISPER_PROCESSES (the number of worker processes).
+"""
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from whisper_backend import get_whisper_model, get_speech_regions, merge_speech_regions, replace_segment, shift_segment, SAMPLING_RATE
+
+CHUNK_TARGET_SECONDS = 600
+SPLIT_SEARCH_SECONDS = 20  # Cuts are placed at the quietest point within this distance of the target
+CHUNK_OVERLAP_SECONDS = 1.0  # Audio shared by neighbouring chunks, so words at a cut are heard whole
+ENERGY_FRAME_SECONDS = 0.1
+ENERGY_SMOOTHING_FRAMES = 5  # A cut needs a quiet stretch, not a single quiet frame
+MAX_REPEATED_WORDS = 8
+
+WORD_PATTERN = re.compile(r"[^\w']+")
+
+
+def get_worker_processes():
+    """Worker processes the pipeline transcribes with (WHISPER_PROCESSES); 0 or 1 disables them."""
+    return int(os.getenv("WHISPER_PROCESSES", 0))
+
+
+def get_frame_energy(audio):
+    """RMS energy of every ENERGY_FRAME_SECONDS frame of the audio."""
+    frame = int(ENERGY_FRAME_SECONDS * SAMPLING_RATE)
+    frame_count = len(audio) // frame
+    frames = audio[:frame_count * frame].reshape(frame_count, frame)
+    return np.sqrt(np.einsum("ij,ij->i", frames, frames) / frame)
+
+
+def find_split_points(audio, chunk_seconds=CHUNK_TARGET_SECONDS, search_seconds=SPLIT_SEARCH_SECONDS):
+    """
+    Picks the sample positions the audio is cut at.
+
+    Returns:
+        list: Sample positions, starting with 0 and ending with len(audio).
+    """
+    points = [0]
+    duration = len(audio) / SAMPLING_RATE
+    if duration < 1.5 * chunk_seconds:
+        return points + [len(audio)]
+
+    energy = get_frame_energy(audio)
+    smoothed = np.convolve(energy, np.ones(ENERGY_SMOOTHING_FRAMES) / ENERGY_SMOOTHING_FRAMES, mode="same")
+    frame = int(ENERGY_FRAME_SECONDS * SAMPLING_RATE)
+    search_frames = int(search_seconds / ENERGY_FRAME_SECONDS)
+
+    target = chunk_seconds
+    while target < duration - chunk_seconds / 2:
+        center = int(target / ENERGY_FRAME_SECONDS)
+        low, high = max(center - search_frames, 1), min(center + search_frames, len(smoothed) - 1)
+        cut_frame = low + int(np.argmin(smoothed[low:high]))
+        points.append(cut_frame * frame)
+        target = cut_frame * ENERGY_FRAME_SECONDS + chunk_seconds
+    return points + [len(audio)]
+
+
+def init_worker(device, cpu_threads):
+    """Loads the worker's own Whisper model, sharing the machine's cores between the workers."""
+    os.environ["WHISPER_CPU_THREADS"] = str(cpu_threads)
+    get_whisper_model(device)
+
+
+def transcribe_chunk(audio, offset_seconds, keep_start, keep_end, vad_settings, transcribe_options):
+    """
+    Transcribes one chunk in a worker process.
+
+    Args:
+        audio (np.ndarray): The chunk's audio, overlap included.
+        offset_seconds (float): Where the chunk starts on the VOD's timeline.
+        keep_start (float): Start of the part of the timeline this chunk is responsible for.
+        keep_end (float): End of that part.
+        vad_settings (dict): VAD settings for the chunk.
+        transcribe_options (dict): Passed on to WhisperModel.transcribe.
+
+    Returns:
+        tuple: (segments on the VOD's timeline, (language, probability) or None, speech seconds)
+    """
+    regions = get_speech_regions(audio, vad_settings)
+    speech_seconds = sum(
+        max(min(end + offset_seconds, keep_end) - max(start + offset_seconds, keep_start), 0.0)
+        for start, end in regions
+    )
+    if not regions:
+        return [], None, 0.0
+
+    model = get_whisper_model()
+    clip_timestamps = [timestamp for clip in merge_speech_regions(regions) for timestamp in clip]
+    segments, info = model.transcribe(audio, clip_timestamps=clip_timestamps, **transcribe_options)
+    kept = []
+    for segment in segments:
+        segment = shift_segment(segment, offset_seconds)
+        if keep_start <= (segment.start + segment.end) / 2 < keep_end:
+            kept.append(segment)
+    return kept, (info.language, info.language_probability), speech_seconds
+
+
+def normalize_words(text):
+    return [word for word in WORD_PATTERN.split(text.lower()) if word]
+
+
+def remove_repeated_words(previous_text, text, max_words=MAX_REPEATED_WORDS):
+    """
+    Drops the words at the start of `text` that repeat the end of `previous_text`, which
+    happens when both chunks around a cut heard the same word in their overlap.
+    """
+    previous_words = normalize_words(previous_text)
+    words = text.split()
+    for count in range(min(max_words, len(previous_words), len(words)), 0, -1):
+        if previous_words[-count:] == normalize_words(" ".join(words[:count])):
+            return " ".join(words[count:])
+    return text
+
+
+def stitch_chunks(chunk_segments, max_gap_seconds=2.0):
+    """
+    Joins the kept segments of every chunk, in order, removing words repeated across each cut.
+
+    Returns:
+        list: The VOD's segments.
+    """
+    stitched = []
+    for segments in chunk_segments:
+        if stitched and segments:
+            first = segments[0]
+            if first.start - stitched[-1].end <= max_gap_seconds:
+                text = remove_repeated_words(stitched[-1].text, first.text.strip())
+                segments = segments[1:] if not text else [replace_segment(first, text=f" {text}")] + segments[1:]
+        stitched.extend(segments)
+    return stitched
+
+
+_process_pool = None
+
+
+def get_process_pool(processes=None, device=None):
+    """Returns the shared worker pool; models stay loaded between VODs."""
+    global _process_pool
+    if _process_pool is None:
+        processes = processes or get_worker_processes() or 2
+        total_threads = int(os.getenv("WHISPER_CPU_THREADS", 0)) or os.cpu_count() or processes
+        # Spawned, not forked: the parent may already hold CUDA or CTranslate2 threads
+        _process_pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(device, max(total_threads // processes, 1)),
+        )
+    return _process_pool
+
+
+def transcribe_parallel(audio, vad_settings=None, processes=None, device=None, **transcribe_options):
+    """
+    Transcribes decoded audio with the worker pool.
+
+    Args:
+        audio (np.ndarray): The VOD's audio at SAMPLING_RATE.
+        vad_settings (dict): VAD settings (see whisper_backend.load_vad_settings).
+        processes (int): Worker processes; defaults to WHISPER_PROCESSES.
+        device (str): Device the workers load their models on.
+        **transcribe_options: Passed on to WhisperModel.transcribe (e.g. beam_size).
+
+    Returns:
+        tuple: (segments, (language, probability) or None if there was no speech, speech seconds)
+    """
+    transcribe_options.setdefault("language", "en")
+    transcribe_options.setdefault("beam_size", 5)
+    pool = get_process_pool(processes, device)
+
+    points = find_split_points(audio)
+    overlap = int(CHUNK_OVERLAP_SECONDS * SAMPLING_RATE)
+    futures = []
+    for start, end in zip(points, points[1:]):
+        chunk_start = max(start - overlap, 0)
+        futures.append(pool.submit(
+            transcribe_chunk, audio[chunk_start:min(end + overlap, len(audio))], chunk_start / SAMPLING_RATE,
+            start / SAMPLING_RATE, end / SAMPLING_RATE, vad_settings, transcribe_options
+        ))
+    print(f"Transcribing {len(futures)} chunks in parallel...")
+
+    results = [future.result() for future in futures]
+    language = next((result[1] for result in results if result[1] is not None), None)
+    return stitch_chunks([result[0] for result in results]), language, sum(result[2] for result in results)
@@ -108,6 +108,7 @@ def index():
         </div>
         <div class="info-text" id="info-text">Loading...</div>
         <div class="info-text" id="status-text">Status: Waiting...</div>
+        <div class="info-text" id="metrics-text"></div>
         <div id="twitch-embed" class="twitch-embed">
             <iframe
                 src=""
@@ -123,6 +124,7 @@ def index():
         const percentageText = document.getElementById('percentage');
         const infoText = document.getElementById('info-text');
         const statusText = document.getElementById('status-text');
+        const metricsText = document.getElementById('metrics-text');
         const twitchEmbed = document.getElementById('twitch-embed').querySelector('iframe');
 
         // Store the last received data
@@ -135,7 +137,7 @@ def index():
             }
             lastData = data; // Update the lastData with the current data
 
-            const { vod_id, completed_vods, total_vods, vod_duration, total_audio_left, status } = data;
+            const { vod_id, completed_vods, total_vods, vod_duration, total_audio_left, status, stage_metrics } = data;
 
             // Calculate progress percentage
             const progress = Math.min(100, Math.round((completed_vods / total_vods) * 100));
@@ -160,6 +162,15 @@ def index():
 
             // Update status text
             statusText.textContent = `Status: ${status}`;
+
+            // Update live stage metrics (bytes, MB/s and realtime factor per running stage of every VOD)
+            metricsText.textContent = Object.entries(stage_metrics || {}).flatMap(([metricsVodId, stages]) =>
+                Object.entries(stages).map(([stage, m]) =>
+                    `${metricsVodId} ${stage}: ${m.percent !== null ? m.percent + '%, ' : ''}` +
+                    `${(m.bytes_done / 1048576).toFixed(1)} MB, ${m.mb_per_s} MB/s, ` +
+                    `${m.realtime_factor}x realtime${m.stalled ? ' (stalled)' : ''}`
+                )
+            ).join(' | ');
         }
 
         function fetchProgress() {
@@ -197,6 +208,19 @@ def update_progress():
         return jsonify({"message": "Progress updated successfully!"}), 200
     return jsonify({"error": "Invalid data"}), 400
 
+@app.route('/update_metrics', methods=['POST'])
+def update_metrics():
+    """
+    Replace the live stage metrics with the ones in a POST request.
+    The request body maps every VOD ID to the metrics of its running stages;
+    stages missing from it have finished and are no longer shown.
+    """
+    data = request.json
+    if isinstance(data, dict):
+        progress_data["stage_metrics"] = data
+        return jsonify({"message": "Metrics updated successfully!"}), 200
+    return jsonify({"error": "Invalid data"}), 400
+
 def update_website_with_progress(vod_id, status):
     """
     Updates the website with transcription progress via a JSON payload.
@@ -0,0 +1,154 @@
+"""
+Online detection of Whisper repetition loops.
+
+On long silent or music stretches Whisper can fall into a loop, emitting the same phrase over
+and over because every window is conditioned on the text of the one before. The guard sits
+between the decoder and the transcript writer and watches a sliding window of the most recent
+segments: when most of the window's word n-grams are repeats, or the window's text compresses
+far better than speech does, the window is a loop. The looping segments are dropped, and if
+the caller can restart the decoder, decoding restarts (without the looping text as context) a
+little past the end of the loop, so the rest of the loop is never decoded at all. Every loop
+is recorded as a region of the timeline.
+"""
+import zlib
+from collections import Counter, deque
+
+WINDOW_SEGMENTS = 12  # Segments held back and checked together; also the output latency
+MIN_WINDOW_WORDS = 24  # Shorter windows are never called a loop
+NGRAM_SIZE = 3
+MAX_REPETITION_RATE = 0.5  # Fraction of the window's n-grams that repeat an earlier one
+MAX_COMPRESSION_RATIO = 3.0  # Speech compresses to about half; loops compress much further
+LOOP_SKIP_SECONDS = 10.0  # How far past the end of a loop decoding restarts
+
+
+def get_ngrams(words, n=NGRAM_SIZE):
+    n = min(n, len(words))
+    return [tuple(words[i:i + n]) for i in range(len(words) - n + 1)] if n else []
+
+
+def get_repetition_rate(words, n=NGRAM_SIZE):
+    """Fraction of the word n-grams that repeat an earlier n-gram of the same text."""
+    ngrams = get_ngrams(words, n)
+    return 1.0 - len(set(ngrams)) / len(ngrams) if ngrams else 0.0
+
+
+def get_compression_ratio(text):
+    """Length of the text over the length of its zlib-compressed form, as Whisper computes it."""
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+
+def normalize_words(text):
+    return [word.strip(".,!?\"'-").lower() for word in text.split()]
+
+
+def measure_window(texts):
+    """Returns (word count, repetition rate, compression ratio) of a window of segment texts."""
+    text = " ".join(text.strip() for text in texts)
+    words = normalize_words(text)
+    return len(words), get_repetition_rate(words), get_compression_ratio(text)
+
+
+def is_loop(word_count, repetition_rate, compression_ratio):
+    return word_count >= MIN_WINDOW_WORDS and (
+        repetition_rate >= MAX_REPETITION_RATE or compression_ratio >= MAX_COMPRESSION_RATIO
+    )
+
+
+def repeats_ngrams(text, known_ngrams):
+    """True if most of the text's n-grams are among the known ones."""
+    ngrams = set(get_ngrams(normalize_words(text)))
+    return bool(ngrams) and 2 * len(ngrams & known_ngrams) >= len(ngrams)
+
+
+def find_loop_start(texts):
+    """
+    Index of the first segment of the window that takes part in the loop: most of its
+    n-grams also occur in other segments of the window, or it loops within itself.
+    """
+    segment_ngrams = [set(get_ngrams(normalize_words(text))) for text in texts]
+    counts = Counter(ngram for ngrams in segment_ngrams for ngram in ngrams)
+    for index, (text, ngrams) in enumerate(zip(texts, segment_ngrams)):
+        repeated = {ngram for ngram in ngrams if counts[ngram] > 1}
+        if repeats_ngrams(text, repeated) or get_compression_ratio(text.strip()) >= MAX_COMPRESSION_RATIO:
+            return index
+    return len(texts) - 1
+
+
+def guard_repetition_loops(segments, restart=None, loop_regions=None, window_segments=WINDOW_SEGMENTS,
+                           skip_seconds=LOOP_SKIP_SECONDS):
+    """
+    Passes segments through, cutting out repetition loops.
+
+    Segments right after a cut that keep repeating the loop are dropped as well.
+
+    Args:
+        segments (iterable): Whisper segments in time order.
+        restart (callable): restart(seconds) returns new segments decoded from that point on
+            the timeline. Without it, looping segments are only dropped.
+        loop_regions (list): Every loop found is appended as a dict with start, end (the end
+            of the skipped audio), dropped_segments, repetition_rate, compression_ratio and text.
+        window_segments (int): Size of the sliding window.
+        skip_seconds (float): How far past the end of a loop decoding restarts.
+
+    Yields:
+        The segments that are not part of a loop, in order.
+    """
+    loop_regions = [] if loop_regions is None else loop_regions
+    segments = iter(segments)
+    window = deque()
+    loop_ngrams = None  # N-grams of the last loop, while segments may still be continuing it
+    while True:
+        segment = next(segments, None)
+        if segment is None:
+            break
+        if loop_ngrams is not None:
+            if repeats_ngrams(segment.text, loop_ngrams):
+                region = loop_regions[-1]
+                region["end"] = max(region["end"], round(segment.end, 2))
+                region["dropped_segments"] += 1
+                if restart is not None:
+                    # Still looping after the restart; skip further ahead
+                    if hasattr(segments, "close"):
+                        segments.close()
+                    region["end"] = round(segment.end + skip_seconds, 2)
+                    segments = iter(restart(region["end"]))
+                continue
+            loop_ngrams = None
+        window.append(segment)
+        texts = [pending.text for pending in window]
+        word_count, repetition_rate, compression_ratio = measure_window(texts)
+        if not is_loop(word_count, repetition_rate, compression_ratio):
+            if len(window) > window_segments:
+                yield window.popleft()
+            continue
+
+        for _ in range(find_loop_start(texts)):
+            yield window.popleft()
+        loop_ngrams = {ngram for pending in window for ngram in get_ngrams(normalize_words(pending.text))}
+        region = {
+            "start": round(window[0].start, 2),
+            "end": round(window[-1].end, 2),
+            "dropped_segments": len(window),
+            "repetition_rate": round(repetition_rate, 3),
+            "compression_ratio": round(compression_ratio, 2),
+            "text": window[0].text.strip()[:200],
+        }
+        window.clear()
+
+        if restart is not None:
+            if hasattr(segments, "close"):
+                segments.close()  # Stops the lazy decoder; the rest of the loop is never decoded
+            region["end"] = round(region["end"] + skip_seconds, 2)
+            segments = iter(restart(region["end"]))
+
+        previous = loop_regions[-1] if loop_regions else None
+        if previous is not None and region["start"] <= previous["end"] + skip_seconds:
+            # The loop carried on after the last cut
+            previous["end"] = max(previous["end"], region["end"])
+            previous["dropped_segments"] += region["dropped_segments"]
+        else:
+            loop_regions.append(region)
+        print(f"Repetition loop at {region['start']:.1f}-{region['end']:.1f} seconds "
+              f"(repetition {repetition_rate:.0%}, compression {compression_ratio:.1f}): {region['text'][:60]!r}")
+    yield from window
@@ -0,0 +1,194 @@
+"""
+Builds (streamer utterance, chat replies) pairs for conversational training data.
+
+Each VOD's transcript segments and chat messages are both in time order, so they are walked
+in lockstep: a segment enters a sliding window when it ends, collects the chat messages in
+the following N seconds, and is written out as soon as its window has passed. Only the
+segments inside the window are ever held in memory. Bot accounts, commands, links, emote
+walls and repeated messages are dropped on the way.
+
+VODs are spread over output shards by a stable hash of their ID, and each worker process
+writes one shard at a time (pairs-00000.jsonl, ...), so the whole transcripts tree is
+processed in parallel with bounded memory per worker.
+
+Usage:
+    python response_pairs.py [transcripts_folder] output_folder [--window 10] [--shards 64] [--workers N]
+"""
+import argparse
+import json
+import os
+import re
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from chat_store import DEFAULT_TRANSCRIPTS_FOLDER, iter_vod_folders, open_vod_chat_store
+from segment_store import iter_vod_segments
+
+KNOWN_BOTS = {
+    "nightbot", "streamelements", "streamlabs", "moobot", "fossabot", "wizebot", "sery_bot", "botrixoficial",
+    "soundalerts", "pokemoncommunitygame", "streamstickers", "kofistreambot", "commanderroot",
+}
+URL_PATTERN = re.compile(r"https?://|www\.|\.(?:com|net|tv|gg|ly)/", re.IGNORECASE)
+MAX_MESSAGE_LENGTH = 300
+MIN_DISTINCT_CHARACTER_RATIO = 0.15  # "aaaaaaaaaa" and long emote walls fall below this
+MAX_MESSAGES_PER_USER_PER_WINDOW = 3
+
+
+def is_bot_username(username):
+    """True for known chat bots and accounts named like one (bot_..., ..._bot); "abbot" is not a bot."""
+    name = username.lower()
+    return name in KNOWN_BOTS or name.startswith("bot_") or name.endswith("_bot")
+
+
+def is_spam_message(message):
+    """True for commands, links, overlong messages and messages that are mostly one repeated token."""
+    message = message.strip()
+    if not message or message.startswith("!") or len(message) > MAX_MESSAGE_LENGTH or URL_PATTERN.search(message):
+        return True
+    if len(message) >= 20 and len(set(message)) / len(message) < MIN_DISTINCT_CHARACTER_RATIO:
+        return True
+    words = message.split()
+    return len(words) >= 6 and len(set(words)) == 1
+
+
+def iter_vod_pairs(vod_folder, vod_id, window_seconds=10.0, delay_seconds=0.0, min_replies=1, min_words=3):
+    """
+    Yields the utterance/reply pairs of one VOD.
+
+    A segment's window is [end + delay, end + delay + window). Segments with fewer than
+    `min_words` words or fewer than `min_replies` surviving replies are skipped.
+
+    Yields:
+        dict: start, end, utterance and replies (t, user, message).
+    """
+    store = open_vod_chat_store(vod_folder, vod_id)
+    if store is None:
+        return
+
+    with store:
+        bot_users = np.array([is_bot_username(name) for name in store.usernames()], dtype=bool)
+        usernames = {}
+
+        segments = iter_vod_segments(vod_folder, vod_id)
+        pending = next(segments, None)
+        active = deque()  # [window start, window end, segment, replies, replies per user, seen messages]
+
+        def flush(until):
+            while active and active[0][1] <= until:
+                window_start, window_end, segment, replies, _, _ = active.popleft()
+                if len(replies) >= min_replies:
+                    yield {"start": segment["start"], "end": segment["end"], "utterance": segment["text"], "replies": replies}
+
+        for index in range(len(store)):
+            t = float(store.offsets[index])
+
+            # Open the window of every segment whose window has started by now
+            while pending is not None and pending["end"] + delay_seconds <= t:
+                if len(pending["text"].split()) >= min_words:
+                    window_start = pending["end"] + delay_seconds
+                    active.append([window_start, window_start + window_seconds, pending, [], {}, set()])
+                pending = next(segments, None)
+
+            yield from flush(t)
+            if not active:
+                if pending is None:
+                    break
+                continue
+
+            user_id = int(store.user_ids[index])
+            if bot_users[user_id]:
+                continue
+            message = store.message(index)
+            if is_spam_message(message):
+                continue
+            user = usernames.get(user_id)
+            if user is None:
+                user = usernames[user_id] = store.username(user_id)
+
+            # Windows are only opened once they have started, so every active window covers t
+            for _, _, segment, replies, per_user, seen in active:
+                # Rate-limit each chatter per window and drop copypasta repeated within it
+                if per_user.get(user_id, 0) >= MAX_MESSAGES_PER_USER_PER_WINDOW or message.lower() in seen:
+                    continue
+                per_user[user_id] = per_user.get(user_id, 0) + 1
+                seen.add(message.lower())
+                replies.append({"t": round(t, 3), "user": user, "message": message})
+
+        yield from flush(float("inf"))
+
+
+def get_shard(vod_id, shard_count):
+    """Stable shard number of a VOD."""
+    return zlib.crc32(vod_id.encode("utf-8")) % shard_count
+
+
+def build_shard(shard_path, vods, window_seconds, delay_seconds, min_replies, overwrite=False):
+    """
+    Writes the pairs of a list of (channel_name, vod_id, vod_folder) VODs to one shard file.
+
+    Returns:
+        tuple: (shard_path, VOD count, pair count), or (shard_path, None, None) if skipped.
+    """
+    if os.path.exists(shard_path) and not overwrite:
+        return shard_path, None, None
+
+    pair_count = 0
+    temp_path = f"{shard_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        for channel_name, vod_id, vod_folder in vods:
+            for pair in iter_vod_pairs(vod_folder, vod_id, window_seconds, delay_seconds, min_replies):
+                file.write(json.dumps({"channel": channel_name, "vod_id": vod_id, **pair}, ensure_ascii=False) + "\n")
+                pair_count += 1
+    os.replace(temp_path, shard_path)
+    return shard_path, len(vods), pair_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build streamer utterance / chat reply pairs from every VOD.")
+    parser.add_argument("transcripts_folder", nargs="?", default=DEFAULT_TRANSCRIPTS_FOLDER)
+    parser.add_argument("output_folder", help="Where the pair shards are written")
+    parser.add_argument("--window", type=float, default=10.0, help="Seconds of chat after an utterance that count as replies")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds between the end of the utterance and the window (stream delay)")
+    parser.add_argument("--min-replies", type=int, default=1, help="Skip utterances with fewer replies than this")
+    parser.add_argument("--shards", type=int, default=64, help="Number of output shards")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--overwrite", action="store_true", help="Rebuild shards that already exist")
+    args = parser.parse_args()
+
+    shards = [[] for _ in range(args.shards)]
+    for channel_name, vod_id, vod_folder in iter_vod_folders(args.transcripts_folder):
+        shards[get_shard(vod_id, args.shards)].append((channel_name, vod_id, vod_folder))
+
+    os.makedirs(args.output_folder, exist_ok=True)
+    print(f"Building response pairs for {sum(map(len, shards))} VOD folders into {args.shards} shards "
+          f"with {args.workers} workers...")
+
+    total_pairs = built = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(build_shard, os.path.join(args.output_folder, f"pairs-{shard:05d}.jsonl"), vods,
+                            args.window, args.delay, args.min_replies, args.overwrite)
+            for shard, vods in enumerate(shards) if vods
+        ]
+        for future in as_completed(futures):
+            try:
+                shard_path, vod_count, pair_count = future.result()
+            except Exception as e:
+                print(f"Failed to build shard: {e}")
+                failed += 1
+                continue
+            if vod_count is None:
+                skipped += 1
+            else:
+                built += 1
+                total_pairs += pair_count
+                print(f"Wrote {pair_count} pairs from {vod_count} VODs to: {shard_path}")
+
+    print(f"Built {built} shards with {total_pairs} pairs, skipped {skipped}, failed {failed}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,42 @@ import requests
 import random
 from bs4 import BeautifulSoup
 import csv
+import errno
 import os
 import subprocess
 import shutil
 import json
 import re
+import sys
 import time
-import ctypes
-from faster_whisper import WhisperModel
 from dotenv import load_dotenv
+from bandwidth import governor, govern_process, watch_control_file, format_rate
+from chat_downloader import download_chat
+from failures import VodFailure
+from chat_convert import convert_chat_to_csv
+from chat_store import build_chat_store, ChatStore, CHAT_STORE_SUFFIX
+from chat_features import write_chat_features, FEATURES_SUFFIX, HIGHLIGHTS_SUFFIX
+from segment_store import TranscriptWriter, can_resume_writer, SEGMENT_STORE_SUFFIX
+from whisper_backend import get_whisper_model, get_model_profile, transcribe_batched, load_vad_settings, get_speech_regions, \
+    merge_speech_regions, decode_audio, replace_segment, transcribe_clips, get_batch_size, SAMPLING_RATE
+from parallel_transcribe import transcribe_parallel, remove_repeated_words, get_worker_processes
+from transcribe_daemon import get_daemon_health, transcribe_remote, detect_language_remote, get_daemon_socket
+from repetition_guard import guard_repetition_loops
+from two_pass_decode import redecode_low_confidence, format_two_pass_stats, FIRST_PASS_OPTIONS
+from language_gate import sample_languages, get_language_gate_model
+from audio_fingerprint import FingerprintIndex, fingerprint_audio_file, select_reusable_overlaps, load_overlap_segments, \
+    merge_reused_segments, FINGERPRINT_INDEX_FOLDERNAME, OVERLAPS_SUFFIX
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from time import time, sleep
 
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
 # Load environment variables from a .env file
 load_dotenv()
 
@@ -33,6 +57,154 @@ BASE_TRANSCRIPTS_FOLDER = os.path.join(SCRIPT_DIR, "transcripts")  # Folder name
 VTUBERS_CSV = os.path.join(BASE_TRANSCRIPTS_FOLDER, "verified_vtubers.csv")
 VODS_CSV = os.path.join(BASE_TRANSCRIPTS_FOLDER, "valid_vods.csv")
 
+# Each in-flight VOD gets its own scratch folder; it lives under the transcripts folder so that
+# promoting finished files into the VOD folder is an atomic rename on the same filesystem
+SCRATCH_FOLDER = os.path.join(BASE_TRANSCRIPTS_FOLDER, ".scratch")
+
+# Stages every VOD goes through, in order. Progress is checkpointed after each one.
+VOD_STAGES = ["download", "chat", "extract", "transcribe", "finalize"]
+
+# Stages that run side by side; the chat is downloaded while the video downloads
+PARALLEL_STAGE_GROUPS = [["download", "chat"]]
+
+# "native" pages through the chat with several concurrent timeline ranges; "cli" uses TwitchDownloaderCLI
+CHAT_DOWNLOADER = "native"
+CHAT_DOWNLOAD_RANGES = 8
+CHAT_JSON_GZIP = True  # Store the raw chat JSON gzip-compressed (<id>_chat.json.gz)
+
+# How many VODs may be in flight at once. Downloads of later VODs overlap with the transcription
+# of earlier ones; transcription itself runs one VOD at a time.
+MAX_CONCURRENT_VODS = 2
+
+# With batched inference (WHISPER_BATCH_SIZE), VODs waiting for transcription at the same time are
+# decoded together in one batched call, up to this much audio per call
+TRANSCRIPTION_GROUP_MAX_SECONDS = 4 * 3600
+
+# Per-channel voice-activity detection settings, e.g.
+# {"default": {"min_silence_duration_ms": 2000}, "channels": {"some_channel": {"threshold": 0.35}}}
+VAD_SETTINGS_FILE = os.path.join(BASE_TRANSCRIPTS_FOLDER, "vad_settings.json")
+VAD_REPORT_SUFFIX = "_vad.json"
+
+# Repetition loops cut out of a transcription (see repetition_guard.py)
+LOOP_REPORT_SUFFIX = "_loops.json"
+
+# Sequential transcriptions checkpoint their progress this often, so an interrupted VOD resumes
+# where it stopped instead of starting over. Decoding resumes slightly before the checkpoint so
+# the first words after it are heard in context; the overlap is dropped again.
+TRANSCRIPTION_CHECKPOINT_SECONDS = 60
+TRANSCRIPTION_CHECKPOINT_SUFFIX = "_transcribe_checkpoint.json"
+RESUME_OVERLAP_SECONDS = 2.0
+
+# Record per-word timings in the segment store. Costs extra decoding time.
+WORD_TIMESTAMPS = False
+
+# Sequential transcriptions decode greedily first and re-decode with beam search only the
+# segments whose scores fall outside the bounds in two_pass_decode.py. Stays off until
+# benchmarks/bench_two_pass.py has measured the speedup on the benchmark set.
+TWO_PASS_DECODING = False
+
+# Before a VOD is transcribed, the language of a few speech windows spread across it is detected
+# (see language_gate.py). Below MIN_ENGLISH_RATIO English windows, "skip" dead-letters the VOD as
+# not_english (requeuing it forces transcription) and "flag" transcribes it anyway; None turns the
+# gate off. The decision is stored in the VODs CSV.
+LANGUAGE_GATE_ACTION = "skip"
+MIN_ENGLISH_RATIO = 0.5
+LANGUAGE_DECISION_COLUMNS = ("language_decision", "english_ratio", "detected_languages")
+
+# Every VOD's audio is fingerprinted and matched against all audio processed before it (see
+# audio_fingerprint.py). Spans it shares with another VOD (a collab streamed on both channels, a
+# rerun) are listed in <id>_overlaps.json; sequential transcriptions copy the matched VOD's
+# segments for those spans instead of decoding them. Batched and multi-process transcriptions
+# only record the overlaps.
+FINGERPRINT_DEDUP = True
+FINGERPRINT_INDEX_FOLDER = os.path.join(BASE_TRANSCRIPTS_FOLDER, FINGERPRINT_INDEX_FOLDERNAME)
+
+# Rendition passed to TwitchDownloaderCLI (e.g. "720p60" or "Audio"). None downloads the source.
+VOD_RENDITION = None
+
+# Disk admission control: a VOD only starts downloading once its estimated scratch footprint
+# fits both the budget and the real free space left on the transcripts drive. Estimates can be
+# wrong and other programs share the drive, so every stage also waits while the free space is
+# below the reserve, and downloads are paused (where SIGSTOP exists) as soon as it drops below it.
+DISK_BUDGET_BYTES = 200 * 1024 ** 3
+DISK_FREE_RESERVE_BYTES = 10 * 1024 ** 3
+DISK_ADMISSION_POLL_SECONDS = 30
+
+# Approximate video bitrates in bits per second, used to estimate a VOD's scratch footprint
+RENDITION_BITRATES = {
+    "source": 8_000_000,
+    "1080p60": 6_000_000,
+    "1080p30": 4_500_000,
+    "720p60": 3_500_000,
+    "720p30": 2_500_000,
+    "480p30": 1_500_000,
+    "360p30": 700_000,
+    "160p30": 300_000,
+    "audio": 160_000,
+}
+MP3_BITRATE = 245_000  # ffmpeg -q:a 0 averages around 245 kbps
+CHAT_BYTES_PER_SECOND = 2_000  # Busy chats with embedded emote data
+DOWNLOAD_OVERHEAD_FACTOR = 2.0  # Downloaded parts and the joined MP4 exist side by side for a while
+
+# Bandwidth shared by all downloads. Edit the control file while the script runs to change the
+# limit (in megabytes per second) or the per-class weights, e.g.
+# {"limit_mb_per_s": 40, "weights": {"video": 6, "chat": 3, "api": 1}}
+BANDWIDTH_LIMIT_MB_PER_S = float(os.getenv('BANDWIDTH_LIMIT_MB_PER_S', 0))  # 0 means unlimited
+BANDWIDTH_CONTROL_FILE = os.path.join(BASE_TRANSCRIPTS_FOLDER, "bandwidth.json")
+VIDEO_DOWNLOAD_THREADS = 4
+
+# Live progress of downloads and conversions is sent to the website every few seconds;
+# a stage that makes no progress for a while is reported as stalled
+PROGRESS_REPORT_SECONDS = 5
+PROGRESS_METRICS_URL = "http://localhost:5000/update_metrics"
+PROGRESS_RATE_WINDOW_SECONDS = 15
+STALL_WARNING_SECONDS = 120
+DOWNLOADER_PROGRESS_PATTERN = re.compile(r"\[STATUS\].*?(\d+(?:\.\d+)?)%")
+
+# Failed VODs are tracked across runs; VODs that keep failing are moved to the dead-letter table,
+# which the scheduler skips until they are requeued with: python script-that-will-work.py --requeue <vod_id>
+VOD_FAILURES_JSON = os.path.join(BASE_TRANSCRIPTS_FOLDER, "vod_failures.json")
+DEAD_LETTER_CSV = os.path.join(BASE_TRANSCRIPTS_FOLDER, "dead_letter_vods.csv")
+DEAD_LETTER_FIELDS = ["vod_id", "url", "channel_name", "title", "failure_class", "stage", "failed_runs", "last_error", "dead_lettered_at"]
+
+# Per failure class: how often a stage is retried within a run, the exponential backoff between
+# retries (seconds), and after how many failed runs the VOD is dead-lettered
+RETRY_POLICIES = {
+    "transient_network": {"retries": 5, "base_delay": 10, "max_delay": 300, "dead_letter_after": 5},
+    "rate_limited": {"retries": 4, "base_delay": 60, "max_delay": 900, "dead_letter_after": 10},
+    "vod_missing": {"retries": 0, "base_delay": 0, "max_delay": 0, "dead_letter_after": 1},
+    "decoder_error": {"retries": 1, "base_delay": 5, "max_delay": 5, "dead_letter_after": 2},
+    "transcription_error": {"retries": 1, "base_delay": 30, "max_delay": 30, "dead_letter_after": 3},
+    "not_english": {"retries": 0, "base_delay": 0, "max_delay": 0, "dead_letter_after": 1},
+    # Each retry first waits for the free disk reserve (see wait_for_disk_reserve)
+    "disk_full": {"retries": 5, "base_delay": 60, "max_delay": 600, "dead_letter_after": 10},
+    # Rejected credentials fail every VOD alike: the run stops and no VOD is charged with it
+    "auth_failed": {"retries": 0, "base_delay": 0, "max_delay": 0, "dead_letter_after": None},
+}
+
+# Failure class assumed for errors that carry no better hint, by the stage they happened in
+STAGE_FAILURE_CLASSES = {
+    "download": "transient_network",
+    "chat": "transient_network",
+    "extract": "decoder_error",
+    "transcribe": "transcription_error",
+    "finalize": "transient_network",
+}
+
+# Only the lines a downloader prints to report an error are classified; progress lines and
+# other tool messages are ignored
+DOWNLOADER_ERROR_LINE_PATTERN = re.compile(r"\[ERROR\]|unhandled exception|\b[\w.]*(?:Exception|Error):")
+
+# Patterns in downloader error lines that identify the failure class, checked in order. A VOD
+# that looks missing is confirmed with the Helix videos endpoint before it is dead-lettered.
+FAILURE_OUTPUT_PATTERNS = [
+    ("disk_full", re.compile(r"no space left on device|not enough space on the disk|disk (?:is )?full", re.IGNORECASE)),
+    ("rate_limited", re.compile(r"\b429\b|too many requests|rate.?limit", re.IGNORECASE)),
+    ("transient_network", re.compile(r"\b(?:500|502|503|504)\b|timed? ?out|connection|network|socket|ssl|unreachable|reset by peer", re.IGNORECASE)),
+    ("auth_failed", re.compile(r"\b401\b|unauthorized|invalid oauth", re.IGNORECASE)),
+    ("vod_missing", re.compile(r"\b(?:403|404|410)\b|invalid vod|vod (?:is )?(?:not found|deleted|unavailable|expired)|sub(?:scriber)?-only|insufficient access", re.IGNORECASE)),
+]
+
 # Shared elapsed time variable and timer control
 elapsed_time = 0.0
 timer_running = True
@@ -78,7 +250,8 @@ def update_website_with_progress(vod_id, status):
             "total_vods": len(all_vods),
             "vod_duration": format_duration(vod_duration_seconds),
             "total_audio_left": format_duration(total_audio_left_seconds),
-            "status": status
+            "status": status,
+            "bandwidth_mb_per_s": governor.report()
         }
 
         print(f"Sending progress update to the website for VOD {vod_id} with status '{status}'...")
@@ -98,6 +271,115 @@ def update_website_with_progress(vod_id, status):
     except Exception as e:
         print(f"An error occurred while updating the website for VOD {vod_id}: {e}")
 
+# Live metrics of running stages, keyed by (vod_id, stage)
+stage_metrics = {}
+stage_metrics_lock = threading.Lock()
+
+
+def start_stage_metrics(vod_id, stage, total_media_seconds=None):
+    """Starts tracking the progress of a stage. `total_media_seconds` enables percentages."""
+    now = time()
+    with stage_metrics_lock:
+        stage_metrics[(vod_id, stage)] = {
+            "started_at": now,
+            "last_progress_at": now,
+            "total_media_seconds": total_media_seconds,
+            "bytes_done": 0,
+            "media_seconds_done": 0.0,
+            "samples": deque([(now, 0, 0.0)]),
+        }
+
+
+def update_stage_metrics(vod_id, stage, bytes_done=None, media_seconds_done=None):
+    """
+    Records the progress of a running stage.
+
+    Args:
+        vod_id (str): The VOD ID.
+        stage (str): The stage name.
+        bytes_done (int): Bytes downloaded or written so far.
+        media_seconds_done (float): Seconds of the VOD timeline processed so far.
+    """
+    now = time()
+    with stage_metrics_lock:
+        metrics = stage_metrics.get((vod_id, stage))
+        if metrics is None:
+            return
+        progressed = False
+        if bytes_done is not None and bytes_done > metrics["bytes_done"]:
+            metrics["bytes_done"] = bytes_done
+            progressed = True
+        if media_seconds_done is not None and media_seconds_done > metrics["media_seconds_done"]:
+            metrics["media_seconds_done"] = media_seconds_done
+            progressed = True
+        if progressed:
+            metrics["last_progress_at"] = now
+            metrics["samples"].append((now, metrics["bytes_done"], metrics["media_seconds_done"]))
+            while now - metrics["samples"][0][0] > PROGRESS_RATE_WINDOW_SECONDS and len(metrics["samples"]) > 2:
+                metrics["samples"].popleft()
+
+
+def finish_stage_metrics(vod_id, stage):
+    """Stops tracking a stage."""
+    with stage_metrics_lock:
+        stage_metrics.pop((vod_id, stage), None)
+
+
+def get_stage_metrics_snapshot():
+    """
+    Computes the derived metrics of every running stage.
+
+    Returns:
+        dict: {vod_id: {stage: metrics}} where metrics has bytes_done, media_seconds_done,
+        percent, mb_per_s (over the recent window), realtime_factor and stalled.
+    """
+    now = time()
+    snapshot = {}
+    with stage_metrics_lock:
+        for (vod_id, stage), metrics in stage_metrics.items():
+            first_time, first_bytes, first_media = metrics["samples"][0]
+            window = max(now - first_time, 1e-6)
+            elapsed = max(now - metrics["started_at"], 1e-6)
+            total_media_seconds = metrics["total_media_seconds"]
+
+            snapshot.setdefault(vod_id, {})[stage] = {
+                "bytes_done": metrics["bytes_done"],
+                "media_seconds_done": round(metrics["media_seconds_done"], 1),
+                "percent": round(100 * metrics["media_seconds_done"] / total_media_seconds, 1) if total_media_seconds else None,
+                "mb_per_s": round((metrics["bytes_done"] - first_bytes) / window / 1024 ** 2, 2),
+                "realtime_factor": round((metrics["media_seconds_done"] - first_media) / window, 2),
+                "average_realtime_factor": round(metrics["media_seconds_done"] / elapsed, 2),
+                "stalled": now - metrics["last_progress_at"] > STALL_WARNING_SECONDS,
+            }
+    return snapshot
+
+
+def progress_reporter_thread():
+    """
+    Sends the live metrics of every running stage to the website every PROGRESS_REPORT_SECONDS.
+
+    Each report replaces the previous one, so finished stages drop off the page; the status
+    line is left to update_website_with_progress. Only a change in whether the website can be
+    reached is logged, not every report.
+    """
+    reachable = True
+    while timer_running:
+        sleep(PROGRESS_REPORT_SECONDS)
+        snapshot = get_stage_metrics_snapshot()
+        for vod_id, metrics in snapshot.items():
+            for stage, stage_values in metrics.items():
+                if stage_values["stalled"]:
+                    print(f"Warning: stage '{stage}' of VOD {vod_id} has made no progress for {STALL_WARNING_SECONDS} seconds.")
+        try:
+            requests.post(PROGRESS_METRICS_URL, json=snapshot, timeout=PROGRESS_REPORT_SECONDS).raise_for_status()
+            if not reachable:
+                print("Sending live stage metrics to the website again.")
+            reachable = True
+        except requests.exceptions.RequestException as e:
+            if reachable:
+                print(f"Could not send live stage metrics to the website: {e}")
+            reachable = False
+
 # Function to get the current elapsed time
 def get_elapsed_time():
     return elapsed_time
@@ -108,18 +390,6 @@ def stop_timer():
     timer_running = False
     timer.join()
 
-# Singleton Whisper model instance
-_model_instance = None
-
-def get_whisper_model():
-    global _model_instance
-    if _model_instance is None:
-        print("Initializing Whisper model...")
-        cuda_bin_path = r"C:\Program Files\NVIDIA GPU Computing Toolkit\CUDA\v12.6\bin"
-        preload_cudnn_dlls(cuda_bin_path)  # Preload cuDNN DLLs for CUDA support
-        _model_instance = WhisperModel("distil-large-v3", device="cuda", compute_type="float32")
-    return _model_instance
-
 def clean_url(url):
     """Function to clean and normalize Twitch URLs."""
     if url:
@@ -210,140 +480,357 @@ def download_vtuber_wiki_page(username, vtuber_page_url):
     except Exception as e:
         print(f"Failed to download Fandom page for {username}: {e}")
 
-def load_dll(dll_path):
-    """Helper function to load a DLL."""
-    try:
-        print(f"Loading DLL: {dll_path}")
-        ctypes.WinDLL(dll_path)
-        print(f"Successfully loaded DLL: {dll_path}")
-    except OSError as e:
-        print(f"Failed to load DLL: {dll_path}")
-        raise RuntimeError(f"Failed to load {dll_path}: {e}")
-
-
-def preload_cudnn_dlls(cuda_bin_path):
-    """Preload all required cuDNN DLLs."""
-    print(f"Preloading cuDNN DLLs from: {cuda_bin_path}")
-    required_dlls = [
-        "cudnn_ops64_9.dll",
-        "cudnn_ops_infer64_9.dll",
-        "cudnn_cnn64_9.dll",
-        "cublas64_12.dll",
-        "cudnn_engines_precompiled64_9.dll",
-        "cudnn_engines_runtime_compiled64_9.dll",
-        "cudnn_heuristic64_9.dll",
-    ]
-
-    for dll in required_dlls:
-        dll_path = os.path.join(cuda_bin_path, dll)
-        if not os.path.exists(dll_path):
-            print(f"Error: {dll} not found in {cuda_bin_path}.")
-            raise FileNotFoundError(f"{dll} not found in {cuda_bin_path}. Please verify the installation.")
-        print(f"Found DLL: {dll_path}")
-        load_dll(dll_path)
-
-
-def transcribe(audio_file, device="cuda", output_dir=None):
+def get_transcription_paths(audio_file, output_dir=None):
     """
-    Transcribes an audio file using the faster-whisper library with timing.
-
-    Args:
-        audio_file (str): Path to the audio file to transcribe.
-        device (str): Device to use for transcription, e.g., "cpu" or "cuda".
-        output_dir (str): Directory to save transcription files. If None, defaults to the audio file's directory.
+    Returns the paths of the files `transcribe` writes for an audio file.
 
     Returns:
-        tuple: Paths to the generated transcription files (formatted, raw).
+        tuple: (formatted transcript, raw transcript, segment store)
     """
-    print(f"Starting transcription for: {audio_file}")
-    model = get_whisper_model()
-
     if output_dir is None:
         output_dir = os.path.dirname(audio_file)
     os.makedirs(output_dir, exist_ok=True)
 
     file_basename = os.path.splitext(os.path.basename(audio_file))[0]
-    formatted_output_file = os.path.join(output_dir, f"formatted_{file_basename}_transcription.txt")
-    raw_output_file = os.path.join(output_dir, f"{file_basename}_raw_transcript.txt")
+    return (
+        os.path.join(output_dir, f"formatted_{file_basename}_transcription.txt"),
+        os.path.join(output_dir, f"{file_basename}_raw_transcript.txt"),
+        os.path.join(output_dir, f"{file_basename}{SEGMENT_STORE_SUFFIX}"),
+    )
 
-    # Record start time
-    transcription_start_time = get_elapsed_time()
-    print("Beginning transcription...")
-    segments, info = model.transcribe(audio_file, beam_size=5, language="en")
-    segments = list(segments)  # Ensure segments can be iterated over multiple times
-    print("Transcription completed.")
-    transcription_end_time = get_elapsed_time()
 
-    # Calculate task duration
-    task_duration = transcription_end_time - transcription_start_time
-    print(f"Transcription time: {task_duration:.2f} seconds")
+def write_transcription(segments, language, language_probability, audio_duration_seconds, output_paths, transcription_start_time,
+                        checkpoint_path=None, checkpoint_info=None, resume_state=None):
+    """
+    Writes the formatted transcript, raw transcript and segment store of a transcription in
+    one pass, as the segments are produced.
 
-    # New logic for the formatted transcript
-    print(f"\nDetected language: {info.language} (probability: {info.language_probability:.6f})\n")
-    print(f"Writing formatted transcription to: {formatted_output_file}")
-    try:
-        with open(formatted_output_file, "w", encoding="utf-8") as file:
-            file.write(f"Detected language: {info.language} (probability: {info.language_probability:.6f})\n\n")
-            prev_end_time = 0.0
-            buffer = ""
-
-            for idx, segment in enumerate(segments, start=1):
-                start_time = segment.start
-                end_time = segment.end
-                text = segment.text.strip()
-
-                print(text)
-
-                if start_time - prev_end_time > 1.5:  # Silence threshold
-                    if buffer:
-                        file.write(buffer.strip() + "\n")
-                        file.write(f"\n({idx - 1} end - {prev_end_time:.2f})\n")
-                        file.write(f"({idx} start - {start_time:.2f})\n\n")
-                    buffer = ""
-
-                buffer += f"{text} "
-                prev_end_time = end_time
-
-            if buffer:
-                file.write(buffer.strip() + "\n")
-                file.write(f"\n({len(segments)} end - {prev_end_time:.2f})\n")
-        print(f"Formatted transcription successfully written to: {formatted_output_file}")
-    except Exception as e:
-        print(f"Error while writing formatted transcription: {e}")
-        raise
+    With a checkpoint path, the writer state and the audio position are checkpointed every
+    TRANSCRIPTION_CHECKPOINT_SECONDS; the checkpoint is removed once the transcription is complete.
 
-    # Old logic for the formatted transcript (moved to raw transcript)
-    print(f"Writing raw transcription to: {raw_output_file}")
+    Args:
+        segments (iterable): The Whisper segments, in time order. A generator is consumed as
+            the decoder produces it.
+        language (str): Detected language.
+        language_probability (float): Probability of the detected language.
+        audio_duration_seconds (float): Length of the audio.
+        output_paths (tuple): (formatted, raw, segment store) paths from get_transcription_paths.
+        transcription_start_time (float): time() when the transcription started, for the metrics.
+        checkpoint_path (str): Where to checkpoint progress, or None.
+        checkpoint_info (dict): Extra fields stored in every checkpoint (e.g. the audio file size).
+        resume_state (dict): Writer state from a checkpoint to continue from.
+    """
+    formatted_output_file, raw_output_file, segments_output_file = output_paths
+
+    print(f"\nDetected language: {language} (probability: {language_probability:.6f})\n")
+    print(f"Writing transcription to: {formatted_output_file}, {raw_output_file} and {segments_output_file}")
     try:
-        with open(raw_output_file, "w", encoding="utf-8") as raw_file:
-            prev_end_time = 0.0
+        with TranscriptWriter(formatted_output_file, raw_output_file, segments_output_file,
+                              language, language_probability, resume_state=resume_state) as writer:
+            last_report = last_checkpoint = time()
             for segment in segments:
-                start_time_segment = segment.start
-                text = segment.text.strip()
-
-                if start_time_segment - prev_end_time > 1.5:  # Silence threshold
-                    raw_file.write("\n")
-
-                raw_file.write(f"{text} ")
-                prev_end_time = segment.end
-        print(f"Raw transcription successfully written to: {raw_output_file}")
+                writer.write(segment)
+                if checkpoint_path and time() - last_checkpoint >= TRANSCRIPTION_CHECKPOINT_SECONDS:
+                    write_json_atomically(checkpoint_path, {
+                        **(checkpoint_info or {}),
+                        "language": language,
+                        "language_probability": language_probability,
+                        "audio_offset": writer.prev_end_time,
+                        "writer": writer.get_state(),
+                    })
+                    last_checkpoint = time()
+                if time() - last_report >= PROGRESS_REPORT_SECONDS:
+                    elapsed = time() - transcription_start_time
+                    print(f"Transcribed {segment.end:.0f} of {audio_duration_seconds:.0f} seconds "
+                          f"({segment.end / elapsed:.1f}x realtime, {writer.segment_count} segments)")
+                    last_report = time()
+        print(f"Transcription successfully written to: {formatted_output_file}")
     except Exception as e:
-        print(f"Error while writing raw transcription: {e}")
+        print(f"Error while writing transcription: {e}")
         raise
+    if checkpoint_path:
+        remove_if_exists(checkpoint_path)
 
     total_elapsed_time = time() - transcription_start_time
-    audio_duration_seconds = info.duration
-    total_words = sum(len(segment.text.split()) for segment in segments)
-    transcription_seconds_per_audio_second = total_elapsed_time / audio_duration_seconds
+    transcription_seconds_per_audio_second = total_elapsed_time / audio_duration_seconds if audio_duration_seconds else 0.0
 
     # Print statistics
     print("\nTranscription Metrics:")
     print(f"Total time taken: {total_elapsed_time:.2f} seconds")
     print(f"Audio duration: {audio_duration_seconds:.2f} seconds")
-    print(f"Total words transcribed: {total_words}")
+    print(f"Total words transcribed: {writer.word_count}")
     print(f"Transcription seconds per audio second: {transcription_seconds_per_audio_second:.2f}")
 
-    return formatted_output_file, raw_output_file
+
+def write_vad_report(report_path, audio_seconds, speech_seconds, vad_settings, speech_regions=None):
+    """Writes how much of the audio VAD let through to the decoder, and prints the savings."""
+    skipped_seconds = max(audio_seconds - speech_seconds, 0.0)
+    skipped_fraction = skipped_seconds / audio_seconds if audio_seconds else 0.0
+    print(f"VAD: decoded {speech_seconds:.0f} of {audio_seconds:.0f} seconds of audio, "
+          f"skipped {skipped_seconds:.0f} seconds ({skipped_fraction:.0%}).")
+    report = {
+        "audio_seconds": round(audio_seconds, 2),
+        "speech_seconds": round(speech_seconds, 2),
+        "skipped_seconds": round(skipped_seconds, 2),
+        "skipped_fraction": round(skipped_fraction, 4),
+        "settings": vad_settings,
+    }
+    if speech_regions is not None:
+        report["speech_regions"] = [[round(start, 2), round(end, 2)] for start, end in speech_regions]
+    write_json_atomically(report_path, report)
+
+
+def get_vad_report_path(audio_file, output_dir=None):
+    file_basename = os.path.splitext(os.path.basename(audio_file))[0]
+    return os.path.join(output_dir or os.path.dirname(audio_file), f"{file_basename}{VAD_REPORT_SUFFIX}")
+
+
+def write_loop_report(report_path, loop_regions):
+    """Writes the repetition loops that were cut out of a transcription."""
+    if loop_regions:
+        print(f"Cut {len(loop_regions)} repetition loops covering "
+              f"{sum(region['end'] - region['start'] for region in loop_regions):.0f} seconds.")
+    write_json_atomically(report_path, {"loop_count": len(loop_regions), "regions": loop_regions})
+
+
+def get_loop_report_path(audio_file, output_dir=None):
+    file_basename = os.path.splitext(os.path.basename(audio_file))[0]
+    return os.path.join(output_dir or os.path.dirname(audio_file), f"{file_basename}{LOOP_REPORT_SUFFIX}")
+
+
+def clip_speech_regions(speech_regions, from_seconds, to_seconds=None):
+    """The speech regions from a point on the timeline on (up to another point, if given)."""
+    if to_seconds is not None:
+        speech_regions = [(start, min(end, to_seconds)) for start, end in speech_regions if start < to_seconds]
+    return [(max(start, from_seconds), end) for start, end in speech_regions if end > from_seconds]
+
+
+def subtract_spans(speech_regions, spans):
+    """The speech regions with the (start, end) spans cut out of them."""
+    remaining = []
+    for start, end in speech_regions:
+        for span_start, span_end in sorted(spans):
+            if span_end <= start or span_start >= end:
+                continue
+            if span_start > start:
+                remaining.append((start, span_start))
+            start = span_end
+            if start >= end:
+                break
+        if start < end:
+            remaining.append((start, end))
+    return remaining
+
+
+def get_transcription_checkpoint_path(audio_file, output_dir=None):
+    file_basename = os.path.splitext(os.path.basename(audio_file))[0]
+    return os.path.join(output_dir or os.path.dirname(audio_file), f"{file_basename}{TRANSCRIPTION_CHECKPOINT_SUFFIX}")
+
+
+def load_transcription_checkpoint(checkpoint_path, audio_file, output_paths):
+    """
+    Loads a transcription checkpoint if it belongs to this audio file and the outputs it refers
+    to are still intact; otherwise the checkpoint is discarded.
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as file:
+            checkpoint = json.load(file)
+        if checkpoint["audio_size"] == os.path.getsize(audio_file) and can_resume_writer(checkpoint["writer"], output_paths):
+            return checkpoint
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring unreadable transcription checkpoint {checkpoint_path}: {e}")
+    remove_if_exists(checkpoint_path)
+    return None
+
+
+def skip_resumed_overlap(segments, resume_from, previous_text):
+    """
+    Drops the segments a resumed transcription decodes again in its overlap with the part that
+    was already written, and words at the seam that repeat the last written segment.
+    """
+    at_seam = True
+    for segment in segments:
+        if (segment.start + segment.end) / 2 < resume_from:
+            continue
+        if at_seam:
+            at_seam = False
+            text = remove_repeated_words(previous_text, segment.text.strip())
+            if not text:
+                continue
+            segment = replace_segment(segment, text=f" {text}")
+        yield segment
+
+
+def transcribe(audio_file, device=None, output_dir=None, vad_settings=None, reused_spans=None):
+    """
+    Transcribes an audio file using the faster-whisper library with timing.
+
+    Speech regions are found with VAD first and only those are decoded (passed to Whisper as
+    clip timestamps, so segment times stay on the original timeline). With WHISPER_PROCESSES
+    set, the audio is cut into chunks at quiet points and transcribed by that many worker
+    processes; with WHISPER_BATCH_SIZE set, the file is decoded by the batched pipeline
+    instead of one 30-second window at a time. Otherwise, with WHISPER_DAEMON_SOCKET set, the
+    decoding is done by the transcription daemon (see transcribe_daemon.py) if it is running.
+    Repetition loops are cut out of the segments in every mode; sequential decoding also
+    restarts past them (see repetition_guard.py). Sequential decoding skips the reused spans
+    and writes their segments in place, and with TWO_PASS_DECODING set decodes greedily and
+    re-decodes only low-confidence segments with beam search (see two_pass_decode.py).
+
+    Args:
+        audio_file (str): Path to the audio file to transcribe.
+        device (str): Device to load the model on if it is not loaded yet: "auto", "cpu" or "cuda".
+            Defaults to WHISPER_DEVICE (see whisper_backend.py).
+        output_dir (str): Directory to save transcription files. If None, defaults to the audio file's directory.
+        vad_settings (dict): VAD settings (see whisper_backend.load_vad_settings); None uses the defaults.
+        reused_spans (list): Spans of the audio whose segments are taken from another VOD's
+            transcript, as dicts with start, end and segments (see find_reusable_transcripts).
+
+    Returns:
+        tuple: Paths to the generated transcription files (formatted, raw, segments).
+    """
+    if get_batch_size():
+        return transcribe_many([(audio_file, output_dir, vad_settings)], device)[0]
+
+    vad_settings = vad_settings or load_vad_settings(None)
+    print(f"Starting transcription for: {audio_file}")
+    output_paths = get_transcription_paths(audio_file, output_dir)
+
+    # Record start time
+    transcription_start_time = time()
+    audio = decode_audio(audio_file, sampling_rate=SAMPLING_RATE)
+    audio_duration_seconds = len(audio) / SAMPLING_RATE
+
+    worker_processes = get_worker_processes()
+    if worker_processes > 1:
+        print(f"Beginning transcription with {worker_processes} worker processes...")
+        segments, language, speech_seconds = transcribe_parallel(audio, vad_settings, worker_processes, device,
+                                                                 word_timestamps=WORD_TIMESTAMPS)
+        language, language_probability = language or ("en", 1.0)
+        write_vad_report(get_vad_report_path(audio_file, output_dir), audio_duration_seconds, speech_seconds, vad_settings)
+        del audio
+        print(f"Transcription completed in {time() - transcription_start_time:.2f} seconds")
+        loop_regions = []
+        write_transcription(guard_repetition_loops(segments, loop_regions=loop_regions), language, language_probability,
+                            audio_duration_seconds, output_paths, transcription_start_time)
+        write_loop_report(get_loop_report_path(audio_file, output_dir), loop_regions)
+        return output_paths
+
+    # A running transcription daemon already has the model loaded; otherwise load it here
+    daemon_socket = get_daemon_socket()
+    daemon = get_daemon_health(daemon_socket) if daemon_socket else None
+    if daemon:
+        print(f"Using the transcription daemon at {daemon_socket} ({daemon['device']}, {daemon['compute_type']})")
+    else:
+        if daemon_socket:
+            print(f"No transcription daemon is answering on {daemon_socket}; loading the model in this process.")
+        model = get_whisper_model(device)
+        profile = get_model_profile()
+        print(f"Using Whisper on {profile['device']} ({profile['compute_type']})")
+    speech_regions = get_speech_regions(audio, vad_settings)
+    speech_seconds = sum(end - start for start, end in speech_regions)
+    write_vad_report(get_vad_report_path(audio_file, output_dir), audio_duration_seconds, speech_seconds,
+                     vad_settings, speech_regions)
+    reused_segments = []
+    if reused_spans:
+        speech_regions = subtract_spans(speech_regions, [(span["start"], span["end"]) for span in reused_spans])
+        reused_segments = [segment for span in reused_spans for segment in span["segments"]]
+        print(f"Reusing {len(reused_segments)} segments covering {speech_seconds - sum(end - start for start, end in speech_regions):.0f} "
+              f"seconds of speech from {len(reused_spans)} overlapping transcripts.")
+
+    def decode_speech(from_seconds, to_seconds=None, **options):
+        """Decodes the speech regions from a point on the timeline; returns (segments, info or None)."""
+        clips = merge_speech_regions(clip_speech_regions(speech_regions, from_seconds, to_seconds))
+        clip_timestamps = [timestamp for clip in clips for timestamp in clip]
+        if not clip_timestamps:
+            return [], None  # Nothing but silence
+        # Segments are decoded lazily; they are written to disk as the generator produces them
+        if daemon:
+            return transcribe_remote(audio_file, clip_timestamps=clip_timestamps, socket_path=daemon_socket,
+                                     two_pass=TWO_PASS_DECODING, **options)
+        # Only the audio the clips span is decoded (a resume, a restart past a loop, a re-decoded run)
+        return transcribe_clips(model, audio, clip_timestamps, **options)
+
+    checkpoint_path = get_transcription_checkpoint_path(audio_file, output_dir)
+    checkpoint = load_transcription_checkpoint(checkpoint_path, audio_file, output_paths)
+    decode_options = {"beam_size": 5, "language": "en", "word_timestamps": WORD_TIMESTAMPS}
+    two_pass_stats = {}
+    if TWO_PASS_DECODING and not daemon:  # The daemon runs both passes itself
+        beam_decode = decode_speech
+
+        def decode_speech(from_seconds, **options):
+            """Decodes greedily, re-decoding low-confidence segments with the beam search options."""
+            segments, info = beam_decode(from_seconds, **{**options, **FIRST_PASS_OPTIONS})
+            redecode = lambda start, end, prompt: beam_decode(start, end, **{**options, "initial_prompt": prompt})[0]
+            return redecode_low_confidence(segments, redecode, two_pass_stats), info
+    decode_from = 0.0
+    loop_regions = []
+    if checkpoint:
+        # Only decode what comes after the checkpoint (plus the overlap), prompted with the last written text
+        resume_from = checkpoint["audio_offset"]
+        print(f"Resuming transcription from its checkpoint at {resume_from:.1f} seconds...")
+        decode_from = max(resume_from - RESUME_OVERLAP_SECONDS, 0.0)
+        loop_regions = [region for region in checkpoint.get("loop_regions", []) if region["start"] < resume_from]
+
+    print("Beginning transcription...")
+    resume_prompt = " ".join(checkpoint["writer"]["recent_texts"]) if checkpoint else None
+    segments, info = decode_speech(decode_from, initial_prompt=resume_prompt or None, **decode_options)
+    language, language_probability = (info.language, info.language_probability) if info else ("en", 1.0)
+    # A repetition loop is cut and decoding restarts past it, without the looping text as the prompt
+    segments = guard_repetition_loops(segments, lambda seconds: decode_speech(seconds, **decode_options)[0], loop_regions)
+    if reused_segments:
+        segments = merge_reused_segments(segments, reused_segments)
+
+    if checkpoint:
+        segments = skip_resumed_overlap(segments, checkpoint["audio_offset"], resume_prompt)
+        language, language_probability = checkpoint["language"], checkpoint["language_probability"]
+
+    write_transcription(
+        segments, language, language_probability, audio_duration_seconds, output_paths, transcription_start_time,
+        checkpoint_path=checkpoint_path,
+        checkpoint_info={"audio_size": os.path.getsize(audio_file), "loop_regions": loop_regions},
+        resume_state=checkpoint["writer"] if checkpoint else None,
+    )
+    write_loop_report(get_loop_report_path(audio_file, output_dir), loop_regions)
+    if two_pass_stats:
+        print(format_two_pass_stats(two_pass_stats))
+    print("Transcription completed.")
+    return output_paths
+
+
+def transcribe_many(jobs, device=None):
+    """
+    Transcribes several audio files together with the batched pipeline, so short VODs share
+    batches instead of each leaving them half empty.
+
+    Args:
+        jobs (list): (audio_file, output_dir, vad_settings) tuples.
+        device (str): Device to load the model on if it is not loaded yet.
+
+    Returns:
+        list: (formatted, raw, segments) paths for every job, in order.
+    """
+    audio_files = [audio_file for audio_file, _, _ in jobs]
+    vad_settings = [settings or load_vad_settings(None) for _, _, settings in jobs]
+    print(f"Starting batched transcription (batch size {get_batch_size() or 16}) for: {', '.join(audio_files)}")
+    transcription_start_time = time()
+    results, info = transcribe_batched(audio_files, device=device, vad_settings=vad_settings, word_timestamps=WORD_TIMESTAMPS)
+    profile = get_model_profile()
+    print(f"Batched transcription on {profile['device']} ({profile['compute_type']}) completed in "
+          f"{time() - transcription_start_time:.2f} seconds for {sum(result[1] for result in results):.0f} seconds of audio.")
+
+    language, language_probability = (info.language, info.language_probability) if info else ("en", 1.0)
+    all_output_paths = []
+    for (audio_file, output_dir, _), settings, (segments, duration, speech_seconds) in zip(jobs, vad_settings, results):
+        output_paths = get_transcription_paths(audio_file, output_dir)
+        write_vad_report(get_vad_report_path(audio_file, output_dir), duration, speech_seconds, settings)
+        loop_regions = []
+        write_transcription(guard_repetition_loops(segments, loop_regions=loop_regions), language, language_probability,
+                            duration, output_paths, transcription_start_time)
+        write_loop_report(get_loop_report_path(audio_file, output_dir), loop_regions)
+        all_output_paths.append(output_paths)
+    return all_output_paths
 
 def calculate_vod(mp4_duration):
     """
@@ -442,6 +929,22 @@ def format_duration(seconds):
 
 
 
+def governed_get(url, traffic_class="api", **kwargs):
+    """
+    Performs a GET request and charges the response size to the bandwidth governor.
+
+    Args:
+        url (str): The URL to fetch.
+        traffic_class (str): The governor traffic class to charge, "api" by default.
+        **kwargs: Passed through to requests.get.
+
+    Returns:
+        requests.Response: The response.
+    """
+    response = requests.get(url, **kwargs)
+    governor.acquire(traffic_class, len(response.content))
+    return response
+
 # Function to get Twitch user ID
 def get_user_id(channel_name, client_id, access_token):
     try:
@@ -453,7 +956,7 @@ def get_user_id(channel_name, client_id, access_token):
             'Authorization': f'Bearer {access_token}'
         }
         params = {'login': channel_name}
-        response = requests.get(url, headers=headers, params=params)
+        response = governed_get(url, headers=headers, params=params)
         response.raise_for_status()
         data = response.json()
         if data['data']:
@@ -490,7 +993,7 @@ def get_recent_vods(user_id, client_id, access_token):
             'type': 'archive',
             'first': 100  # Fetch as many VODs as allowed by Twitch API (most vtubers don't keep more than this available, so pagination isn't worth the effort)
         }
-        response = requests.get(url, headers=headers, params=params)
+        response = governed_get(url, headers=headers, params=params)
         response.raise_for_status()
         vod_data = response.json().get('data', [])
 
@@ -534,7 +1037,7 @@ def get_follower_count(broadcaster_id, client_id, access_token):
             'Authorization': f'Bearer {access_token}'
         }
         params = {'broadcaster_id': broadcaster_id}
-        response = requests.get(url, headers=headers, params=params)
+        response = governed_get(url, headers=headers, params=params)
         response.raise_for_status()
         data = response.json()
         follower_count = data.get('total', 0)
@@ -602,8 +1105,10 @@ def load_verified_vtubers():
 
 # Function to save VODs to CSV
 def save_vods(vods):
+    # Columns such as the language decision are only set on some VODs
+    fieldnames = list(dict.fromkeys(key for vod in vods for key in vod))
     with open(VODS_CSV, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.DictWriter(file, fieldnames=vods[0].keys())
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
         writer.writeheader()
         writer.writerows(vods)
     print(f"Saved {len(vods)} valid VODs to {VODS_CSV}")
@@ -622,103 +1127,1031 @@ def load_vods():
         return vods
     return []
 
+def classify_failure(error, stage):
+    """
+    Sorts an exception raised by a pipeline stage into a failure class.
+
+    Args:
+        error (Exception): The exception raised by the stage.
+        stage (str): The stage that raised it.
+
+    Returns:
+        str: One of the keys of RETRY_POLICIES.
+    """
+    if isinstance(error, VodFailure):
+        return error.failure_class
+
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status_code = error.response.status_code
+        if status_code == 429:
+            return "rate_limited"
+        if status_code == 401:
+            return "auth_failed"
+        if status_code in (403, 404, 410):
+            return "vod_missing"
+        return "transient_network"
+
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError, TimeoutError)):
+        return "transient_network"
+
+    if isinstance(error, OSError) and error.errno == errno.ENOSPC:
+        return "disk_full"
+
+    # Downloader failures are recognised from the error lines the downloader printed
+    if isinstance(error, subprocess.CalledProcessError) and stage in ("download", "chat"):
+        error_lines = "\n".join(line for line in (error.output or "").splitlines() if DOWNLOADER_ERROR_LINE_PATTERN.search(line))
+        for failure_class, pattern in FAILURE_OUTPUT_PATTERNS:
+            if pattern.search(error_lines):
+                return failure_class
+
+    return STAGE_FAILURE_CLASSES[stage]
+
+
+def confirm_vod_missing(vod_id, stage):
+    """
+    Checks a VOD that looks missing against the Helix videos endpoint.
+
+    Returns:
+        str: "vod_missing" if Helix no longer lists the VOD, "auth_failed" if Helix rejects
+        the credentials, otherwise the stage's default failure class (the VOD still exists, or
+        it could not be checked).
+    """
+    try:
+        response = governed_get("https://api.twitch.tv/helix/videos", params={"id": vod_id}, timeout=30,
+                                headers={"Client-ID": client_id, "Authorization": f"Bearer {access_token}"})
+    except requests.exceptions.RequestException as e:
+        print(f"Could not confirm whether VOD {vod_id} still exists: {e}")
+        return STAGE_FAILURE_CLASSES[stage]
+    if response.status_code == 401:
+        return "auth_failed"
+    if response.status_code == 404 or (response.ok and not response.json().get("data")):
+        return "vod_missing"
+    if response.ok:
+        print(f"VOD {vod_id} is still listed by Twitch; not treating it as missing.")
+    return STAGE_FAILURE_CLASSES[stage]
+
+
+def get_retry_delay(error, failure_class, attempt):
+    """
+    Returns how many seconds to wait before retrying a failed stage. Exponential backoff with
+    jitter, or the server's Retry-After when a rate limit response carries one.
+    """
+    policy = RETRY_POLICIES[failure_class]
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if failure_class == "rate_limited" and retry_after and retry_after.isdigit():
+        return min(int(retry_after), policy["max_delay"])
+
+    delay = min(policy["base_delay"] * 2 ** attempt, policy["max_delay"])
+    return delay * random.uniform(0.8, 1.2)
+
+
+failure_log_lock = threading.Lock()
+run_aborted = threading.Event()  # Set on failures that would fail every remaining VOD alike
+
+
+def load_vod_failures():
+    """Loads the per-VOD failure history, keyed by VOD ID."""
+    if os.path.exists(VOD_FAILURES_JSON):
+        with open(VOD_FAILURES_JSON, "r", encoding="utf-8") as file:
+            return json.load(file)
+    return {}
+
+
+def load_dead_letter_vods():
+    """
+    Loads the dead-letter table.
+
+    Returns:
+        dict: Dead-lettered VOD rows keyed by VOD ID.
+    """
+    if os.path.exists(DEAD_LETTER_CSV):
+        with open(DEAD_LETTER_CSV, "r", encoding="utf-8") as file:
+            return {row["vod_id"]: row for row in csv.DictReader(file)}
+    return {}
+
+
+def save_dead_letter_vods(dead_letter_vods):
+    """Writes the dead-letter table."""
+    os.makedirs(BASE_TRANSCRIPTS_FOLDER, exist_ok=True)
+    temp_path = f"{DEAD_LETTER_CSV}.tmp"
+    with open(temp_path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=DEAD_LETTER_FIELDS)
+        writer.writeheader()
+        writer.writerows(dead_letter_vods.values())
+    os.replace(temp_path, DEAD_LETTER_CSV)
+
+
+def record_vod_failure(vod, vod_id, stage, failure_class, error):
+    """
+    Records a VOD that failed this run and dead-letters it once its failure class has failed
+    more runs than the class's policy allows.
+
+    Returns:
+        bool: True if the VOD was moved to the dead-letter table.
+    """
+    with failure_log_lock:
+        failures = load_vod_failures()
+        record = failures.setdefault(vod_id, {"runs_by_class": {}, "history": []})
+        record["runs_by_class"][failure_class] = record["runs_by_class"].get(failure_class, 0) + 1
+        record["history"] = (record["history"] + [{
+            "failure_class": failure_class,
+            "stage": stage,
+            "error": str(error)[:500],
+            "failed_at": datetime.now(timezone.utc).isoformat(),
+        }])[-20:]
+        os.makedirs(BASE_TRANSCRIPTS_FOLDER, exist_ok=True)
+        write_json_atomically(VOD_FAILURES_JSON, failures)
+
+        failed_runs = record["runs_by_class"][failure_class]
+        if failed_runs < RETRY_POLICIES[failure_class]["dead_letter_after"]:
+            print(f"VOD {vod_id} failed with {failure_class} ({failed_runs} failed run(s)); it will be retried next run.")
+            return False
+
+        dead_letter_vods = load_dead_letter_vods()
+        dead_letter_vods[vod_id] = {
+            "vod_id": vod_id,
+            "url": vod['url'],
+            "channel_name": vod['channel_name'],
+            "title": vod['title'],
+            "failure_class": failure_class,
+            "stage": stage,
+            "failed_runs": failed_runs,
+            "last_error": str(error)[:500],
+            "dead_lettered_at": datetime.now(timezone.utc).isoformat(),
+        }
+        save_dead_letter_vods(dead_letter_vods)
+        print(f"VOD {vod_id} moved to the dead-letter table after {failed_runs} {failure_class} failure(s).")
+        return True
+
+
+def clear_vod_failures(vod_id):
+    """Forgets the failure history of a VOD that processed successfully."""
+    with failure_log_lock:
+        failures = load_vod_failures()
+        if failures.pop(vod_id, None) is not None:
+            write_json_atomically(VOD_FAILURES_JSON, failures)
+
+
+def requeue_vod(vod_id):
+    """Removes a VOD from the dead-letter table and resets its failure history."""
+    with failure_log_lock:
+        dead_letter_vods = load_dead_letter_vods()
+        entry = dead_letter_vods.pop(vod_id, None)
+        if entry is None:
+            print(f"VOD {vod_id} is not in the dead-letter table.")
+        else:
+            save_dead_letter_vods(dead_letter_vods)
+            print(f"VOD {vod_id} requeued.")
+            if entry["failure_class"] == "not_english":
+                force_vod_transcription(vod_id)
+
+        failures = load_vod_failures()
+        if failures.pop(vod_id, None) is not None:
+            write_json_atomically(VOD_FAILURES_JSON, failures)
+
+
+def run_stage_with_retries(stage, vod, paths, delete_mp3_after_processing):
+    """
+    Runs one pipeline stage, retrying it according to the policy of the failure class.
+
+    Raises:
+        VodFailure: Once the retries for the failure class are used up.
+    """
+    attempt = 0
+    while True:
+        wait_for_disk_reserve(paths["vod_id"])
+        try:
+            VOD_STAGE_HANDLERS[stage](vod, paths, delete_mp3_after_processing)
+            return
+        except Exception as e:
+            failure_class = classify_failure(e, stage)
+            if failure_class == "vod_missing":
+                failure_class = confirm_vod_missing(paths["vod_id"], stage)
+            if attempt >= RETRY_POLICIES[failure_class]["retries"]:
+                raise VodFailure(failure_class, f"Stage '{stage}' failed ({failure_class}): {e}", stage=stage) from e
+
+            delay = get_retry_delay(e, failure_class, attempt)
+            attempt += 1
+            print(f"Stage '{stage}' for VOD {paths['vod_id']} failed ({failure_class}): {e}. Retry {attempt} in {delay:.0f} seconds...")
+            sleep(delay)
+
+
+def get_vod_paths(vod):
+    """
+    Builds every path used while processing a VOD.
+
+    Intermediate files are written to the VOD's scratch folder and only promoted into the
+    VOD folder once all stages have completed.
+
+    Args:
+        vod (dict): The VOD entry as loaded from the VODs CSV.
+
+    Returns:
+        dict: Paths keyed by role ("vod_folder", "scratch_folder", "video", "mp3", ...).
+    """
+    vod_id = vod['url'].split("/videos/")[1]
+    vod_folder = os.path.join(BASE_TRANSCRIPTS_FOLDER, vod['channel_name'], vod_id)
+    scratch_folder = os.path.join(SCRATCH_FOLDER, vod_id)
+
+    return {
+        "vod_id": vod_id,
+        "vod_folder": vod_folder,
+        "scratch_folder": scratch_folder,
+        "state": os.path.join(scratch_folder, f"{vod_id}_state.json"),
+        "final_state": os.path.join(vod_folder, f"{vod_id}_state.json"),
+        "lock": os.path.join(scratch_folder, ".lock"),
+        "download_parts": os.path.join(scratch_folder, "parts"),
+        "video": os.path.join(scratch_folder, f"{vod_id}.mp4"),
+        "chat_json": os.path.join(scratch_folder, f"{vod_id}_chat.json.gz" if CHAT_JSON_GZIP else f"{vod_id}_chat.json"),
+        "chat_csv": os.path.join(scratch_folder, f"{vod_id}_chat.csv"),
+        "chat_store": os.path.join(scratch_folder, f"{vod_id}{CHAT_STORE_SUFFIX}"),
+        "chat_features": os.path.join(scratch_folder, f"{vod_id}{FEATURES_SUFFIX}"),
+        "highlights": os.path.join(scratch_folder, f"{vod_id}{HIGHLIGHTS_SUFFIX}"),
+        "mp3": os.path.join(scratch_folder, f"{vod_id}.mp3"),
+        "formatted_transcript": os.path.join(scratch_folder, f"formatted_{vod_id}_transcription.txt"),
+        "raw_transcript": os.path.join(scratch_folder, f"{vod_id}_raw_transcript.txt"),
+        "segments": os.path.join(scratch_folder, f"{vod_id}{SEGMENT_STORE_SUFFIX}"),
+        "vad_report": os.path.join(scratch_folder, f"{vod_id}{VAD_REPORT_SUFFIX}"),
+        "loop_report": os.path.join(scratch_folder, f"{vod_id}{LOOP_REPORT_SUFFIX}"),
+        "overlaps": os.path.join(scratch_folder, f"{vod_id}{OVERLAPS_SUFFIX}"),
+    }
+
+
+def write_json_atomically(path, data):
+    """
+    Writes JSON to a temporary file next to `path` and renames it into place,
+    so readers never see a half-written file.
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def remove_if_exists(path):
+    """Deletes a leftover file from an interrupted stage, if there is one."""
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def load_vod_state(paths):
+    """
+    Loads the persisted stage state for a VOD.
+
+    Args:
+        paths (dict): Paths returned by get_vod_paths.
+
+    Returns:
+        dict: The state, with the list of completed stages under "completed".
+    """
+    for state_path in (paths["final_state"], paths["state"]):
+        if os.path.exists(state_path):
+            try:
+                with open(state_path, "r", encoding="utf-8") as file:
+                    return json.load(file)
+            except (OSError, ValueError) as e:
+                print(f"Could not read state file {state_path}, starting over: {e}")
+
+    return {"vod_id": paths["vod_id"], "completed": [], "updated_at": time()}
+
+
+def save_vod_state(paths, state):
+    """Checkpoints the stage state of a VOD to its scratch folder."""
+    state["updated_at"] = time()
+    write_json_atomically(paths["state"], state)
+
+
+def estimate_scratch_bytes(vod, completed_stages):
+    """
+    Estimates how many bytes a VOD still needs in its scratch folder at its peak.
+
+    Args:
+        vod (dict): The VOD entry, with duration_seconds.
+        completed_stages (list): Stages that have already completed for this VOD.
+
+    Returns:
+        int: The estimated peak scratch footprint from here on, in bytes.
+    """
+    duration_seconds = vod['duration_seconds']
+    rendition = (VOD_RENDITION or "source").lower()
+    video_bitrate = RENDITION_BITRATES.get(rendition, RENDITION_BITRATES["source"])
+
+    video_bytes = duration_seconds * video_bitrate / 8 * DOWNLOAD_OVERHEAD_FACTOR
+    mp3_bytes = duration_seconds * MP3_BITRATE / 8
+    chat_bytes = duration_seconds * CHAT_BYTES_PER_SECOND
+
+    if "extract" in completed_stages:
+        return int(mp3_bytes + chat_bytes)  # The MP4 is deleted once the audio is extracted
+    return int(video_bytes + mp3_bytes + chat_bytes)
+
+
+def get_folder_size(folder):
+    """Returns the total size in bytes of every file under `folder`."""
+    total = 0
+    for root, _, files in os.walk(folder):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass  # The file was removed while walking
+    return total
+
+
+# Scratch reservations of the VODs currently in flight, keyed by VOD ID
+in_flight_vods = {}
+disk_admission = threading.Condition()
+
+
+def get_disk_projection():
+    """
+    Projects the disk usage of all in-flight VODs.
+
+    Returns:
+        tuple: (projected_bytes, remaining_growth_bytes) where projected_bytes is the larger of
+        each VOD's estimate and its actual usage, and remaining_growth_bytes is how much more
+        the in-flight VODs are still expected to write.
+    """
+    projected_bytes = 0
+    remaining_growth_bytes = 0
+    for reservation in in_flight_vods.values():
+        actual_bytes = get_folder_size(reservation["scratch_folder"])
+        projected_bytes += max(reservation["estimate"], actual_bytes)
+        remaining_growth_bytes += max(reservation["estimate"] - actual_bytes, 0)
+    return projected_bytes, remaining_growth_bytes
+
+
+def admit_vod(vod, paths, state):
+    """
+    Blocks until the VOD's scratch footprint fits the disk budget and the real free space,
+    then reserves it. VODs that already finished downloading are admitted straight away.
+
+    Args:
+        vod (dict): The VOD entry.
+        paths (dict): Paths returned by get_vod_paths.
+        state (dict): The VOD's stage state.
+    """
+    vod_id = paths["vod_id"]
+    estimate = estimate_scratch_bytes(vod, state["completed"])
+
+    with disk_admission:
+        while "download" not in state["completed"]:
+            projected_bytes, remaining_growth_bytes = get_disk_projection()
+            free_bytes = shutil.disk_usage(BASE_TRANSCRIPTS_FOLDER).free
+
+            fits_budget = not in_flight_vods or projected_bytes + estimate <= DISK_BUDGET_BYTES
+            fits_disk = free_bytes - remaining_growth_bytes - estimate >= DISK_FREE_RESERVE_BYTES
+            if fits_budget and fits_disk:
+                break
+
+            print(
+                f"Waiting for disk space before downloading VOD {vod_id}: needs ~{estimate / 1024 ** 3:.1f} GB, "
+                f"{projected_bytes / 1024 ** 3:.1f} GB projected for {len(in_flight_vods)} in-flight VOD(s), "
+                f"{free_bytes / 1024 ** 3:.1f} GB free."
+            )
+            disk_admission.wait(timeout=DISK_ADMISSION_POLL_SECONDS)
+
+        in_flight_vods[vod_id] = {"estimate": estimate, "scratch_folder": paths["scratch_folder"]}
+        print(f"Admitted VOD {vod_id} with an estimated scratch footprint of {estimate / 1024 ** 3:.1f} GB.")
+
+
+def has_disk_reserve():
+    """True while the transcripts drive has at least DISK_FREE_RESERVE_BYTES free."""
+    return shutil.disk_usage(BASE_TRANSCRIPTS_FOLDER).free >= DISK_FREE_RESERVE_BYTES
+
+
+def wait_for_disk_reserve(vod_id):
+    """Blocks while the free space on the transcripts drive is below DISK_FREE_RESERVE_BYTES."""
+    with disk_admission:
+        while not has_disk_reserve():
+            free_bytes = shutil.disk_usage(BASE_TRANSCRIPTS_FOLDER).free
+            print(f"Pausing VOD {vod_id}: {free_bytes / 1024 ** 3:.1f} GB free, "
+                  f"below the reserve of {DISK_FREE_RESERVE_BYTES / 1024 ** 3:.1f} GB.")
+            disk_admission.wait(timeout=DISK_ADMISSION_POLL_SECONDS)
+
+
+def update_vod_reservation(vod, paths, state):
+    """Shrinks a VOD's reservation after a stage completes and wakes up waiting VODs."""
+    with disk_admission:
+        if paths["vod_id"] in in_flight_vods:
+            in_flight_vods[paths["vod_id"]]["estimate"] = estimate_scratch_bytes(vod, state["completed"])
+        disk_admission.notify_all()
+
+
+def release_vod(paths):
+    """Drops a VOD's reservation and wakes up waiting VODs."""
+    with disk_admission:
+        in_flight_vods.pop(paths["vod_id"], None)
+        disk_admission.notify_all()
+
+
+def get_next_stage(state):
+    """Returns the first stage that has not completed yet, or None if the VOD is done."""
+    return next((stage for stage in VOD_STAGES if stage not in state["completed"]), None)
+
+
+def lock_vod_scratch_folder(paths):
+    """
+    Takes an exclusive, non-blocking lock on the VOD's scratch folder so two workers
+    never process the same VOD. The OS drops the lock if the process dies.
+
+    Returns:
+        file: The open lock file (keep it open to hold the lock), or None if another worker holds it.
+    """
+    lock_file = open(paths["lock"], "a+")
+    try:
+        lock_file.seek(0)
+        if os.name == "nt":
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def unlock_vod_scratch_folder(lock_file):
+    """Releases a lock taken by lock_vod_scratch_folder."""
+    try:
+        lock_file.seek(0)
+        if os.name == "nt":
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    finally:
+        lock_file.close()
+
+
+def run_governed_download(command, download_paths, traffic_class, vod_id=None, stage=None, total_media_seconds=None):
+    """
+    Runs a download subprocess while charging what it writes to the bandwidth governor.
+
+    Args:
+        command (list): The command to run.
+        download_paths (list): Files or folders the command downloads into.
+        traffic_class (str): The governor traffic class to charge.
+        vod_id (str): VOD whose stage metrics are updated with the download's progress.
+        stage (str): Stage whose metrics are updated.
+        total_media_seconds (float): Length of the VOD, used to turn percentages into media time.
+
+    Raises:
+        subprocess.CalledProcessError: If the command exits with a non-zero code.
+    """
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True, encoding="utf-8", errors="replace"
+    )
+
+    # Turn the downloader's status lines into metrics; echo everything else and keep the tail,
+    # which is used to classify failures
+    output_tail = deque(maxlen=50)
+    def read_output():
+        for line in process.stdout:
+            output_tail.append(line.rstrip())
+            match = DOWNLOADER_PROGRESS_PATTERN.search(line)
+            if match and stage and total_media_seconds:
+                update_stage_metrics(vod_id, stage, media_seconds_done=float(match.group(1)) / 100 * total_media_seconds)
+            elif not match:
+                print(line, end="")
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+
+    def on_progress(downloaded_bytes):
+        if stage:
+            update_stage_metrics(vod_id, stage, bytes_done=downloaded_bytes)
+
+    # The download is paused while the drive is below its free reserve, instead of failing with a full disk
+    paused_for_disk = False
+    def disk_is_low():
+        nonlocal paused_for_disk
+        disk_low = not has_disk_reserve()
+        if disk_low != paused_for_disk:
+            print(f"{'Pausing' if disk_low else 'Resuming'} the {traffic_class} download for VOD {vod_id}: "
+                  f"the transcripts drive is {'below' if disk_low else 'back above'} its free reserve.")
+        paused_for_disk = disk_low
+        return disk_low
+
+    try:
+        downloaded_bytes = govern_process(process, download_paths, traffic_class, on_progress=on_progress,
+                                          should_pause=disk_is_low)
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        reader.join(timeout=5)
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, output="\n".join(output_tail))
+    print(f"Downloaded {downloaded_bytes / 1024 ** 2:.1f} MB ({traffic_class}). Current rates: {governor.report()} MB/s")
+
+
+def run_download_stage(vod, paths, delete_mp3_after_processing):
+    """Downloads the VOD video into the scratch folder."""
+    vod_id = paths["vod_id"]
+    remove_if_exists(paths["video"])
+
+    shutil.rmtree(paths["download_parts"], ignore_errors=True)
+    os.makedirs(paths["download_parts"])
+
+    command = [
+        "TwitchDownloaderCLI.exe", "videodownload",
+        "--id", vod_id,
+        "--temp-path", paths["download_parts"],
+        "--threads", str(VIDEO_DOWNLOAD_THREADS),
+        "-o", paths["video"]
+    ]
+    if VOD_RENDITION:
+        command += ["--quality", VOD_RENDITION]
+
+    # TwitchDownloaderCLI caps each thread in KiB/s; the governor pauses it on top of that if the limit drops later
+    video_rate = governor.get_class_rate("video")
+    if video_rate:
+        command += ["--bandwidth", str(max(1, int(video_rate / VIDEO_DOWNLOAD_THREADS / 1024)))]
+
+    print(f"Downloading VOD for {vod['title']} (video bandwidth: {format_rate(video_rate)})...")
+    update_website_with_progress(vod_id, "start_download")
+    start_stage_metrics(vod_id, "download", vod['duration_seconds'])
+    try:
+        run_governed_download(command, [paths["download_parts"]], "video",
+                              vod_id=vod_id, stage="download", total_media_seconds=vod['duration_seconds'])
+    finally:
+        finish_stage_metrics(vod_id, "download")
+    shutil.rmtree(paths["download_parts"], ignore_errors=True)
+    update_website_with_progress(vod_id, "finish_download")
+
+
+def run_chat_stage(vod, paths, delete_mp3_after_processing):
+    """
+    Downloads the chat JSON and converts it to a Timestamp/Username/Message CSV and a chat store,
+    then computes the chat activity features and highlights from the store.
+    """
+    vod_id = paths["vod_id"]
+    remove_if_exists(paths["chat_json"])
+
+    print(f"Downloading chat for {vod['title']}...")
+    start_stage_metrics(vod_id, "chat", vod['duration_seconds'])
+    try:
+        if CHAT_DOWNLOADER == "native":
+            download_chat(
+                vod_id, vod['duration_seconds'], paths["chat_json"], ranges=CHAT_DOWNLOAD_RANGES, vod_info=vod,
+                progress_callback=lambda bytes_done, seconds_done: update_stage_metrics(
+                    vod_id, "chat", bytes_done=bytes_done, media_seconds_done=seconds_done)
+            )
+        else:
+            run_governed_download([
+                "TwitchDownloaderCLI.exe", "chatdownload",
+                "--id", vod_id,
+                "--compression", "Gzip" if CHAT_JSON_GZIP else "None",
+                "-o", paths["chat_json"]
+            ], [paths["chat_json"]], "chat", vod_id=vod_id, stage="chat", total_media_seconds=vod['duration_seconds'])
+    finally:
+        finish_stage_metrics(vod_id, "chat")
+
+    # Streams the comments straight from the (compressed) JSON into the CSV, so memory stays flat
+    print(f"Converting chat JSON to CSV for {vod['title']}...")
+    message_count = convert_chat_to_csv(paths["chat_json"], paths["chat_csv"])
+    print(f"Wrote {message_count} chat messages to: {paths['chat_csv']}")
+
+    # Columnar, time-indexed copy of the chat for fast time-range queries
+    build_chat_store(paths["chat_csv"], paths["chat_store"])
+    print(f"Wrote chat store to: {paths['chat_store']}")
+
+    # Chat rate, unique chatters and burst scores per second, plus the strongest highlight windows
+    with ChatStore(paths["chat_store"]) as store:
+        highlights = write_chat_features(store, paths["chat_features"], paths["highlights"])
+    print(f"Found {len(highlights)} chat highlights for {vod['title']}.")
+
+
+def run_ffmpeg_with_progress(command, vod_id, stage):
+    """
+    Runs ffmpeg with machine-readable progress on stdout and feeds it into the stage metrics.
+
+    Args:
+        command (list): The ffmpeg command, starting with "ffmpeg".
+        vod_id (str): The VOD ID.
+        stage (str): The stage whose metrics are updated.
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg fails; the error carries the tail of its log.
+    """
+    command = [command[0], "-nostats", "-progress", "pipe:1"] + command[1:]
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        text=True, encoding="utf-8", errors="replace"
+    )
+
+    # ffmpeg's log goes to stderr; drain it on another thread so the pipe never fills up
+    log_tail = deque(maxlen=50)
+    def read_log():
+        for line in process.stderr:
+            log_tail.append(line.rstrip())
+    log_reader = threading.Thread(target=read_log, daemon=True)
+    log_reader.start()
+
+    # Progress arrives as blocks of key=value lines, each block ending with progress=continue|end
+    progress = {}
+    for line in process.stdout:
+        key, _, value = line.strip().partition("=")
+        progress[key] = value
+        if key == "progress":
+            bytes_done = int(progress["total_size"]) if progress.get("total_size", "N/A").isdigit() else None
+            out_time_us = progress.get("out_time_us", "N/A")
+            media_seconds_done = int(out_time_us) / 1_000_000 if out_time_us.lstrip("-").isdigit() else None
+            update_stage_metrics(vod_id, stage, bytes_done=bytes_done, media_seconds_done=media_seconds_done)
+
+    process.wait()
+    log_reader.join(timeout=5)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, output="\n".join(log_tail))
+
+
+def run_extract_stage(vod, paths, delete_mp3_after_processing):
+    """Extracts the audio track of the downloaded VOD to MP3, then deletes the video."""
+    vod_id = paths["vod_id"]
+    remove_if_exists(paths["mp3"])
+
+    update_website_with_progress(vod_id, "start_mp3_conver")
+    print(f"Converting VOD to MP3 for {vod['title']}...")
+    start_stage_metrics(vod_id, "extract", vod['duration_seconds'])
+    try:
+        run_ffmpeg_with_progress([
+            "ffmpeg", "-y", "-i", paths["video"], "-q:a", "0", "-map", "a", paths["mp3"]
+        ], vod_id, "extract")
+    finally:
+        finish_stage_metrics(vod_id, "extract")
+    os.remove(paths["video"])  # Delete MP4 after conversion
+    update_website_with_progress(vod_id, "finish_mp3_conver")
+
+
+transcription_lock = threading.Lock()
+
+
+class TranscriptionBatcher:
+    """
+    Groups VODs that are waiting for transcription so the batched pipeline decodes them together.
+
+    Every worker submits its VOD and blocks. Whichever worker finds the model idle takes the
+    oldest waiting VODs (up to TRANSCRIPTION_GROUP_MAX_SECONDS of audio, at least one VOD),
+    transcribes them in one call and hands each worker its result.
+    """
+
+    def __init__(self, max_group_seconds):
+        self.max_group_seconds = max_group_seconds
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.running = False
+
+    def take_group(self):
+        group = []
+        total_seconds = 0
+        while self.waiting and (not group or total_seconds + self.waiting[0]["duration"] <= self.max_group_seconds):
+            job = self.waiting.pop(0)
+            group.append(job)
+            total_seconds += job["duration"]
+        return group
+
+    def submit(self, audio_file, output_dir, duration_seconds, vad_settings=None):
+        """Transcribes an audio file as part of the next batch and returns its output paths."""
+        job = {"audio_file": audio_file, "output_dir": output_dir, "duration": duration_seconds,
+               "vad_settings": vad_settings, "done": False, "result": None, "error": None}
+        with self.condition:
+            self.waiting.append(job)
+            self.condition.notify_all()
+
+        while True:
+            with self.condition:
+                while not job["done"] and (self.running or not self.waiting):
+                    self.condition.wait()
+                if job["done"]:
+                    break
+                self.running = True
+                group = self.take_group()
+
+            try:
+                results = transcribe_many([(member["audio_file"], member["output_dir"], member["vad_settings"])
+                                           for member in group])
+                for member, result in zip(group, results):
+                    member["result"] = result
+            except Exception as e:
+                for member in group:
+                    member["error"] = e
+            finally:
+                with self.condition:
+                    for member in group:
+                        member["done"] = True
+                    self.running = False
+                    self.condition.notify_all()
+
+        if job["error"] is not None:
+            raise job["error"]
+        return job["result"]
+
+
+transcription_batcher = TranscriptionBatcher(TRANSCRIPTION_GROUP_MAX_SECONDS)
+
+
+vods_csv_lock = threading.Lock()
+
+
+def record_language_decision(vod, decision, language_result):
+    """Stores a VOD's language gate decision in its entry and saves the VODs CSV."""
+    vod["language_decision"] = decision
+    english_ratio = language_result["english_ratio"]
+    vod["english_ratio"] = "" if english_ratio is None else f"{english_ratio:.2f}"
+    vod["detected_languages"] = " ".join(
+        f"{language}:{count}" for language, count in sorted(language_result["languages"].items(), key=lambda item: -item[1])
+    )
+    with vods_csv_lock:
+        if any(entry is vod for entry in all_vods):
+            save_vods(all_vods)
+
+
+def force_vod_transcription(vod_id):
+    """Marks a VOD the language gate skipped to be transcribed regardless."""
+    with vods_csv_lock:
+        vods = load_vods()
+        for vod in vods:
+            if vod['url'].split("/videos/")[1] == vod_id:
+                vod["language_decision"] = "forced"
+                save_vods(vods)
+                print(f"VOD {vod_id} will be transcribed regardless of its language.")
+                return
+
+
+def carry_over_language_decisions(vods):
+    """Copies the language gate columns of the VODs already in the VODs CSV onto freshly fetched entries."""
+    saved_vods = {vod['url']: vod for vod in load_vods()}
+    for vod in vods:
+        saved_vod = saved_vods.get(vod['url'], {})
+        for column in LANGUAGE_DECISION_COLUMNS:
+            if saved_vod.get(column):
+                vod[column] = saved_vod[column]
+
+
+def run_language_gate(vod, paths, vad_settings):
+    """
+    Samples the language of the VOD's audio and decides whether to transcribe it.
+
+    Decisions from earlier runs are reused, except "skipped" (a skipped VOD only gets here
+    again if it was requeued, which sets "forced").
+
+    Returns:
+        str: "english", "flagged", "no_speech" or "forced".
+
+    Raises:
+        VodFailure: not_english, if the gate skips the VOD.
+    """
+    decision = vod.get("language_decision")
+    if decision in ("english", "flagged", "no_speech", "forced"):
+        return decision
+
+    print(f"Sampling the language of {vod['title']}...")
+    daemon_socket = get_daemon_socket()
+    if daemon_socket and get_daemon_health(daemon_socket):
+        result = detect_language_remote(paths["mp3"], vod['duration_seconds'], vad_settings, daemon_socket)
+    else:
+        result = sample_languages(get_language_gate_model(), paths["mp3"], vod['duration_seconds'], vad_settings)
+
+    english_ratio = result["english_ratio"]
+    if english_ratio is None:
+        decision = "no_speech"
+    elif english_ratio >= MIN_ENGLISH_RATIO:
+        decision = "english"
+    else:
+        decision = "skipped" if LANGUAGE_GATE_ACTION == "skip" else "flagged"
+    print(f"Language gate for VOD {paths['vod_id']}: {decision} "
+          f"(English ratio {'n/a' if english_ratio is None else f'{english_ratio:.0%}'}, languages {result['languages']})")
+    record_language_decision(vod, decision, result)
+
+    if decision == "skipped":
+        raise VodFailure("not_english", f"Only {english_ratio:.0%} of the sampled speech is English ({result['languages']})",
+                         stage="transcribe")
+    return decision
+
+
+fingerprint_index_lock = threading.Lock()
+
+
+def find_reusable_transcripts(vod, paths):
+    """
+    Fingerprints the VOD's audio, matches it against the fingerprint index and adds it there.
+
+    The overlaps are written to the scratch folder, and a retry reads them back instead of
+    matching again, so a resumed transcription reuses the same spans.
+
+    Returns:
+        list: The spans whose transcript can be reused, as dicts with start, end and segments.
+    """
+    vod_id = paths["vod_id"]
+    if os.path.exists(paths["overlaps"]):
+        with open(paths["overlaps"], "r", encoding="utf-8") as file:
+            overlaps = json.load(file)["overlaps"]
+    else:
+        print(f"Fingerprinting the audio of {vod['title']}...")
+        hashes, times = fingerprint_audio_file(paths["mp3"])
+        with fingerprint_index_lock:
+            index = FingerprintIndex(FINGERPRINT_INDEX_FOLDER)
+            overlaps = index.query(hashes, times, exclude_vod_id=vod_id)
+            index.add([(vod_id, vod['channel_name'], hashes, times)])
+        write_json_atomically(paths["overlaps"], {"overlaps": overlaps})
+
+    reused_spans = []
+    for overlap in select_reusable_overlaps(overlaps):
+        description = (f"{overlap['start']:.0f}-{overlap['end']:.0f} seconds of VOD {vod_id} match "
+                       f"{overlap['channel_name']}/{overlap['vod_id']} at {overlap['reference_start']:.0f} seconds")
+        segments = load_overlap_segments(overlap, BASE_TRANSCRIPTS_FOLDER)
+        if segments is None:
+            print(f"{description}, which has no finished transcript to reuse.")
+            continue
+        print(f"{description}; reusing its transcript.")
+        reused_spans.append({"start": overlap["start"], "end": overlap["end"], "segments": segments})
+    return reused_spans
+
+
+def run_transcribe_stage(vod, paths, delete_mp3_after_processing):
+    """
+    Transcribes the MP3 into the scratch folder, with the channel's VAD settings, unless the
+    language gate skips the VOD. Spans it shares with VODs transcribed before reuse their transcripts.
+    """
+    vod_id = paths["vod_id"]
+    vad_settings = load_vad_settings(VAD_SETTINGS_FILE, vod['channel_name'])
+    if LANGUAGE_GATE_ACTION:
+        run_language_gate(vod, paths, vad_settings)
+    reused_spans = find_reusable_transcripts(vod, paths) if FINGERPRINT_DEDUP else None
+
+    if get_batch_size():
+        # VODs that reach this stage while another batch is decoding share the next batch
+        print(f"Queueing MP3 for {vod['title']} for batched transcription...")
+        update_website_with_progress(vod_id, "start_transcribe")
+        transcription_batcher.submit(paths["mp3"], paths["scratch_folder"], vod['duration_seconds'], vad_settings)
+        update_website_with_progress(vod_id, "finish_transcribe")
+        return
+
+    # Only one VOD is transcribed at a time; other workers keep downloading meanwhile
+    with transcription_lock:
+        print(f"Transcribing MP3 for {vod['title']} from {paths['mp3']}...")
+        update_website_with_progress(vod_id, "start_transcribe")
+        transcribe(paths["mp3"], output_dir=paths["scratch_folder"], vad_settings=vad_settings, reused_spans=reused_spans)
+        update_website_with_progress(vod_id, "finish_transcribe")
+
+
+# Files that VODs started by an older version of the pipeline may not have
+OPTIONAL_ARTIFACTS = {"chat_store", "chat_features", "highlights", "segments", "vad_report", "loop_report", "overlaps"}
+
+
+def run_finalize_stage(vod, paths, delete_mp3_after_processing):
+    """
+    Promotes the finished files from the scratch folder into the VOD folder.
+
+    Every file is moved with an atomic rename, and files that were already promoted by an
+    interrupted earlier attempt are left alone, so the stage is safe to re-run.
+    """
+    os.makedirs(paths["vod_folder"], exist_ok=True)
+
+    artifacts = ["chat_json", "chat_csv", "chat_store", "chat_features", "highlights",
+                 "formatted_transcript", "raw_transcript", "segments", "vad_report", "loop_report", "overlaps"]
+    if not delete_mp3_after_processing:
+        artifacts.append("mp3")
+
+    for artifact in artifacts:
+        source_path = paths[artifact]
+        dest_path = os.path.join(paths["vod_folder"], os.path.basename(source_path))
+        if os.path.exists(source_path):
+            os.replace(source_path, dest_path)
+            print(f"Promoted {os.path.basename(source_path)} to: {paths['vod_folder']}")
+        elif not os.path.exists(dest_path) and artifact not in OPTIONAL_ARTIFACTS:
+            raise FileNotFoundError(f"{source_path} is missing and was never promoted.")
+
+
+VOD_STAGE_HANDLERS = {
+    "download": run_download_stage,
+    "chat": run_chat_stage,
+    "extract": run_extract_stage,
+    "transcribe": run_transcribe_stage,
+    "finalize": run_finalize_stage,
+}
+
+
+def run_stage_group(stages, vod, paths, state, delete_mp3_after_processing):
+    """
+    Runs several independent stages at the same time, checkpointing each one as it completes.
+
+    Raises:
+        VodFailure: The first failure, once every stage in the group has finished.
+    """
+    state_lock = threading.Lock()
+
+    def run(stage):
+        run_stage_with_retries(stage, vod, paths, delete_mp3_after_processing)
+        with state_lock:
+            state["completed"].append(stage)
+            save_vod_state(paths, state)
+        print(f"Stage '{stage}' for VOD {paths['vod_id']} completed.")
+
+    with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+        futures = [executor.submit(run, stage) for stage in stages]
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        raise errors[0]
+
+
 def download_twitch_vod_and_chat(vod, delete_mp3_after_processing=False):
+    """
+    Runs a VOD through every pipeline stage, resuming at the first stage that has not completed.
+
+    Each stage works inside the VOD's own scratch folder and the state is checkpointed after
+    every stage, so a restart picks up where the last run stopped instead of re-downloading.
+
+    Args:
+        vod (dict): The VOD entry as loaded from the VODs CSV.
+        delete_mp3_after_processing (bool): Drop the MP3 instead of keeping it in the VOD folder.
+
+    Returns:
+        bool: True if the VOD is fully processed, False otherwise.
+    """
     vod_url = vod['url']
-    vod_id = vod_url.split("/videos/")[1]
     title = vod['title']
-    username_folder = vod['channel_name']
-    vod_folder = os.path.join(BASE_TRANSCRIPTS_FOLDER, username_folder, vod_id)
+    paths = get_vod_paths(vod)
+    vod_id = paths["vod_id"]
 
     print(f"Processing {title}: {vod_url}")
 
-    # Ensure folder structure exists
-    print(f"Ensuring folder structure exists: {vod_folder}")
-    os.makedirs(vod_folder, exist_ok=True)
+    state = load_vod_state(paths)
+    if get_next_stage(state) is None:
+        print(f"VOD {title} has already been processed. Skipping this VOD.")
+        return True
 
-    # File paths
-    vod_filename = f"{vod_id}.mp4"
-    chat_json_filename = f"{vod_id}_chat.json"
-    chat_csv_filename = f"{vod_id}_chat.csv"
-    mp3_filename = f"{vod_id}.mp3"
-    info_filename = os.path.join(vod_folder, f"{vod_id}_info.txt")
+    # VOD folders produced before stages were checkpointed only contain the final files
+    legacy_transcript = os.path.join(paths["vod_folder"], os.path.basename(paths["formatted_transcript"]))
+    if not state["completed"] and os.path.exists(legacy_transcript):
+        print(f"Transcript for VOD {title} already exists. Skipping this VOD.")
+        return True
 
-    # Check if processed files already exist
-    if os.path.exists(mp3_filename):
-        print(f"Info file for VOD {title} already exists. Skipping this VOD.")
+    os.makedirs(paths["scratch_folder"], exist_ok=True)
+    lock_file = lock_vod_scratch_folder(paths)
+    if lock_file is None:
+        print(f"VOD {title} is being processed by another worker. Skipping this VOD.")
         return False
 
     try:
-        # Download the VOD
-        print(f"Downloading VOD for {title}...")
-        update_website_with_progress(vod_id, "start_download")
-        subprocess.run([
-            "TwitchDownloaderCLI.exe", "videodownload",
-            "--id", vod_id,
-            "-o", vod_filename
-        ], check=True)
-        update_website_with_progress(vod_id, "finish_download")
-
-
-        # Download the chat
-        print(f"Downloading chat for {title}...")
-        subprocess.run([
-            "TwitchDownloaderCLI.exe", "chatdownload",
-            "--id", vod_id,
-            "-o", chat_json_filename
-        ], check=True)
-
-
-        update_website_with_progress(vod_id, "start_mp3_conver")
-        # Convert VOD to MP3
-        print(f"Converting VOD to MP3 for {title}...")
-        subprocess.run([
-            "ffmpeg", "-i", vod_filename, "-q:a", "0", "-map", "a", mp3_filename
-        ], check=True)
-        os.remove(vod_filename)  # Delete MP4 after conversion
-        update_website_with_progress(vod_id, "finish_mp3_conver")
-
-        # Move chat JSON file to VOD folder
-        shutil.move(chat_json_filename, os.path.join(vod_folder, chat_json_filename))
-        print(f"Moved chat JSON file to: {vod_folder}")
-
-        # Convert chat JSON to CSV
-        print(f"Converting chat JSON to CSV for {title}...")
-        with open(os.path.join(vod_folder, chat_json_filename), "r", encoding="utf-8") as json_file:
-            chat_data = json.load(json_file)
-
-        with open(chat_csv_filename, "w", newline="", encoding="utf-8") as csv_file:
-            csv_writer = csv.writer(csv_file)
-            csv_writer.writerow(["Timestamp", "Username", "Message"])
-            chat_messages = chat_data.get("comments", [])
-            for message in chat_messages:
-                timestamp = message.get("content_offset_seconds", "N/A")
-                username = message.get("commenter", {}).get("display_name", "N/A")
-                chat_message = message.get("message", {}).get("body", "N/A")
-                csv_writer.writerow([timestamp, username, chat_message])
-
-        shutil.move(chat_csv_filename, os.path.join(vod_folder, chat_csv_filename))
-        print(f"Moved chat CSV file to: {vod_folder}")
-
-        # Move MP3 file to VOD folder
-        mp3_dest_path = os.path.join(vod_folder, mp3_filename)
-        shutil.move(mp3_filename, mp3_dest_path)
-        print(f"Moved MP3 file to: {mp3_dest_path}")
-
-        # Transcribe the MP3 file from its new location
-        print(f"Transcribing MP3 for {title} from {mp3_dest_path}...")
-        update_website_with_progress(vod_id, "start_transcribe")
-        tpath1, tpath2 = transcribe(mp3_dest_path, "cuda", output_dir=vod_folder)
+        # Another worker may have advanced or finished the VOD between the first read and the lock
+        state = load_vod_state(paths)
+        stage = get_next_stage(state)
+        if stage is None:
+            print(f"VOD {title} has already been processed. Skipping this VOD.")
+            return True
+        if state["completed"]:
+            print(f"Resuming VOD {vod_id} at stage '{stage}'.")
+
+        admit_vod(vod, paths, state)
+
+        while stage is not None:
+            group = next((group for group in PARALLEL_STAGE_GROUPS if stage in group), [stage])
+            pending_stages = [pending for pending in group if pending not in state["completed"]]
+
+            if len(pending_stages) > 1:
+                print(f"Running stages {', '.join(pending_stages)} for VOD {vod_id} in parallel...")
+                run_stage_group(pending_stages, vod, paths, state, delete_mp3_after_processing)
+            else:
+                print(f"Running stage '{stage}' for VOD {vod_id}...")
+                run_stage_with_retries(stage, vod, paths, delete_mp3_after_processing)
+                state["completed"].append(stage)
 
-        # Update the website after transcription
-        update_website_with_progress(vod_id, "finish_transcribe")
+                if stage == "finalize":
+                    write_json_atomically(paths["final_state"], state)
+                else:
+                    save_vod_state(paths, state)
+            update_vod_reservation(vod, paths, state)
+            stage = get_next_stage(state)
 
+        clear_vod_failures(vod_id)
         print(f"Successfully processed VOD: {title}")
         return True
 
     except Exception as e:
         print(f"An error occurred while processing VOD {title}: {e}")
+        failed_stage = getattr(e, "stage", None) or stage
+        failure_class = e.failure_class if isinstance(e, VodFailure) else STAGE_FAILURE_CLASSES[failed_stage]
+        if failure_class == "auth_failed":
+            run_aborted.set()
+            print("Twitch rejected the credentials; stopping the run. Check TWITCH_CLIENT_ID and TWITCH_ACCESS_TOKEN.")
+            return False
+        record_vod_failure(vod, vod_id, failed_stage, failure_class, e)
         return False
 
+    finally:
+        finished = get_next_stage(state) is None
+        if finished:
+            # Removed while the lock is held, so no other worker starts on a half-deleted folder
+            shutil.rmtree(paths["scratch_folder"], ignore_errors=True)
+        unlock_vod_scratch_folder(lock_file)
+        if finished:
+            shutil.rmtree(paths["scratch_folder"], ignore_errors=True)  # Windows keeps the open lock file until now
+            print(f"Removed scratch folder: {paths['scratch_folder']}")
+        release_vod(paths)
 
 
 
@@ -785,6 +2218,21 @@ if __name__ == "__main__":
     # Control variable to force loading VTubers and VODs from CSV
     FORCE_LOAD_FROM_CSV = False
 
+    # Requeue dead-lettered VODs: python script-that-will-work.py --requeue <vod_id> [<vod_id> ...]
+    if len(sys.argv) > 2 and sys.argv[1] == "--requeue":
+        for requeued_vod_id in sys.argv[2:]:
+            requeue_vod(requeued_vod_id)
+        stop_timer()
+        sys.exit(0)
+
+    # Shared bandwidth limit; the control file can change it while the script runs
+    if BANDWIDTH_LIMIT_MB_PER_S:
+        governor.set_limit(int(BANDWIDTH_LIMIT_MB_PER_S * 1024 ** 2))
+    watch_control_file(BANDWIDTH_CONTROL_FILE)
+
+    # Live per-stage metrics for the website
+    threading.Thread(target=progress_reporter_thread, daemon=True).start()
+
     try:
         print("Fetching VTuber pages from Fandom categories...")
         twitch_category_pages = get_category_pages("https://virtualyoutuber.fandom.com/wiki/Category:Twitch")
@@ -836,6 +2284,7 @@ if __name__ == "__main__":
                 except Exception as e:
                     print(f"Failed to fetch VODs for {link}: {e}")
 
+            carry_over_language_decisions(all_vods)
             save_vods(all_vods)
 
         print(f"Total valid VODs to process: {len(all_vods)}")
@@ -850,8 +2299,16 @@ if __name__ == "__main__":
 
         print(f"Starting processing for all valid VODs...")
 
-        # Process all VODs in the list
-        for idx, vod in enumerate(all_vods, start=1):
+        dead_letter_vods = load_dead_letter_vods()
+        if dead_letter_vods:
+            print(f"Skipping {len(dead_letter_vods)} dead-lettered VOD(s). Requeue them with --requeue <vod_id>.")
+
+        def process_vod(idx, vod):
+            if run_aborted.is_set():
+                return
+            if vod['url'].split("/videos/")[1] in dead_letter_vods:
+                print(f"\nSkipping dead-lettered VOD {idx} of {len(all_vods)}: {vod['title']} ({vod['url']})")
+                return
             print(f"\nProcessing VOD {idx} of {len(all_vods)}: {vod['title']} ({vod['url']})")
             try:
                 success = download_twitch_vod_and_chat(vod, delete_mp3_after_processing=False)
@@ -862,7 +2319,15 @@ if __name__ == "__main__":
             except Exception as e:
                 print(f"Unexpected error during VOD {idx} processing: {e}")
 
-        print("All valid VODs have been processed and transcribed.")
+        # Process all VODs in the list; disk admission control decides when each download may start
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_VODS) as executor:
+            for idx, vod in enumerate(all_vods, start=1):
+                executor.submit(process_vod, idx, vod)
+
+        if run_aborted.is_set():
+            print("The run was stopped before every VOD was processed.")
+        else:
+            print("All valid VODs have been processed and transcribed.")
 
     finally:
         # Ensure the timer thread stops on exit
@@ -0,0 +1,344 @@
+"""
+Scrubs PII and profanity from chat and transcripts before the dataset is published.
+
+Term lists (usernames, slurs, ...) are compiled once into an Aho-Corasick automaton, so every
+line is scanned a single time no matter how many terms there are, and a few compiled
+structural patterns catch emails and phone numbers. Each VOD's chat CSV (Message column
+scrubbed, Username column replaced outright), formatted transcript, raw transcript and
+segments file is streamed through the scrubber into a mirrored output tree, VODs in parallel,
+and a report of what was replaced is written next to the output.
+
+Term files hold one term per line; the category name becomes the replacement token.
+
+Usage:
+    python scrub.py transcripts_folder output_folder --terms username=users.txt --terms slur=slurs.txt [--workers N]
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chat_store import DEFAULT_TRANSCRIPTS_FOLDER, iter_vod_folders
+
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+SCRUB_REPORT_FILENAME = "scrub_report.json"
+
+# Structural patterns, combined into one alternation so each line is matched once. A phone number
+# needs a leading +, an area code in parentheses or the same separator between its groups, so
+# plain digit runs (counts, IDs, timestamps) are left alone
+STRUCTURAL_PATTERNS = {
+    "email": r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}",
+    "phone": (r"(?<![\w+])(?:\+\d{1,3}[\s.-]?(?:\(\d{1,4}\)[\s.-]?)?\d{2,4}(?:[\s.-]?\d{2,4}){2,3}"
+              r"|\(\d{2,4}\)[\s.-]?\d{3,4}[\s.-]\d{4}"
+              r"|\d{2,4}(?P<phone_separator>[-. ])\d{3,4}(?P=phone_separator)\d{4})(?!\w)"),
+}
+
+# Chat usernames are replaced whole rather than scanned for terms
+USERNAME_TOKEN = "[USERNAME]"
+
+
+class TermMatcher:
+    """
+    An Aho-Corasick automaton over a set of terms, matched case-insensitively.
+
+    Every state is a dictionary of character transitions; failure links point to the longest
+    proper suffix that is also a prefix of some term, so the text is read exactly once.
+    """
+
+    def __init__(self, terms_by_category, whole_words=True):
+        """
+        Args:
+            terms_by_category (dict): Category name mapped to an iterable of terms.
+            whole_words (bool): Only match terms that are not part of a longer word.
+        """
+        self.whole_words = whole_words
+        self.transitions = [{}]
+        self.failure = [0]
+        self.outputs = [None]  # (term length, category, term) if a term ends exactly at the state
+        self.output_links = [0]  # Nearest state down the failure chain where a shorter term ends
+
+        for category, terms in terms_by_category.items():
+            for term in terms:
+                term = term.strip().lower()
+                if term:
+                    self.add(term, category)
+        self.build_failure_links()
+
+    def __len__(self):
+        return len(self.transitions)
+
+    def add(self, term, category):
+        state = 0
+        for char in term:
+            next_state = self.transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions[state][char] = next_state
+                self.transitions.append({})
+                self.failure.append(0)
+                self.outputs.append(None)
+                self.output_links.append(0)
+            state = next_state
+        self.outputs[state] = (len(term), category, term)
+
+    def build_failure_links(self):
+        queue = list(self.transitions[0].values())
+        for state in queue:
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fallback = self.failure[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.failure[fallback]
+                target = self.transitions[fallback].get(char, 0)
+                self.failure[next_state] = target if target != next_state else 0
+                suffix = self.failure[next_state]
+                self.output_links[next_state] = suffix if self.outputs[suffix] is not None else self.output_links[suffix]
+
+    def find(self, text):
+        """
+        Finds the terms in a text.
+
+        Overlapping matches are resolved leftmost-longest.
+
+        Returns:
+            list: (start, end, category, term) tuples in text order.
+        """
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            lowered = text  # Lowercasing changed the length; positions must line up with the original
+
+        matches = []
+        state = 0
+        transitions, failure, outputs, output_links = self.transitions, self.failure, self.outputs, self.output_links
+        for position, char in enumerate(lowered):
+            while state and char not in transitions[state]:
+                state = failure[state]
+            state = transitions[state].get(char, 0)
+
+            # Longest term ending here that sits on word boundaries, if any
+            end = position + 1
+            match_state = state if outputs[state] is not None else output_links[state]
+            while match_state:
+                length, category, term = outputs[match_state]
+                start = end - length
+                if not self.whole_words or self.is_word_boundary(text, start, end):
+                    break
+                match_state = output_links[match_state]
+            if not match_state:
+                continue
+
+            # Drop earlier matches this one overlaps if it starts at or before them
+            while matches and matches[-1][1] > start and matches[-1][0] >= start:
+                matches.pop()
+            if not matches or matches[-1][1] <= start:
+                matches.append((start, end, category, term))
+        return matches
+
+    @staticmethod
+    def is_word_boundary(text, start, end):
+        return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+class Scrubber:
+    """Replaces term and structural matches with "[CATEGORY]" tokens and counts what it replaced."""
+
+    def __init__(self, terms_by_category, structural_patterns=STRUCTURAL_PATTERNS, whole_words=True):
+        self.matcher = TermMatcher(terms_by_category, whole_words=whole_words)
+        self.structural = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in structural_patterns.items()))
+        self.counts = Counter()
+        self.term_counts = Counter()
+
+    def scrub(self, text):
+        """Returns the scrubbed text."""
+        if not text:
+            return text
+
+        # Structural patterns first, so an email's local part is not half-replaced as a username
+        text = self.structural.sub(self.replace_structural, text)
+
+        matches = self.matcher.find(text)
+        if not matches:
+            return text
+        pieces = []
+        position = 0
+        for start, end, category, term in matches:
+            pieces.append(text[position:start])
+            pieces.append(f"[{category.upper()}]")
+            position = end
+            self.counts[category] += 1
+            self.term_counts[f"{category}:{term}"] += 1
+        pieces.append(text[position:])
+        return "".join(pieces)
+
+    def replace_structural(self, match):
+        self.counts[match.lastgroup] += 1
+        return f"[{match.lastgroup.upper()}]"
+
+    def take_counts(self):
+        """Returns and resets the replacement counts."""
+        counts, term_counts = self.counts, self.term_counts
+        self.counts, self.term_counts = Counter(), Counter()
+        return counts, term_counts
+
+
+def load_term_files(term_specs):
+    """
+    Reads "category=path" term file specs.
+
+    Returns:
+        dict: Category mapped to its list of terms.
+    """
+    terms_by_category = {}
+    for spec in term_specs:
+        category, _, path = spec.partition("=")
+        if not path:
+            raise ValueError(f"Term list {spec!r} must be given as category=path.")
+        with open(path, "r", encoding="utf-8") as file:
+            terms_by_category.setdefault(category, []).extend(line.strip() for line in file if line.strip())
+    return terms_by_category
+
+
+def scrub_chat_csv(scrubber, source_path, dest_path):
+    """Streams a chat CSV into `dest_path`, scrubbing the Message column and replacing the Username column."""
+    with open(source_path, "r", newline="", encoding="utf-8") as source, \
+            open(dest_path, "w", newline="", encoding="utf-8") as dest:
+        reader = csv.reader(source)
+        writer = csv.writer(dest)
+        header = next(reader, None)
+        if header is None:
+            return
+        writer.writerow(header)
+        message_column = header.index("Message") if "Message" in header else 2
+        username_column = header.index("Username") if "Username" in header else 1
+        for row in reader:
+            if len(row) > message_column:
+                row[message_column] = scrubber.scrub(row[message_column])
+            if len(row) > username_column and row[username_column]:
+                row[username_column] = USERNAME_TOKEN
+                scrubber.counts["username"] += 1
+            writer.writerow(row)
+
+
+def scrub_text_file(scrubber, source_path, dest_path):
+    """Streams a transcript into `dest_path` line by line."""
+    with open(source_path, "r", encoding="utf-8") as source, open(dest_path, "w", encoding="utf-8") as dest:
+        for line in source:
+            dest.write(scrubber.scrub(line))
+
+
+def scrub_segments_file(scrubber, source_path, dest_path):
+    """Streams a segments file into `dest_path`, scrubbing each segment's text."""
+    with open(source_path, "r", encoding="utf-8") as source, open(dest_path, "w", encoding="utf-8") as dest:
+        for line in source:
+            if not line.strip():
+                continue
+            segment = json.loads(line)
+            segment["text"] = scrubber.scrub(segment["text"])
+            dest.write(json.dumps(segment, ensure_ascii=False) + "\n")
+
+
+def get_scrub_targets(vod_id):
+    """Returns (filename, scrub function) for every file of a VOD folder that is scrubbed."""
+    return [
+        (f"{vod_id}_chat.csv", scrub_chat_csv),
+        (f"formatted_{vod_id}_transcription.txt", scrub_text_file),
+        (f"{vod_id}_raw_transcript.txt", scrub_text_file),
+        (f"{vod_id}_segments.jsonl", scrub_segments_file),
+    ]
+
+
+# Built once per worker process by init_worker, so the automaton is not pickled for every VOD
+worker_scrubber = None
+
+
+def init_worker(terms_by_category, whole_words):
+    global worker_scrubber
+    worker_scrubber = Scrubber(terms_by_category, whole_words=whole_words)
+
+
+def scrub_vod_folder(vod_folder, vod_id, output_folder, overwrite=False):
+    """
+    Scrubs the chat and transcripts of one VOD folder into `output_folder`.
+
+    Returns:
+        tuple: (vod_id, {filename: {category: count}}, term counts), or (vod_id, None, None) if skipped.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    file_counts = {}
+    term_counts = Counter()
+    for filename, scrub_file in get_scrub_targets(vod_id):
+        source_path = os.path.join(vod_folder, filename)
+        dest_path = os.path.join(output_folder, filename)
+        if not os.path.exists(source_path) or (os.path.exists(dest_path) and not overwrite):
+            continue
+        temp_path = f"{dest_path}.tmp"
+        scrub_file(worker_scrubber, source_path, temp_path)
+        os.replace(temp_path, dest_path)
+        counts, terms = worker_scrubber.take_counts()
+        file_counts[filename] = dict(counts)
+        term_counts.update(terms)
+
+    if not file_counts:
+        return vod_id, None, None
+    return vod_id, file_counts, term_counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrub PII and profanity from chat and transcripts into a publishable copy.")
+    parser.add_argument("transcripts_folder", nargs="?", default=DEFAULT_TRANSCRIPTS_FOLDER)
+    parser.add_argument("output_folder", help="Where the scrubbed copy of the transcripts tree is written")
+    parser.add_argument("--terms", action="append", default=[], metavar="CATEGORY=PATH",
+                        help="Term list to scrub, one term per line (repeatable)")
+    parser.add_argument("--substrings", action="store_true", help="Also match terms inside longer words")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--overwrite", action="store_true", help="Rescrub files that already exist in the output")
+    args = parser.parse_args()
+
+    terms_by_category = load_term_files(args.terms)
+    vod_folders = list(iter_vod_folders(args.transcripts_folder))
+    print(f"Scrubbing {len(vod_folders)} VOD folders against "
+          f"{sum(len(terms) for terms in terms_by_category.values())} terms with {args.workers} workers...")
+
+    report = {"vods": {}, "totals": Counter(), "terms": Counter()}
+    scrubbed = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(terms_by_category, not args.substrings)) as executor:
+        futures = [
+            executor.submit(scrub_vod_folder, vod_folder, vod_id,
+                            os.path.join(args.output_folder, channel_name, vod_id), args.overwrite)
+            for channel_name, vod_id, vod_folder in vod_folders
+        ]
+        for future in as_completed(futures):
+            try:
+                vod_id, file_counts, term_counts = future.result()
+            except Exception as e:
+                print(f"Failed to scrub VOD: {e}")
+                failed += 1
+                continue
+            if file_counts is None:
+                skipped += 1
+                continue
+            scrubbed += 1
+            report["vods"][vod_id] = file_counts
+            report["terms"].update(term_counts)
+            for counts in file_counts.values():
+                report["totals"].update(counts)
+
+    report["terms"] = dict(report["terms"].most_common())
+    report_path = os.path.join(args.output_folder, SCRUB_REPORT_FILENAME)
+    with open(report_path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+
+    print(f"Scrubbed {scrubbed} VODs, skipped {skipped}, failed {failed}.")
+    for category, count in report["totals"].most_common():
+        print(f"  {category}: {count} replacements")
+    print(f"Wrote scrub report to: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+Per-segment transcript files.
+
+`transcribe` writes every Whisper segment to a segment store, <basename>_segments.bin: an
+append-only binary file with the detected language in its header and one record per segment
+(start, end, avg_logprob, no_speech_prob, compression_ratio, text and, when the decoder
+produced them, word timings). Everything the text transcripts are made of is in the store, so
+they can be regenerated from it with any paragraph threshold without running the model again.
+VOD folders from before the store have <basename>_segments.jsonl (start, end and text) or only
+the formatted transcript, whose paragraph markers are used as coarse segments instead.
+
+TranscriptWriter writes the formatted transcript, the raw transcript and the segment store in
+one pass as segments come out of the decoder, so a transcription never holds all of its
+segments in memory.
+
+Usage (bulk-regenerate the text transcripts of existing VOD folders):
+    python segment_store.py [transcripts_folder] [--silence-threshold 1.5] [--output-folder DIR] [--workers N] [--overwrite]
+"""
+import argparse
+import json
+import os
+import re
+import struct
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from chat_store import DEFAULT_TRANSCRIPTS_FOLDER, iter_vod_folders
+
+SEGMENT_STORE_SUFFIX = "_segments.bin"
+SEGMENTS_SUFFIX = "_segments.jsonl"  # Segments of VODs transcribed before the segment store
+
+SEGMENT_STORE_MAGIC = b"VSEGS001"
+# Magic, language code and language probability
+STORE_HEADER = struct.Struct("<8s8sd")
+# Start, end, avg_logprob, no_speech_prob, compression_ratio, text size in bytes and word count
+SEGMENT_RECORD = struct.Struct("<2d3f2I")
+# Start and end relative to the segment's start, probability and text size in bytes
+WORD_RECORD = struct.Struct("<3fH")
+
+# "(12 end - 345.67)" and "(13 start - 350.10)" markers written between paragraphs of the formatted transcript
+PARAGRAPH_MARKER_PATTERN = re.compile(r"^\((\d+) (start|end) - (\d+(?:\.\d+)?)\)$")
+
+SILENCE_THRESHOLD_SECONDS = 1.5  # A longer gap between segments starts a new paragraph
+FLUSH_INTERVAL_SECONDS = 10  # How often the transcript files are flushed while they are written
+RECENT_SEGMENTS_KEPT = 8  # Text of the last few segments, kept as the decoder prompt for a resume
+
+
+# Segments read back from a store, in the shape of faster-whisper's segments
+StoredSegment = namedtuple("StoredSegment", ["start", "end", "text", "avg_logprob", "no_speech_prob", "compression_ratio", "words"])
+StoredWord = namedtuple("StoredWord", ["start", "end", "word", "probability"])
+
+
+def segment_from_dict(segment):
+    """Converts a segment dictionary read from any source to a StoredSegment; missing scores are 0."""
+    return StoredSegment(
+        segment["start"], segment["end"], f" {segment['text'].strip()}", segment.get("avg_logprob", 0.0),
+        segment.get("no_speech_prob", 0.0), segment.get("compression_ratio", 0.0),
+        [StoredWord(**word) for word in segment.get("words", ())] or None,
+    )
+
+
+def segment_to_dict(segment):
+    """Converts a faster-whisper segment to the dictionary stored in the old segments file."""
+    return {"start": round(segment.start, 3), "end": round(segment.end, 3), "text": segment.text.strip()}
+
+
+def pack_segment(segment):
+    """Encodes a faster-whisper segment as a segment store record."""
+    text = segment.text.strip().encode("utf-8")
+    words = getattr(segment, "words", None) or ()
+    parts = [
+        SEGMENT_RECORD.pack(segment.start, segment.end, segment.avg_logprob, segment.no_speech_prob,
+                            segment.compression_ratio, len(text), len(words)),
+        text,
+    ]
+    for word in words:
+        word_text = word.word.encode("utf-8")
+        parts.append(WORD_RECORD.pack(word.start - segment.start, word.end - segment.start, word.probability, len(word_text)))
+        parts.append(word_text)
+    return b"".join(parts)
+
+
+class TranscriptWriter:
+    """
+    Writes the formatted transcript, raw transcript and segments file as segments arrive.
+
+    The formatted transcript groups segments into paragraphs separated by silences longer than
+    SILENCE_THRESHOLD_SECONDS, with "(N end - t)" / "(N+1 start - t)" markers between them; the
+    raw transcript starts a new line at the same silences. Only the current paragraph is held
+    in memory, and all files are flushed every FLUSH_INTERVAL_SECONDS. Without a segments path
+    only the two text transcripts are written.
+
+    get_state() captures everything needed to carry on later: passing it back as `resume_state`
+    truncates the files to the sizes they had at that point and continues exactly where the
+    writer left off.
+    """
+
+    def __init__(self, formatted_path, raw_path, segments_path, language, language_probability,
+                 silence_threshold=SILENCE_THRESHOLD_SECONDS, flush_interval=FLUSH_INTERVAL_SECONDS, resume_state=None):
+        self.silence_threshold = silence_threshold
+        self.flush_interval = flush_interval
+        self.paths = tuple(path for path in (formatted_path, raw_path, segments_path) if path)
+        self.last_flush = time()
+
+        if resume_state is None:
+            self.open_files(formatted_path, raw_path, segments_path, "w")
+            self.segment_count = 0
+            self.word_count = 0
+            self.prev_end_time = 0.0
+            self.buffer = ""
+            self.recent_texts = deque(maxlen=RECENT_SEGMENTS_KEPT)
+            self.formatted_file.write(f"Detected language: {language} (probability: {language_probability:.6f})\n\n")
+            if self.segments_file:
+                self.segments_file.write(STORE_HEADER.pack(SEGMENT_STORE_MAGIC, language.encode("ascii")[:8], language_probability))
+        else:
+            # Anything written after the checkpoint is discarded and rewritten
+            for path, size in zip(self.paths, resume_state["file_sizes"]):
+                os.truncate(path, size)
+            self.open_files(formatted_path, raw_path, segments_path, "a")
+            self.segment_count = resume_state["segment_count"]
+            self.word_count = resume_state["word_count"]
+            self.prev_end_time = resume_state["prev_end_time"]
+            self.buffer = resume_state["buffer"]
+            self.recent_texts = deque(resume_state["recent_texts"], maxlen=RECENT_SEGMENTS_KEPT)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(finish=exc_type is None)
+
+    def open_files(self, formatted_path, raw_path, segments_path, mode):
+        self.formatted_file = open(formatted_path, mode, encoding="utf-8")
+        self.raw_file = open(raw_path, mode, encoding="utf-8")
+        self.segments_file = open(segments_path, f"{mode}b") if segments_path else None
+
+    @property
+    def files(self):
+        return tuple(file for file in (self.formatted_file, self.raw_file, self.segments_file) if file)
+
+    def write(self, segment):
+        """Appends a faster-whisper segment to all the files."""
+        self.segment_count += 1
+        text = segment.text.strip()
+        self.word_count += len(segment.text.split())
+
+        if segment.start - self.prev_end_time > self.silence_threshold:
+            if self.buffer:
+                self.formatted_file.write(self.buffer.strip() + "\n")
+                self.formatted_file.write(f"\n({self.segment_count - 1} end - {self.prev_end_time:.2f})\n")
+                self.formatted_file.write(f"({self.segment_count} start - {segment.start:.2f})\n\n")
+            self.buffer = ""
+            self.raw_file.write("\n")
+
+        self.buffer += f"{text} "
+        self.recent_texts.append(text)
+        self.raw_file.write(f"{text} ")
+        if self.segments_file:
+            self.segments_file.write(pack_segment(segment))
+        self.prev_end_time = segment.end
+
+        if time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self, sync=False):
+        for file in self.files:
+            file.flush()
+            if sync:
+                os.fsync(file.fileno())
+        self.last_flush = time()
+
+    @property
+    def recent_text(self):
+        return " ".join(self.recent_texts)
+
+    def get_state(self):
+        """
+        Flushes the files to disk and returns the writer's state as a JSON-serialisable dict.
+        """
+        self.flush(sync=True)
+        return {
+            "file_sizes": [os.fstat(file.fileno()).st_size for file in self.files],
+            "segment_count": self.segment_count,
+            "word_count": self.word_count,
+            "prev_end_time": self.prev_end_time,
+            "buffer": self.buffer,
+            "recent_texts": list(self.recent_texts),
+        }
+
+    def close(self, finish=True):
+        """Writes the last paragraph (unless the transcription failed) and closes the files."""
+        if finish and self.buffer:
+            self.formatted_file.write(self.buffer.strip() + "\n")
+            self.formatted_file.write(f"\n({self.segment_count} end - {self.prev_end_time:.2f})\n")
+            self.buffer = ""
+        for file in self.files:
+            file.close()
+
+
+def can_resume_writer(resume_state, paths):
+    """True if the files still hold at least everything the writer state says was written."""
+    return all(
+        os.path.exists(path) and os.path.getsize(path) >= size
+        for path, size in zip(paths, resume_state["file_sizes"])
+    )
+
+
+def read_segment_store_header(data, path):
+    """Returns (language, language probability) from the start of a segment store."""
+    magic, language, language_probability = STORE_HEADER.unpack_from(data, 0)
+    if magic != SEGMENT_STORE_MAGIC:
+        raise ValueError(f"{path} is not a segment store file.")
+    return language.rstrip(b"\0").decode("ascii"), language_probability
+
+
+def read_segment_store(path):
+    """
+    Reads a segment store.
+
+    A record cut short by a transcription that was interrupted while writing it is ignored.
+
+    Returns:
+        tuple: (language, language probability, segments), where every segment is a dictionary
+        with start, end, text, avg_logprob, no_speech_prob, compression_ratio and, if the
+        store has word timings, words (start, end, word, probability).
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    language, language_probability = read_segment_store_header(data, path)
+
+    segments = []
+    position = STORE_HEADER.size
+    while position + SEGMENT_RECORD.size <= len(data):
+        start, end, avg_logprob, no_speech_prob, compression_ratio, text_size, word_count = SEGMENT_RECORD.unpack_from(data, position)
+        position += SEGMENT_RECORD.size
+        segment = {
+            "start": start,
+            "end": end,
+            "text": data[position:position + text_size].decode("utf-8", errors="replace"),
+            "avg_logprob": round(avg_logprob, 4),
+            "no_speech_prob": round(no_speech_prob, 4),
+            "compression_ratio": round(compression_ratio, 4),
+        }
+        position += text_size
+        if word_count:
+            words = []
+            for _ in range(word_count):
+                if position + WORD_RECORD.size > len(data):
+                    break
+                word_start, word_end, probability, word_size = WORD_RECORD.unpack_from(data, position)
+                position += WORD_RECORD.size
+                words.append({
+                    "start": round(start + word_start, 3),
+                    "end": round(start + word_end, 3),
+                    "word": data[position:position + word_size].decode("utf-8", errors="replace"),
+                    "probability": round(probability, 4),
+                })
+                position += word_size
+            segment["words"] = words
+        if position > len(data) or len(segment.get("words", ())) < word_count:
+            break
+        segments.append(segment)
+    return language, language_probability, segments
+
+
+def iter_segments(path):
+    """Yields the segments of an old segments file as dictionaries with start, end and text."""
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_formatted_transcript_paragraphs(path):
+    """
+    Yields the paragraphs of a formatted transcript as coarse segments.
+
+    Paragraph boundaries carry the end time of the paragraph before and the start time of the
+    one after; the first paragraph is assumed to start at 0.
+    """
+    start = 0.0
+    lines = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith("Detected language:"):
+                continue
+            match = PARAGRAPH_MARKER_PATTERN.match(line)
+            if match is None:
+                if line:
+                    lines.append(line)
+            elif match.group(2) == "end":
+                yield {"start": start, "end": float(match.group(3)), "text": " ".join(lines)}
+                lines = []
+            else:
+                start = float(match.group(3))
+
+
+def find_segments_source(vod_folder, vod_id):
+    """
+    Returns the segment store of a VOD folder, falling back to the old segments file and then
+    to its formatted transcript.
+    """
+    for filename in (f"{vod_id}{SEGMENT_STORE_SUFFIX}", f"{vod_id}{SEGMENTS_SUFFIX}", f"formatted_{vod_id}_transcription.txt"):
+        path = os.path.join(vod_folder, filename)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def iter_vod_segments(vod_folder, vod_id):
+    """Yields the segments of a VOD in time order, from whichever source the folder has."""
+    path = find_segments_source(vod_folder, vod_id)
+    if path is None:
+        return iter(())
+    if path.endswith(SEGMENT_STORE_SUFFIX):
+        return iter(read_segment_store(path)[2])
+    if path.endswith(SEGMENTS_SUFFIX):
+        return iter_segments(path)
+    return iter_formatted_transcript_paragraphs(path)
+
+
+def load_segment_arrays(vod_folder, vod_id):
+    """
+    Loads the segments of a VOD as arrays.
+
+    Returns:
+        tuple: (starts, ends, texts) where starts and ends are float64 arrays.
+    """
+    segments = list(iter_vod_segments(vod_folder, vod_id))
+    starts = np.array([segment["start"] for segment in segments], dtype=np.float64)
+    ends = np.array([segment["end"] for segment in segments], dtype=np.float64)
+    return starts, ends, [segment["text"] for segment in segments]
+
+
+def read_transcript_language(formatted_path):
+    """The language line of a formatted transcript, as (language, probability), or None."""
+    if not os.path.exists(formatted_path):
+        return None
+    with open(formatted_path, "r", encoding="utf-8") as file:
+        match = re.match(r"Detected language: (\S+) \(probability: ([\d.]+)\)", file.readline())
+    return (match.group(1), float(match.group(2))) if match else None
+
+
+def regenerate_text_views(vod_folder, vod_id, output_folder=None, silence_threshold=SILENCE_THRESHOLD_SECONDS, overwrite=False):
+    """
+    Rewrites the formatted and raw transcripts of one VOD folder from its segments.
+
+    VODs without a segment store fall back to the old segments file, with the language taken
+    from the existing formatted transcript. Folders with neither are skipped: their formatted
+    transcript is the only copy of the text.
+
+    Returns:
+        tuple: (vod_id, segment count, or None if skipped).
+    """
+    output_folder = output_folder or vod_folder
+    formatted_path = os.path.join(output_folder, f"formatted_{vod_id}_transcription.txt")
+    raw_path = os.path.join(output_folder, f"{vod_id}_raw_transcript.txt")
+    if os.path.exists(formatted_path) and not overwrite:
+        return vod_id, None
+
+    store_path = os.path.join(vod_folder, f"{vod_id}{SEGMENT_STORE_SUFFIX}")
+    jsonl_path = os.path.join(vod_folder, f"{vod_id}{SEGMENTS_SUFFIX}")
+    if os.path.exists(store_path):
+        language, language_probability, segments = read_segment_store(store_path)
+    elif os.path.exists(jsonl_path):
+        language, language_probability = read_transcript_language(
+            os.path.join(vod_folder, f"formatted_{vod_id}_transcription.txt")) or ("en", 1.0)
+        segments = iter_segments(jsonl_path)
+    else:
+        return vod_id, None
+
+    os.makedirs(output_folder, exist_ok=True)
+    temp_paths = (f"{formatted_path}.tmp", f"{raw_path}.tmp")
+    with TranscriptWriter(*temp_paths, None, language, language_probability, silence_threshold=silence_threshold) as writer:
+        for segment in segments:
+            writer.write(SimpleNamespace(**segment))
+    for temp_path, path in zip(temp_paths, (formatted_path, raw_path)):
+        os.replace(temp_path, path)
+    return vod_id, writer.segment_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate the text transcripts of every VOD from its segments.")
+    parser.add_argument("transcripts_folder", nargs="?", default=DEFAULT_TRANSCRIPTS_FOLDER)
+    parser.add_argument("--silence-threshold", type=float, default=SILENCE_THRESHOLD_SECONDS,
+                        help="Seconds of silence between segments that start a new paragraph")
+    parser.add_argument("--output-folder", default=None,
+                        help="Write the transcripts to <output folder>/<channel>/<vod_id> instead of the VOD folders")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--overwrite", action="store_true", help="Replace transcripts that already exist")
+    args = parser.parse_args()
+
+    vod_folders = list(iter_vod_folders(args.transcripts_folder))
+    print(f"Regenerating transcripts for {len(vod_folders)} VOD folders with a {args.silence_threshold}s "
+          f"paragraph threshold and {args.workers} workers...")
+
+    regenerated = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(regenerate_text_views, vod_folder, vod_id,
+                            os.path.join(args.output_folder, channel_name, vod_id) if args.output_folder else None,
+                            args.silence_threshold, args.overwrite)
+            for channel_name, vod_id, vod_folder in vod_folders
+        ]
+        for future in as_completed(futures):
+            try:
+                vod_id, segment_count = future.result()
+            except Exception as e:
+                print(f"Failed to regenerate transcripts: {e}")
+                failed += 1
+                continue
+            if segment_count is None:
+                skipped += 1
+            else:
+                regenerated += 1
+
+    print(f"Regenerated {regenerated} VODs, skipped {skipped}, failed {failed}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+"""
+Resident transcription worker.
+
+Loading the Whisper model takes a long time and a lot of memory, so instead of every script
+loading its own copy, a daemon loads it once and serves transcription jobs over a local
+Unix socket:
+
+    python transcribe_daemon.py serve [--socket PATH] [--concurrency 1] [--device cpu]
+    python transcribe_daemon.py health
+    python transcribe_daemon.py transcribe vod.mp3
+    python transcribe_daemon.py cancel JOB_ID
+
+The protocol is one JSON object per line, one request per connection:
+    {"op": "transcribe", "audio_file": ..., "vad_settings": {...}, "clip_timestamps": [...], "options": {...},
+     "two_pass": false}
+    {"op": "detect_language", "audio_file": ..., "duration_seconds": ..., "vad_settings": {...}}
+    {"op": "cancel", "job_id": ...}
+    {"op": "health"}
+
+A transcribe request is answered with "queued", then "info" once decoding starts, one
+"segment" message per segment as the decoder produces it, and finally "done", "cancelled" or
+"error". Without clip timestamps the daemon decodes the whole file and finds the speech with
+VAD itself; with them, only the audio the clips span is decoded. With two_pass, the job
+decodes greedily and re-decodes low-confidence segments with the beam search options itself
+(see two_pass_decode.py). A detect_language job samples the file's language (see
+language_gate.py) and answers with a single "done" carrying the result.
+
+Transcriptions run in arrival order, at most `concurrency` at a time. detect_language jobs have
+a lane of their own with LANGUAGE_WORKERS workers, so the language gate of one VOD never waits
+for another VOD's transcription to finish. Each job buffers at most
+MAX_QUEUED_MESSAGES messages, so a client that reads slowly holds its decoding back.
+Cancelling a job, or disconnecting from it, stops its decoding at the next segment.
+
+The pipeline sends its sequential transcriptions to the daemon when WHISPER_DAEMON_SOCKET is
+set; WHISPER_DAEMON_CONCURRENCY sets the default concurrency.
+"""
+import argparse
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import tempfile
+import threading
+from collections import deque, namedtuple
+from time import time
+
+from language_gate import sample_languages, get_language_gate_model, load_audio_window, get_audio_duration
+from two_pass_decode import redecode_low_confidence, format_two_pass_stats, FIRST_PASS_OPTIONS
+from whisper_backend import get_whisper_model, get_model_profile, get_speech_regions, merge_speech_regions, decode_audio, \
+    transcribe_clips, shift_segment, get_model_name, SAMPLING_RATE, CLIP_PADDING_SECONDS
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "whisper-daemon.sock")
+HEALTH_TIMEOUT_SECONDS = 2.0
+MAX_QUEUED_MESSAGES = 64  # Messages a job buffers before its decoding waits for the client
+SEND_RETRY_SECONDS = 0.5  # How often a job waiting on a full buffer checks for cancellation
+LANGUAGE_WORKERS = 1  # Workers serving detect_language jobs, next to the `concurrency` transcription workers
+
+FINAL_MESSAGE_TYPES = {"done", "cancelled", "error"}
+
+RemoteSegment = namedtuple("RemoteSegment", ["start", "end", "text", "avg_logprob", "no_speech_prob", "compression_ratio", "words"])
+RemoteWord = namedtuple("RemoteWord", ["start", "end", "word", "probability"])
+RemoteInfo = namedtuple("RemoteInfo", ["job_id", "language", "language_probability", "duration", "speech_seconds"])
+
+
+class DaemonError(RuntimeError):
+    """A transcription job failed or was cancelled in the daemon."""
+
+
+def get_daemon_socket():
+    """The socket the pipeline sends its transcriptions to (WHISPER_DAEMON_SOCKET), or None."""
+    return os.getenv("WHISPER_DAEMON_SOCKET")
+
+
+def get_default_concurrency():
+    """Jobs the daemon decodes at the same time unless told otherwise (WHISPER_DAEMON_CONCURRENCY)."""
+    return int(os.getenv("WHISPER_DAEMON_CONCURRENCY", 1))
+
+
+class TranscriptionJob:
+    def __init__(self, job_id, request):
+        self.job_id = job_id
+        self.request = request
+        self.messages = queue.Queue(MAX_QUEUED_MESSAGES)
+        self.cancelled = threading.Event()
+        self.submitted_at = time()
+
+    def send(self, message_type, **fields):
+        """
+        Queues a message for the client, waiting while its buffer is full.
+
+        Returns False if the job was cancelled while waiting. The final message of a cancelled
+        job is still delivered: the segments nobody will read are dropped to make room for it.
+        """
+        message = {"type": message_type, "job_id": self.job_id, **fields}
+        while True:
+            try:
+                self.messages.put(message, timeout=SEND_RETRY_SECONDS)
+                return True
+            except queue.Full:
+                if not self.cancelled.is_set():
+                    continue
+                if message_type not in FINAL_MESSAGE_TYPES:
+                    return False
+                self.drop_messages()
+
+    def drop_messages(self):
+        while True:
+            try:
+                self.messages.get_nowait()
+            except queue.Empty:
+                return
+
+
+class TranscriptionDaemon:
+    """
+    The job queue and the worker threads sharing the loaded model.
+
+    The model is loaded with one CTranslate2 worker per concurrent job, so up to `concurrency`
+    transcriptions decode at the same time; the rest wait in arrival order. detect_language
+    jobs are queued separately and served by their own LANGUAGE_WORKERS workers.
+    """
+
+    def __init__(self, concurrency=None, device=None):
+        self.concurrency = max(1, concurrency or get_default_concurrency())
+        self.condition = threading.Condition()
+        self.pending = deque()
+        self.language_pending = deque()
+        self.running = {}
+        self.counts = {"completed": 0, "cancelled": 0, "failed": 0}
+        self.job_ids = itertools.count(1)
+        self.started_at = time()
+
+        os.environ.setdefault("WHISPER_NUM_WORKERS", str(self.concurrency))
+        self.device = device
+        self.model = get_whisper_model(device)
+        for _ in range(self.concurrency):
+            threading.Thread(target=self._work, args=(self.pending,), daemon=True).start()
+        for _ in range(LANGUAGE_WORKERS):
+            threading.Thread(target=self._work, args=(self.language_pending,), daemon=True).start()
+
+    def submit(self, request):
+        """Queues a transcribe or detect_language request in its lane and returns its job."""
+        pending = self.language_pending if request["op"] == "detect_language" else self.pending
+        with self.condition:
+            job = TranscriptionJob(next(self.job_ids), request)
+            pending.append(job)
+            job.send("queued", position=len(pending))
+            self.condition.notify_all()  # The workers of both lanes wait on the same condition
+        return job
+
+    def cancel(self, job_id):
+        """Cancels a queued or running job. Returns False if there is no such job."""
+        with self.condition:
+            for pending in (self.pending, self.language_pending):
+                job = next((job for job in pending if job.job_id == job_id), None)
+                if job is not None:
+                    pending.remove(job)
+                    self.counts["cancelled"] += 1
+                    job.cancelled.set()
+                    job.send("cancelled")
+                    return True
+            job = self.running.get(job_id)
+            if job is None:
+                return False
+            job.cancelled.set()  # The worker stops at the next segment
+            return True
+
+    def health(self):
+        profile = get_model_profile() or {}
+        with self.condition:
+            return {
+                "status": "ok",
+                "model": get_model_name(),
+                "device": profile.get("device"),
+                "compute_type": profile.get("compute_type"),
+                "uptime_seconds": round(time() - self.started_at, 1),
+                "concurrency": self.concurrency,
+                "queued": [job.job_id for job in self.pending],
+                "language_queued": [job.job_id for job in self.language_pending],
+                "running": sorted(self.running),
+                **self.counts,
+            }
+
+    def _work(self, pending):
+        """Runs the jobs of one lane (`pending`) one at a time."""
+        while True:
+            with self.condition:
+                while not pending:
+                    self.condition.wait()
+                job = pending.popleft()
+                self.running[job.job_id] = job
+
+            try:
+                outcome = self.run_job(job)
+            except Exception as e:
+                print(f"Job {job.job_id} failed: {e}")
+                job.send("error", error=str(e))
+                outcome = "failed"
+            with self.condition:
+                del self.running[job.job_id]
+                self.counts[outcome] += 1
+
+    def run_job(self, job):
+        """Decodes one job, streaming its segments. Returns "completed" or "cancelled"."""
+        request = job.request
+        start_time = time()
+        if request["op"] == "detect_language":
+            print(f"Job {job.job_id}: detecting the language of {request['audio_file']}...")
+            result = sample_languages(get_language_gate_model(self.device), request["audio_file"], request.get("duration_seconds"),
+                                      request.get("vad_settings"))
+            job.send("done", seconds=round(time() - start_time, 3), **result)
+            return "completed"
+
+        options = dict(request.get("options") or {})
+        options.setdefault("beam_size", 5)
+        options.setdefault("language", "en")
+        print(f"Job {job.job_id}: transcribing {request['audio_file']}...")
+
+        clip_timestamps = request.get("clip_timestamps")
+        speech_seconds = None
+        offset = 0.0
+        if clip_timestamps is None:
+            audio = decode_audio(request["audio_file"], sampling_rate=SAMPLING_RATE)
+            duration = len(audio) / SAMPLING_RATE
+            speech_regions = get_speech_regions(audio, request.get("vad_settings"))
+            clip_timestamps = [timestamp for clip in merge_speech_regions(speech_regions) for timestamp in clip]
+            speech_seconds = sum(end - start for start, end in speech_regions)
+        else:
+            # Only the audio the clips span is decoded, so a restart late in a long VOD decodes minutes, not hours
+            duration = get_audio_duration(request["audio_file"])
+            if clip_timestamps:
+                offset = max(clip_timestamps[0] - CLIP_PADDING_SECONDS, 0.0)
+                audio = load_audio_window(request["audio_file"], offset, clip_timestamps[-1] + CLIP_PADDING_SECONDS - offset)
+                clip_timestamps = [timestamp - offset for timestamp in clip_timestamps]
+
+        if not clip_timestamps:  # Nothing but silence
+            job.send("info", language=options["language"], language_probability=1.0, duration=duration,
+                     speech_seconds=speech_seconds)
+            job.send("done", segments=0, seconds=round(time() - start_time, 3))
+            return "completed"
+
+        two_pass_stats = None
+        if request.get("two_pass"):
+            two_pass_stats = {}
+            segments, info = transcribe_clips(self.model, audio, clip_timestamps, **{**options, **FIRST_PASS_OPTIONS})
+
+            def redecode(start, end, prompt):
+                clips = [timestamp for clip_start, clip_end in zip(clip_timestamps[::2], clip_timestamps[1::2])
+                         if clip_end > start and clip_start < end for timestamp in (max(clip_start, start), min(clip_end, end))]
+                return transcribe_clips(self.model, audio, clips, **{**options, "initial_prompt": prompt})[0] if clips else []
+
+            segments = redecode_low_confidence(segments, redecode, two_pass_stats)
+        else:
+            segments, info = transcribe_clips(self.model, audio, clip_timestamps, **options)
+        if offset:
+            segments = (shift_segment(segment, offset) for segment in segments)
+        job.send("info", language=info.language, language_probability=info.language_probability, duration=duration,
+                 speech_seconds=speech_seconds)
+        segment_count = 0
+        for segment in segments:
+            if job.cancelled.is_set():
+                break
+            if not job.send("segment", start=segment.start, end=segment.end, text=segment.text,
+                            avg_logprob=segment.avg_logprob, no_speech_prob=segment.no_speech_prob,
+                            compression_ratio=segment.compression_ratio,
+                            words=[[word.start, word.end, word.word, word.probability] for word in segment.words or ()] or None):
+                break
+            segment_count += 1
+
+        if job.cancelled.is_set():
+            print(f"Job {job.job_id}: cancelled after {segment_count} segments.")
+            job.send("cancelled")
+            return "cancelled"
+        print(f"Job {job.job_id}: {segment_count} segments in {time() - start_time:.1f} seconds.")
+        if two_pass_stats:
+            print(f"Job {job.job_id}: {format_two_pass_stats(two_pass_stats)}")
+        job.send("done", segments=segment_count, seconds=round(time() - start_time, 3))
+        return "completed"
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    def send(self, message):
+        self.wfile.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        daemon = self.server.daemon
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError as e:
+            self.send({"type": "error", "error": f"Invalid request: {e}"})
+            return
+
+        op = request.get("op")
+        if op == "health":
+            self.send({"type": "health", **daemon.health()})
+        elif op == "cancel":
+            cancelled = daemon.cancel(request.get("job_id"))
+            self.send({"type": "cancelled"} if cancelled else {"type": "error", "error": "No such job"})
+        elif op in ("transcribe", "detect_language"):
+            if not request.get("audio_file"):
+                self.send({"type": "error", "error": "audio_file is required"})
+                return
+            job = daemon.submit(request)
+            try:
+                while True:
+                    message = job.messages.get()
+                    self.send(message)
+                    if message["type"] in FINAL_MESSAGE_TYPES:
+                        break
+            except OSError:
+                # The client went away; nobody is reading the rest of this job
+                daemon.cancel(job.job_id)
+        else:
+            self.send({"type": "error", "error": f"Unknown op {op!r}"})
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, daemon):
+        self.daemon = daemon
+        super().__init__(socket_path, DaemonRequestHandler)
+
+
+def serve(socket_path=DEFAULT_SOCKET_PATH, concurrency=None, device=None):
+    """Loads the model and serves jobs until interrupted."""
+    if os.path.exists(socket_path):
+        if get_daemon_health(socket_path) is not None:
+            raise RuntimeError(f"A transcription daemon is already listening on {socket_path}")
+        os.remove(socket_path)  # Left behind by a daemon that did not shut down cleanly
+
+    daemon = TranscriptionDaemon(concurrency, device)
+    with DaemonServer(socket_path, daemon) as server:
+        print(f"Transcription daemon listening on {socket_path} ({daemon.concurrency} concurrent jobs).")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Shutting down the transcription daemon...")
+        finally:
+            os.remove(socket_path)
+
+
+def iter_daemon_messages(request, socket_path=None, timeout=None):
+    """Sends one request to the daemon and yields its replies until the final one."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(socket_path or get_daemon_socket() or DEFAULT_SOCKET_PATH)
+        connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with connection.makefile("r", encoding="utf-8") as replies:
+            for line in replies:
+                message = json.loads(line)
+                yield message
+                if message["type"] in FINAL_MESSAGE_TYPES or message["type"] == "health":
+                    return
+    raise DaemonError("The transcription daemon closed the connection")
+
+
+def get_daemon_health(socket_path=None):
+    """The daemon's health report, or None if no daemon is answering on the socket."""
+    try:
+        return next(iter_daemon_messages({"op": "health"}, socket_path, timeout=HEALTH_TIMEOUT_SECONDS))
+    except (OSError, ValueError, DaemonError):
+        return None
+
+
+def cancel_job(job_id, socket_path=None):
+    """Cancels a daemon job. Returns False if the daemon does not know the job."""
+    return next(iter_daemon_messages({"op": "cancel", "job_id": job_id}, socket_path))["type"] == "cancelled"
+
+
+def detect_language_remote(audio_file, duration_seconds=None, vad_settings=None, socket_path=None):
+    """Samples the language of an audio file with the daemon; returns what language_gate.sample_languages does."""
+    request = {"op": "detect_language", "audio_file": os.path.abspath(audio_file), "duration_seconds": duration_seconds,
+               "vad_settings": vad_settings}
+    for message in iter_daemon_messages(request, socket_path):
+        if message["type"] == "done":
+            return {key: value for key, value in message.items() if key not in ("type", "job_id", "seconds")}
+        if message["type"] != "queued":
+            raise DaemonError(message.get("error") or f"Job was {message['type']}")
+    raise DaemonError("The transcription daemon closed the connection")
+
+
+def transcribe_remote(audio_file, vad_settings=None, clip_timestamps=None, socket_path=None, two_pass=False, **options):
+    """
+    Transcribes an audio file with the daemon.
+
+    Mirrors WhisperModel.transcribe: blocks until the job starts decoding and returns its
+    info, while the segments are streamed lazily. Closing the segment generator early
+    cancels the job.
+
+    Args:
+        audio_file (str): Path to the audio file, as seen by the daemon.
+        vad_settings (dict): VAD settings the daemon finds the speech with, if no clip timestamps are given.
+        clip_timestamps (list): Flat [start, end, ...] list of the spans to decode, in seconds.
+        socket_path (str): The daemon's socket; defaults to WHISPER_DAEMON_SOCKET.
+        two_pass (bool): Decode greedily and re-decode low-confidence segments with beam search.
+        **options: Passed on to WhisperModel.transcribe (e.g. beam_size, initial_prompt).
+
+    Returns:
+        tuple: (generator of RemoteSegment, RemoteInfo)
+    """
+    request = {"op": "transcribe", "audio_file": os.path.abspath(audio_file), "vad_settings": vad_settings,
+               "clip_timestamps": clip_timestamps, "options": options, "two_pass": two_pass}
+    messages = iter_daemon_messages(request, socket_path)
+    for message in messages:
+        if message["type"] == "queued":
+            print(f"Queued as daemon job {message['job_id']} at position {message['position']}.")
+        elif message["type"] == "info":
+            info = RemoteInfo(message["job_id"], message["language"], message["language_probability"],
+                              message["duration"], message["speech_seconds"])
+            break
+        else:
+            raise DaemonError(message.get("error") or f"Job was {message['type']} before it started")
+    else:
+        raise DaemonError("The transcription daemon closed the connection")
+
+    def iter_segments():
+        try:
+            for message in messages:
+                if message["type"] == "segment":
+                    words = message["words"] and [RemoteWord(*word) for word in message["words"]]
+                    yield RemoteSegment(*(message[field] for field in RemoteSegment._fields[:-1]), words)
+                elif message["type"] == "done":
+                    return
+                else:
+                    raise DaemonError(message.get("error") or f"Job {info.job_id} was {message['type']}")
+        finally:
+            messages.close()  # Disconnecting cancels the job if it is still decoding
+
+    return iter_segments(), info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident Whisper transcription daemon.")
+    parser.add_argument("--socket", default=get_daemon_socket() or DEFAULT_SOCKET_PATH, help="The daemon's Unix socket")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Load the model and serve transcription jobs")
+    serve_parser.add_argument("--concurrency", type=int, default=None,
+                              help="Jobs decoded at the same time (default: WHISPER_DAEMON_CONCURRENCY or 1)")
+    serve_parser.add_argument("--device", default=None, help="auto, cuda or cpu (default: WHISPER_DEVICE)")
+
+    subparsers.add_parser("health", help="Show the daemon's status and job queue")
+
+    transcribe_parser = subparsers.add_parser("transcribe", help="Transcribe an audio file and print its segments")
+    transcribe_parser.add_argument("audio_file")
+    transcribe_parser.add_argument("--language", default="en")
+    transcribe_parser.add_argument("--beam-size", type=int, default=5)
+
+    cancel_parser = subparsers.add_parser("cancel", help="Cancel a queued or running job")
+    cancel_parser.add_argument("job_id", type=int)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.socket, args.concurrency, args.device)
+    elif args.command == "health":
+        health = get_daemon_health(args.socket)
+        if health is None:
+            raise SystemExit(f"No transcription daemon is answering on {args.socket}")
+        print(json.dumps(health, indent=2))
+    elif args.command == "transcribe":
+        segments, info = transcribe_remote(args.audio_file, socket_path=args.socket, language=args.language,
+                                           beam_size=args.beam_size)
+        print(f"Detected language: {info.language} (probability: {info.language_probability:.6f})")
+        for segment in segments:
+            print(f"[{segment.start:8.2f} -> {segment.end:8.2f}] {segment.text.strip()}")
+    elif args.command == "cancel":
+        if not cancel_job(args.job_id, args.socket):
+            raise SystemExit(f"The daemon has no job {args.job_id}")
+        print(f"Cancelled job {args.job_id}.")
+
+
+if __name__ == "__main__":
+    main()
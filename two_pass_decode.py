@@ -0,0 +1,100 @@
+"""
+Confidence-driven two-pass decoding.
+
+Beam search costs several times what greedy decoding does, yet most stream speech comes out
+the same either way. In two-pass mode the audio is decoded greedily first (without temperature
+fallback), and only the segments whose scores fall outside the bounds below are decoded again
+with beam search: a low average log probability, text that compresses like a loop, or a likely
+absence of speech. Consecutive flagged segments are re-decoded together as one clip, prompted
+with the text before them, and the beam search result is spliced in instead of them if it
+scores better.
+"""
+MIN_AVG_LOGPROB = -0.6
+MAX_COMPRESSION_RATIO = 2.4
+MAX_NO_SPEECH_PROB = 0.5
+MAX_REDECODE_SECONDS = 60.0  # Longer runs of flagged segments are re-decoded as several clips
+
+# Options that turn a beam search decode into the greedy first pass
+FIRST_PASS_OPTIONS = {"beam_size": 1, "best_of": 1, "temperature": 0.0}
+
+
+def is_low_confidence(segment):
+    return (segment.avg_logprob < MIN_AVG_LOGPROB or segment.compression_ratio > MAX_COMPRESSION_RATIO
+            or segment.no_speech_prob > MAX_NO_SPEECH_PROB)
+
+
+def get_mean_logprob(segments):
+    """Average log probability of segments, weighted by their duration."""
+    weights = [max(segment.end - segment.start, 0.01) for segment in segments]
+    return sum(segment.avg_logprob * weight for segment, weight in zip(segments, weights)) / sum(weights)
+
+
+def redecode_clip(flagged, redecode, prompt, stats):
+    """
+    Re-decodes the span of a run of flagged segments.
+
+    Returns:
+        list: The beam search segments if they score better (or if beam search hears no speech
+        there at all), otherwise the flagged greedy segments.
+    """
+    start, end = flagged[0].start, flagged[-1].end
+    segments = [segment for segment in redecode(start, end, prompt) if start <= (segment.start + segment.end) / 2 <= end]
+    stats["flagged_segments"] += len(flagged)
+    stats["flagged_seconds"] += end - start
+    stats["redecoded_clips"] += 1
+    if segments and get_mean_logprob(segments) < get_mean_logprob(flagged):
+        return flagged
+    stats["replaced_clips"] += 1
+    return segments
+
+
+def redecode_low_confidence(segments, redecode, stats=None, max_clip_seconds=MAX_REDECODE_SECONDS):
+    """
+    Passes greedy segments through, replacing runs of low-confidence segments with their
+    beam search re-decode.
+
+    Args:
+        segments (iterable): Greedy Whisper segments in time order.
+        redecode (callable): redecode(start, end, prompt) returns the beam search segments of
+            that span of the timeline, decoded with `prompt` (the preceding text) as context.
+        stats (dict): Counters updated as segments pass: segments, seconds (greedy segments and
+            their duration), flagged_segments, flagged_seconds, redecoded_clips and replaced_clips.
+        max_clip_seconds (float): Longest span re-decoded at once.
+
+    Yields:
+        Segments in time order.
+    """
+    stats = {} if stats is None else stats
+    for key in ("segments", "seconds", "flagged_segments", "flagged_seconds", "redecoded_clips", "replaced_clips"):
+        stats.setdefault(key, 0)
+    flagged = []
+    prompt = None
+    for segment in segments:
+        stats["segments"] += 1
+        stats["seconds"] += segment.end - segment.start
+        if is_low_confidence(segment):
+            if flagged and segment.end - flagged[0].start > max_clip_seconds:
+                for redecoded in redecode_clip(flagged, redecode, prompt, stats):
+                    prompt = redecoded.text
+                    yield redecoded
+                flagged = []
+            flagged.append(segment)
+            continue
+        if flagged:
+            for redecoded in redecode_clip(flagged, redecode, prompt, stats):
+                prompt = redecoded.text
+                yield redecoded
+            flagged = []
+        prompt = segment.text
+        yield segment
+    if flagged:
+        yield from redecode_clip(flagged, redecode, prompt, stats)
+
+
+def format_two_pass_stats(stats):
+    """One line on how much of a transcription was re-decoded."""
+    segment_fraction = stats["flagged_segments"] / stats["segments"] if stats["segments"] else 0.0
+    seconds_fraction = stats["flagged_seconds"] / stats["seconds"] if stats["seconds"] else 0.0
+    return (f"Two-pass decoding re-decoded {stats['flagged_segments']} of {stats['segments']} segments ({segment_fraction:.1%}, "
+            f"{seconds_fraction:.1%} of the decoded time) in {stats['redecoded_clips']} clips; "
+            f"beam search replaced {stats['replaced_clips']} of them.")
@@ -0,0 +1,387 @@
+"""
+Whisper inference backend.
+
+Picks the device and compute type the Whisper model runs with. "auto" uses CUDA when
+CTranslate2 sees a GPU and falls back to the CPU profile when there is none or the GPU
+model fails to load (missing cuDNN/cuBLAS libraries, out of memory). On CPU the model is
+int8-quantized by default, which is several times faster than float32 for the same model.
+
+Everything is configurable through the environment (or a .env file), read when it is used:
+    WHISPER_MODEL           Model name or path (default distil-large-v3)
+    WHISPER_DEVICE          auto, cuda or cpu (default auto)
+    WHISPER_COMPUTE_TYPE    Overrides the compute type of the requested device, e.g. int8, float16;
+                            the CPU fallback of "auto" keeps its own
+    WHISPER_CUDA_COMPUTE_TYPE, WHISPER_CPU_COMPUTE_TYPE
+                            Override the compute type of one device only
+    WHISPER_CPU_THREADS     Threads per CPU model (default: all cores)
+    WHISPER_NUM_WORKERS     Concurrent transcriptions the model may run (default 1)
+    WHISPER_BATCH_SIZE      Windows decoded per batch; 0 decodes one window at a time (default 0)
+    CUDA_BIN_PATH           Windows only: folder with the cuDNN/cuBLAS DLLs to preload
+
+Voice-activity gating runs before decoding: speech regions are detected with Silero VAD and
+only those spans are decoded, so BGM, "starting soon" screens and AFK breaks cost nothing.
+VAD settings can be tuned per channel in a JSON file (see load_vad_settings).
+"""
+import ctypes
+import dataclasses
+import json
+import os
+import sys
+import threading
+
+import ctranslate2
+import numpy as np
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
+from faster_whisper.vad import VadOptions, get_speech_timestamps, merge_segments
+
+DEFAULT_WHISPER_MODEL = "distil-large-v3"
+
+SAMPLING_RATE = 16000
+CHUNK_SECONDS = 30  # Whisper's window; batched chunks never exceed it
+CLIP_PADDING_SECONDS = 1.0  # Context kept around the audio passed to transcribe_clips
+
+# Defaults per device; the environment overrides any of them
+INFERENCE_PROFILES = {
+    "cuda": {"compute_type": "float32", "cpu_threads": 0, "num_workers": 1},
+    "cpu": {"compute_type": "int8", "cpu_threads": os.cpu_count() or 0, "num_workers": 1},
+}
+
+# Silero VAD settings used unless a channel overrides them; "enabled": False decodes everything
+DEFAULT_VAD_SETTINGS = {
+    "enabled": True,
+    "threshold": 0.5,
+    "min_speech_duration_ms": 250,
+    "min_silence_duration_ms": 2000,
+    "speech_pad_ms": 400,
+}
+
+DEFAULT_CUDA_BIN_PATH = r"C:\Program Files\NVIDIA GPU Computing Toolkit\CUDA\v12.6\bin"
+REQUIRED_CUDA_DLLS = [
+    "cudnn_ops64_9.dll",
+    "cudnn_ops_infer64_9.dll",
+    "cudnn_cnn64_9.dll",
+    "cublas64_12.dll",
+    "cudnn_engines_precompiled64_9.dll",
+    "cudnn_engines_runtime_compiled64_9.dll",
+    "cudnn_heuristic64_9.dll",
+]
+
+
+def load_dll(dll_path):
+    """Helper function to load a DLL."""
+    try:
+        print(f"Loading DLL: {dll_path}")
+        ctypes.WinDLL(dll_path)
+        print(f"Successfully loaded DLL: {dll_path}")
+    except OSError as e:
+        print(f"Failed to load DLL: {dll_path}")
+        raise RuntimeError(f"Failed to load {dll_path}: {e}")
+
+
+def preload_cudnn_dlls(cuda_bin_path):
+    """Preload all required cuDNN DLLs."""
+    print(f"Preloading cuDNN DLLs from: {cuda_bin_path}")
+    for dll in REQUIRED_CUDA_DLLS:
+        dll_path = os.path.join(cuda_bin_path, dll)
+        if not os.path.exists(dll_path):
+            print(f"Error: {dll} not found in {cuda_bin_path}.")
+            raise FileNotFoundError(f"{dll} not found in {cuda_bin_path}. Please verify the installation.")
+        print(f"Found DLL: {dll_path}")
+        load_dll(dll_path)
+
+
+def cuda_available():
+    """True if CTranslate2 can see at least one CUDA device."""
+    try:
+        return ctranslate2.get_cuda_device_count() > 0
+    except Exception:
+        return False
+
+
+def get_model_name():
+    """The Whisper model to load (WHISPER_MODEL)."""
+    return os.getenv("WHISPER_MODEL", DEFAULT_WHISPER_MODEL)
+
+
+def get_batch_size():
+    """Windows decoded per batch (WHISPER_BATCH_SIZE); 0 decodes one window at a time."""
+    return int(os.getenv("WHISPER_BATCH_SIZE", 0))
+
+
+def get_inference_profile(device=None, fallback=False):
+    """
+    Resolves the settings for a device, applying the environment overrides.
+
+    Args:
+        device (str): "cuda" or "cpu". "auto" or None resolves to CUDA if a GPU is visible.
+        fallback (bool): The profile replaces one that failed to load, so WHISPER_COMPUTE_TYPE
+            (meant for the requested device) does not apply; the per-device override still does.
+
+    Returns:
+        dict: device, compute_type, cpu_threads and num_workers.
+    """
+    device = device or os.getenv("WHISPER_DEVICE", "auto")
+    if device == "auto":
+        device = "cuda" if cuda_available() else "cpu"
+    if device not in INFERENCE_PROFILES:
+        raise ValueError(f"Unknown Whisper device {device!r}; expected auto, cuda or cpu.")
+
+    profile = dict(INFERENCE_PROFILES[device], device=device)
+    if not fallback:
+        profile["compute_type"] = os.getenv("WHISPER_COMPUTE_TYPE", profile["compute_type"])
+    profile["compute_type"] = os.getenv(f"WHISPER_{device.upper()}_COMPUTE_TYPE", profile["compute_type"])
+    profile["cpu_threads"] = int(os.getenv("WHISPER_CPU_THREADS", profile["cpu_threads"]))
+    profile["num_workers"] = int(os.getenv("WHISPER_NUM_WORKERS", profile["num_workers"]))
+    return profile
+
+
+def load_whisper_model(profile, model_name=None):
+    """Loads a Whisper model with an inference profile; model_name defaults to WHISPER_MODEL."""
+    model_name = model_name or get_model_name()
+    if profile["device"] == "cuda" and sys.platform == "win32":
+        preload_cudnn_dlls(os.getenv("CUDA_BIN_PATH", DEFAULT_CUDA_BIN_PATH))  # Preload cuDNN DLLs for CUDA support
+    print(f"Loading Whisper model {model_name} on {profile['device']} ({profile['compute_type']}, "
+          f"{profile['cpu_threads']} CPU threads, {profile['num_workers']} workers)...")
+    return WhisperModel(
+        model_name,
+        device=profile["device"],
+        compute_type=profile["compute_type"],
+        cpu_threads=profile["cpu_threads"],
+        num_workers=profile["num_workers"],
+    )
+
+
+# Singleton Whisper model instance and the profile it was loaded with
+_model_instance = None
+_model_profile = None
+_batched_pipeline = None
+_model_lock = threading.Lock()
+
+
+def get_whisper_model(device=None):
+    """
+    Returns the shared Whisper model, loading it on first use.
+
+    With device "auto" (the default), a model that fails to load on CUDA is loaded with the
+    CPU profile instead.
+    """
+    global _model_instance, _model_profile
+    with _model_lock:
+        if _model_instance is None:
+            print("Initializing Whisper model...")
+            requested = device or os.getenv("WHISPER_DEVICE", "auto")
+            profile = get_inference_profile(requested)
+            try:
+                _model_instance = load_whisper_model(profile)
+            except (RuntimeError, OSError, ValueError) as e:
+                if requested != "auto" or profile["device"] != "cuda":
+                    raise
+                print(f"Could not load the Whisper model on CUDA ({e}); falling back to CPU.")
+                profile = get_inference_profile("cpu", fallback=True)
+                _model_instance = load_whisper_model(profile)
+            _model_profile = profile
+    return _model_instance
+
+
+def get_model_profile():
+    """The inference profile of the loaded model, or None before it is loaded."""
+    return _model_profile
+
+
+def get_batched_pipeline(device=None):
+    """Returns the shared batched inference pipeline around the Whisper model."""
+    global _batched_pipeline
+    model = get_whisper_model(device)
+    with _model_lock:
+        if _batched_pipeline is None:
+            _batched_pipeline = BatchedInferencePipeline(model=model)
+    return _batched_pipeline
+
+
+def load_vad_settings(settings_path, channel_name=None):
+    """
+    Resolves the VAD settings for a channel.
+
+    The settings file is optional and looks like
+    {"default": {"threshold": 0.5}, "channels": {"some_channel": {"min_silence_duration_ms": 500}}};
+    channel settings override the file's defaults, which override DEFAULT_VAD_SETTINGS.
+    """
+    settings = dict(DEFAULT_VAD_SETTINGS)
+    if settings_path and os.path.exists(settings_path):
+        with open(settings_path, "r", encoding="utf-8") as file:
+            overrides = json.load(file)
+        settings.update(overrides.get("default", {}))
+        settings.update(overrides.get("channels", {}).get(channel_name, {}))
+    return settings
+
+
+def get_vad_options(vad_settings, max_speech_seconds=float("inf")):
+    options = {key: value for key, value in vad_settings.items() if key != "enabled"}
+    return VadOptions(max_speech_duration_s=max_speech_seconds, **options)
+
+
+def get_speech_regions(audio, vad_settings=None):
+    """
+    Finds the speech in decoded audio.
+
+    Returns:
+        list: (start, end) pairs in seconds, in time order. The whole file is one region when
+        VAD is disabled.
+    """
+    vad_settings = vad_settings or DEFAULT_VAD_SETTINGS
+    if not vad_settings.get("enabled", True):
+        return [(0.0, len(audio) / SAMPLING_RATE)] if len(audio) else []
+    return [
+        (region["start"] / SAMPLING_RATE, region["end"] / SAMPLING_RATE)
+        for region in get_speech_timestamps(audio, get_vad_options(vad_settings))
+    ]
+
+
+def get_speech_chunks(audio, vad_settings=None):
+    """
+    Splits decoded audio into chunks of up to 30 seconds at pauses in speech, leaving out
+    everything VAD does not consider speech.
+
+    Returns:
+        list: Dictionaries with "start" and "end" in samples.
+    """
+    vad_settings = vad_settings or DEFAULT_VAD_SETTINGS
+    if not vad_settings.get("enabled", True):
+        step = CHUNK_SECONDS * SAMPLING_RATE
+        return [{"start": start, "end": min(start + step, len(audio))} for start in range(0, len(audio), step)]
+    options = get_vad_options(vad_settings, max_speech_seconds=CHUNK_SECONDS)
+    return merge_segments(get_speech_timestamps(audio, options), options)
+
+
+def merge_speech_regions(speech_regions, max_seconds=CHUNK_SECONDS):
+    """
+    Merges neighbouring speech regions into clips of up to `max_seconds`, pauses included.
+
+    WhisperModel.transcribe decodes every clip in windows of its own, padded to 30 seconds, so
+    a stream of short utterances would otherwise cost a whole window each. Longer regions are
+    kept as they are.
+
+    Returns:
+        list: (start, end) pairs in seconds, in time order.
+    """
+    merged = []
+    for start, end in speech_regions:
+        if merged and end - merged[-1][0] <= max_seconds:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def replace_segment(segment, **fields):
+    """Returns a copy of a faster-whisper segment with some fields replaced."""
+    if dataclasses.is_dataclass(segment):
+        return dataclasses.replace(segment, **fields)
+    return segment._replace(**fields)
+
+
+def shift_segment(segment, offset):
+    """Returns a copy of a segment (and its word timings, if any) moved by `offset` seconds."""
+    fields = {"start": segment.start + offset, "end": segment.end + offset}
+    if getattr(segment, "words", None):
+        fields["words"] = [replace_segment(word, start=word.start + offset, end=word.end + offset) for word in segment.words]
+    return replace_segment(segment, **fields)
+
+
+def transcribe_clips(model, audio, clip_timestamps, padding_seconds=CLIP_PADDING_SECONDS, **transcribe_options):
+    """
+    Decodes the clip timestamps of decoded audio, passing the model only the audio they span.
+
+    WhisperModel.transcribe computes the features of all the audio it is given before it looks
+    at the clip timestamps, so decoding a few seconds of a long VOD would otherwise cost the
+    features of the whole VOD.
+
+    Args:
+        model (WhisperModel): The model to decode with.
+        audio (np.ndarray): The audio at SAMPLING_RATE.
+        clip_timestamps (list): Flat [start, end, ...] list of the spans to decode, in seconds.
+        padding_seconds (float): Audio kept before the first and after the last span.
+        **transcribe_options: Passed on to WhisperModel.transcribe.
+
+    Returns:
+        tuple: (generator of segments on the audio's timeline, info)
+    """
+    offset = max(clip_timestamps[0] - padding_seconds, 0.0)
+    end = clip_timestamps[-1] + padding_seconds
+    segments, info = model.transcribe(audio[int(offset * SAMPLING_RATE):int(end * SAMPLING_RATE) + 1],
+                                      clip_timestamps=[timestamp - offset for timestamp in clip_timestamps],
+                                      **transcribe_options)
+    return (shift_segment(segment, offset) for segment in segments), info
+
+
+def transcribe_batched(audio_files, batch_size=None, device=None, vad_settings=None, **transcribe_options):
+    """
+    Transcribes one or more audio files with a single batched pipeline call.
+
+    Every file is split into speech chunks on its own, the decoded audio of all files is
+    concatenated, and the chunks are passed as clip timestamps, so batches are filled with
+    windows from several files at once and no chunk ever spans two files. The segments are
+    then split back per file and moved to each file's own timeline.
+
+    Args:
+        audio_files (list): Paths of the audio files.
+        batch_size (int): Windows decoded per batch; defaults to WHISPER_BATCH_SIZE (or 16 if unset).
+        device (str): Device to load the model on if it is not loaded yet.
+        vad_settings (list): VAD settings per file; None uses DEFAULT_VAD_SETTINGS for all.
+        **transcribe_options: Passed on to the pipeline (e.g. beam_size).
+
+    Returns:
+        tuple: (list of (segments, duration, decoded speech seconds) per file, the
+        TranscriptionInfo, or None if no file contained any speech)
+    """
+    pipeline = get_batched_pipeline(device)
+    batch_size = batch_size or get_batch_size() or 16
+    transcribe_options.setdefault("language", "en")
+    transcribe_options.setdefault("beam_size", 5)
+
+    vad_settings = vad_settings or [None] * len(audio_files)
+
+    audios = []
+    file_offsets = []
+    speech_seconds = []
+    clip_timestamps = []
+    position = 0
+    for audio_file, file_vad_settings in zip(audio_files, vad_settings):
+        audio = decode_audio(audio_file, sampling_rate=SAMPLING_RATE)
+        file_offsets.append(position / SAMPLING_RATE)
+        chunks = get_speech_chunks(audio, file_vad_settings)
+        for chunk in chunks:
+            clip_timestamps.append({
+                "start": (position + chunk["start"]) / SAMPLING_RATE,
+                "end": (position + chunk["end"]) / SAMPLING_RATE,
+            })
+        speech_seconds.append(sum(chunk["end"] - chunk["start"] for chunk in chunks) / SAMPLING_RATE)
+        position += len(audio)
+        audios.append(audio)
+    durations = [len(audio) / SAMPLING_RATE for audio in audios]
+
+    if not clip_timestamps:
+        return [([], duration, 0.0) for duration in durations], None  # Nothing but silence
+
+    if len(audios) == 1:
+        combined = audios.pop()
+    else:
+        # Each file is released as soon as it is copied, so the peak is the combined audio plus one
+        # file rather than twice the combined audio (np.empty only commits pages as they are written)
+        combined = np.empty(position, dtype=np.float32)
+        start = 0
+        for index in range(len(audios)):
+            audio, audios[index] = audios[index], None
+            combined[start:start + len(audio)] = audio
+            start += len(audio)
+    del audios, audio
+    segments, info = pipeline.transcribe(
+        combined, batch_size=batch_size, vad_filter=False, clip_timestamps=clip_timestamps, **transcribe_options
+    )
+
+    per_file = [[] for _ in audio_files]
+    file_starts = np.asarray(file_offsets)
+    for segment in segments:
+        index = int(np.searchsorted(file_starts, segment.start, side="right")) - 1
+        per_file[index].append(shift_segment(segment, -float(file_starts[index])))
+    return list(zip(per_file, durations, speech_seconds)), info